@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""Measure the accuracy and throughput of the OCR decoders over the regression corpus."""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from forestplots import Controller, corpus # pylint: disable=wrong-import-position
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--corpus", default=corpus.CORPUS_DIRECTORY, help="corpus directory to use")
+    parser.add_argument("--time", type=float, default=0.5, help="minimum seconds to spend timing each decoder")
+    parser.add_argument("--failures", action="store_true", help="list the cases that fail")
+    parser.add_argument("--harvest", metavar="PROJECT_DIRECTORY",
+                        help="instead of benchmarking, write corpus cases for the OCR text in a processed project to "
+                             "stdout, for checking by hand")
+    args = parser.parse_args()
+
+    if args.harvest:
+        controller = Controller(args.harvest)
+        image_directories = []
+        for ctree in controller.ctrees():
+            try:
+                image_directories.extend(controller.image_directories(ctree))
+            except FileNotFoundError:
+                continue
+        json.dump(corpus.harvest(image_directories), sys.stdout, indent=4, ensure_ascii=False)
+        return
+
+    cases = corpus.load_corpus(args.corpus)
+    scores, failures = corpus.evaluate(cases)
+    throughput = corpus.benchmark(cases, args.time)
+
+    print(f"{'decoder':<48} {'cases':>6} {'accuracy':>9} {'strings/sec':>12}")
+    for name, (correct, total) in scores.items():
+        print(f"{name:<48} {total:>6} {correct / total:>9.1%} {throughput[name]:>12.0f}")
+
+    if args.failures:
+        for case, actual in failures:
+            print(f"\n{case['decoder']}: {case['name']}")
+            if "xfail" in case:
+                print(f"  known failure: {case['xfail']}")
+            print(f"  expected: {case.get('expected', case.get('raises'))}")
+            print(f"  actual:   {actual}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Compare the rate at which small crops are OCRed by running tesseract once per crop and by stacking them into
+sheets, using synthetic header and scale crops drawn with text. Also reports how often the two give the same text.
+
+Needs tesseract and ImageMagick's convert, and does nothing if they aren't installed."""
+
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from forestplots import montage # pylint: disable=wrong-import-position
+
+TEXTS = [
+    "Odds Ratio", "M-H, Fixed, 95% CI", "IV, Random, 95% CI", "Mean Difference", "Risk Ratio",
+    "0.01 0.1 1 10 100", "-10 -5 0 5 10", "Favours [experimental] Favours [control]",
+]
+
+
+def draw_crop(path, generator):
+    """Draw a small crop with a line or two of text, like the header or scale of a plot."""
+    lines = generator.sample(TEXTS, generator.randint(1, 2))
+    image = np.full((40 * len(lines) + 20, 700), 255, np.uint8)
+    for index, text in enumerate(lines):
+        cv2.putText(image, text, (10, 40 * index + 40), cv2.FONT_HERSHEY_SIMPLEX, 0.9, generator.randint(0, 120), 2)
+    cv2.imwrite(path, image)
+
+
+def make_crops(directory, plots, thresholds, seed):
+    """Make the crops for a number of plots, returning the montage Crops for each threshold."""
+    generator = random.Random(seed)
+    crops = []
+    for index in range(plots):
+        image_directory = os.path.join(directory, f"plot{index}")
+        os.makedirs(image_directory)
+        for region in ("header", "scale"):
+            draw_crop(os.path.join(image_directory, f"raw.{region}.png"), generator)
+        crops.extend(montage.pending_crops(image_directory, ("header", "scale"), thresholds))
+    return crops
+
+
+def ocr_one_at_a_time(crops):
+    """OCR each crop with its own convert and tesseract calls, as the plots do."""
+    for crop in crops:
+        output_base = os.path.join(crop.image_directory, f"{crop.region}.{crop.threshold}")
+        subprocess.run(["convert", "-black-threshold", f"{crop.threshold}%",
+                        os.path.join(crop.image_directory, f"raw.{crop.region}.png"), f"{output_base}.png"],
+                       capture_output=True, check=True)
+        subprocess.run(["tesseract", f"{output_base}.png", output_base, "txt", "tsv"], capture_output=True,
+                       check=True)
+
+
+def read_texts(crops):
+    """Get the OCR text of each crop, normalised to its words, or None if it wasn't OCRed."""
+    texts = []
+    for crop in crops:
+        try:
+            with open(os.path.join(crop.image_directory, f"{crop.region}.{crop.threshold}.txt")) as ocr_file:
+                texts.append(" ".join(ocr_file.read().split()))
+        except FileNotFoundError:
+            texts.append(None)
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--plots", type=int, default=20, help="number of plots, each having two crops")
+    parser.add_argument("--thresholds", type=int, nargs="+", default=[50, 60, 70],
+                        help="black thresholds to OCR each crop at")
+    args = parser.parse_args()
+
+    if shutil.which("tesseract") is None or shutil.which("convert") is None:
+        print("tesseract and convert are needed to compare montage OCR, skipping")
+        return
+
+    with tempfile.TemporaryDirectory() as single_directory, tempfile.TemporaryDirectory() as montage_directory:
+        single_crops = make_crops(single_directory, args.plots, args.thresholds, 0)
+        montage_crops = make_crops(montage_directory, args.plots, args.thresholds, 0)
+
+        start = time.perf_counter()
+        ocr_one_at_a_time(single_crops)
+        single_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        done = montage.ocr_crops(montage_crops)
+        montage_time = time.perf_counter() - start
+
+        same = sum(a == b for a, b in zip(read_texts(single_crops), read_texts(montage_crops)))
+
+    count = len(single_crops)
+    print(f"{count} crops")
+    print(f"one call per crop: {count / single_time:8.1f} crops/sec")
+    print(f"montage:           {done / montage_time:8.1f} crops/sec ({single_time / montage_time:.1f}x)")
+    print(f"same text:         {same / count:8.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Compare the speed and results of finding a plot's axes in large images with and without the coarse to fine
+pyramid, using synthetic plots drawn at several sizes."""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from forestplots import skeleton # pylint: disable=wrong-import-position
+
+
+def draw_plot(path, width, height, spss, seed):
+    """Draw a forest plot like image, with axes in the same places as a real SPSS or Stata plot and some text to
+    give the edge detector something else to find."""
+    generator = random.Random(seed)
+    image = np.full((height, width), 255, np.uint8)
+    thickness = max(1, width // 600)
+    scale = width / 1600
+
+    axis = int(width * (0.65 if spss else 0.5))
+    text_right = int(width * (0.6 if spss else 0.35))
+    for row in range(int(height * 0.15), int(height * 0.8), max(1, int(height * 0.04))):
+        text = "".join(generator.choice("abcdefghij 0123456789.,[]") for _ in range(generator.randint(10, 30)))
+        left = generator.randint(int(width * 0.01), int(width * 0.05))
+        cv2.putText(image, text, (left, row), cv2.FONT_HERSHEY_SIMPLEX, scale, 0, thickness)
+        values = f"{generator.random():.2f} [{generator.random():.2f}, {generator.random():.2f}]"
+        cv2.putText(image, values, (int(width * 0.78), row), cv2.FONT_HERSHEY_SIMPLEX, scale, 0, thickness)
+        size = max(2, int(height * 0.005))
+        centre = generator.randint(text_right, int(width * 0.75))
+        cv2.rectangle(image, (centre - size, row - size), (centre + size, row + size), 0, -1)
+
+    if spss:
+        cv2.line(image, (axis, int(height * 0.1)), (axis, int(height * 0.9)), 0, thickness)
+        cv2.line(image, (0, int(height * 0.12)), (width - 1, int(height * 0.12)), 0, thickness)
+        cv2.line(image, (int(width * 0.4), int(height * 0.88)), (int(width * 0.9), int(height * 0.88)), 0, thickness)
+    else:
+        cv2.line(image, (axis, int(height * 0.05)), (axis, int(height * 0.86)), 0, thickness)
+        cv2.line(image, (int(width * 0.6), int(height * 0.05)), (int(width * 0.6), int(height * 0.86)), 0, thickness)
+        cv2.line(image, (int(width * 0.03), int(height * 0.85)), (int(width * 0.97), int(height * 0.85)), 0,
+                 thickness)
+    cv2.imwrite(path, image)
+
+
+def detect(image_directory, pyramid):
+    """Time finding the lines in an image, with or without the pyramid."""
+    original = skeleton.PYRAMID_SIZE
+    if not pyramid:
+        skeleton.PYRAMID_SIZE = float("inf")
+    try:
+        start = time.perf_counter()
+        result = skeleton.Skeleton(image_directory)
+        return result, time.perf_counter() - start
+    finally:
+        skeleton.PYRAMID_SIZE = original
+
+
+def same_verdicts(first, second):
+    """Check two Skeletons agree on the type of plot."""
+    return first.likely_spss() == second.likely_spss() and first.likely_stata() == second.likely_stata()
+
+
+def same_lines(first, second, tolerance):
+    """Check two Skeletons found the same lines, give or take the tolerance in pixels."""
+    for first_lines, second_lines in ((first.vertical_lines, second.vertical_lines),
+                                      (first.horizontal_lines, second.horizontal_lines)):
+        if len(first_lines) != len(second_lines):
+            return False
+        for first_line, second_line in zip(first_lines, second_lines):
+            if any(abs(int(a) - int(b)) > tolerance for a, b in zip(first_line, second_line)):
+                return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2400, 4000, 6000],
+                        help="widths of the images to try, the heights being half of these")
+    parser.add_argument("--count", type=int, default=4, help="number of images of each size")
+    parser.add_argument("--tolerance", type=int, default=4,
+                        help="how many pixels apart lines can be and still count as agreeing")
+    args = parser.parse_args()
+
+    print(f"{'size':>11} {'full ms':>9} {'pyramid ms':>11} {'speedup':>8} {'full right':>11} "
+          f"{'pyramid right':>14} {'same type':>10} {'same lines':>11}")
+    with tempfile.TemporaryDirectory() as temp_directory:
+        for width in args.sizes:
+            height = width // 2
+            full_time = pyramid_time = 0.0
+            verdicts_agreed = lines_agreed = full_right = pyramid_right = 0
+            for index in range(args.count):
+                image_directory = os.path.join(temp_directory, f"image.{width}.{index}_0_{width}_{height}")
+                os.makedirs(image_directory)
+                spss = index % 2 == 0
+                draw_plot(os.path.join(image_directory, "raw.png"), width, height, spss, index)
+
+                full, elapsed = detect(image_directory, pyramid=False)
+                full_time += elapsed
+                pyramid, elapsed = detect(image_directory, pyramid=True)
+                pyramid_time += elapsed
+                full_right += (full.likely_spss(), full.likely_stata()) == (spss, not spss)
+                pyramid_right += (pyramid.likely_spss(), pyramid.likely_stata()) == (spss, not spss)
+                verdicts_agreed += same_verdicts(full, pyramid)
+                lines_agreed += same_lines(full, pyramid, args.tolerance)
+
+            print(f"{width:>5}x{height:<5} {full_time * 1000 / args.count:>9.1f} "
+                  f"{pyramid_time * 1000 / args.count:>11.1f} {full_time / pyramid_time:>7.1f}x "
+                  f"{full_right / args.count:>11.0%} {pyramid_right / args.count:>14.0%} "
+                  f"{verdicts_agreed / args.count:>10.0%} {lines_agreed / args.count:>11.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Time how long the command line takes to start for commands that don't look at any images, and check that
+starting them doesn't load OpenCV, numpy or openpyxl, which take most of a second to import.
+
+Each command is run in a new Python with -X importtime, and the time to import the heaviest modules is reported
+along with the wall clock time. Exits with an error if any of the commands loads one of the heavy modules."""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SCRIPT = os.path.join(ROOT, "forestplots.py")
+
+HEAVY_MODULES = ("cv2", "numpy", "openpyxl")
+
+
+def commands(project_directory):
+    """The commands to time, as names and the Python arguments that run them."""
+    return [
+        ("import forestplots", ["-c", "import forestplots"]),
+        ("import forestplots.controller", ["-c", "import forestplots.controller"]),
+        ("forestplots.py --help", [SCRIPT, "--help"]),
+        ("forestplots.py status", [SCRIPT, "status", project_directory]),
+        ("forestplots.py thresholds", [SCRIPT, "thresholds", project_directory]),
+        ("eager cv2 and openpyxl", ["-c", "import cv2, openpyxl"]),
+    ]
+
+
+def import_times(stderr):
+    """Get the cumulative import time in microseconds of each top level module from -X importtime output."""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  ") and cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def run(arguments, repeat):
+    """Run a command a number of times, returning the median wall clock time and the modules it imported."""
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-X", "importtime"] + arguments, cwd=ROOT, capture_output=True,
+                                text=True, check=True)
+        elapsed.append(time.perf_counter() - start)
+    return statistics.median(elapsed), import_times(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5, help="number of times to run each command")
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as project_directory:
+        print(f"{'command':<32} {'wall':>10} {'imports':>10}  heavy modules")
+        for name, arguments in commands(project_directory):
+            elapsed, times = run(arguments, args.repeat)
+            heavy = [x for x in HEAVY_MODULES if x in times]
+            total = sum(times.values()) / 1000
+            print(f"{name:<32} {elapsed * 1000:>7.0f} ms {total:>7.0f} ms  {', '.join(heavy) or '-'}")
+            if heavy and not name.startswith("eager"):
+                failures.append(f"{name} imports {', '.join(heavy)}")
+
+    for message in failures:
+        print(message, file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
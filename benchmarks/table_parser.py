@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Time the table parsers on random OCR-like lines of increasing length, to check the time grows linearly.
+
+Exits with an error if the time per character of the new parsers on the longest lines is more than double that on
+lines of a thousand characters."""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from forestplots import tableparser # pylint: disable=wrong-import-position
+
+# The line regular expression the parser replaced, for comparison
+OLD_LINE_PARSE_RE = re.compile(r'^(.*?)\s+(\d+)\s+(\d+)\s+.*\s+([-—~]{0,1}\d+[.,:]\d*)\s*[/\[\({]([-—~]{0,1}\d+[.,:]\d*)\s*,\s*([-—~]{0,1}\d+[.,:]\d*)[\]}\)]\s*$')
+
+FRAGMENTS = ["1", "23", " ", " ", " ", "4.5", "-0,6", "(", "[", ", ", "]", "%", "Study"]
+
+PARSERS = [
+    ("parse_table_line", tableparser.parse_table_line),
+    ("find_table_values", lambda line: list(tableparser.find_table_values(line))),
+    ("old line regex", OLD_LINE_PARSE_RE.match),
+]
+
+
+def make_lines(length, count, seed):
+    """Make random lines that nearly parse, half of them being runs of small numbers, which is the worst case for
+    the old regex."""
+    generator = random.Random(seed)
+    lines = []
+    for i in range(count):
+        line = "a 1 1 "
+        while len(line) < length:
+            line += generator.choice(FRAGMENTS) if i % 2 else "1 "
+        lines.append(line + " 1.0 [0.5, 2.0] x")
+    return lines
+
+
+def time_parser(parser, lines, repeats=3):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for line in lines:
+            parser(line)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=20, help="number of lines of each length")
+    parser.add_argument("--max-length", type=int, default=32000, help="longest line to try")
+    parser.add_argument("--old-max-length", type=int, default=4000, help="longest line to try the old regex on")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # Let the parsers see the long lines rather than skipping them
+    tableparser.MAX_LINE_LENGTH = args.max_length * 2
+
+    lengths = []
+    length = 250
+    while length <= args.max_length:
+        lengths.append(length)
+        length *= 2
+
+    print(f"{'length':>8} " + " ".join(f"{name:>18}" for name, _ in PARSERS))
+    per_character = {}
+    for length in lengths:
+        lines = make_lines(length, args.count, args.seed)
+        row = []
+        for name, function in PARSERS:
+            if name.startswith("old") and length > args.old_max_length:
+                row.append(f"{'-':>18}")
+                continue
+            elapsed = time_parser(function, lines)
+            row.append(f"{elapsed * 1000 / args.count:>15.3f} ms")
+            per_character.setdefault(name, {})[length] = elapsed / length
+        print(f"{length:>8} " + " ".join(row))
+
+    super_linear = []
+    for name, _ in PARSERS:
+        if name.startswith("old") or 1000 not in per_character[name]:
+            continue
+        growth = per_character[name][lengths[-1]] / per_character[name][1000]
+        if growth > 2:
+            super_linear.append(f"{name} takes {growth:.1f}x longer per character at length {lengths[-1]}")
+    for message in super_linear:
+        print(message, file=sys.stderr)
+    if super_linear:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,207 @@
 #!/usr/bin/env python3
 
+import argparse
 import os
 import sys
 
+# The package only loads OpenCV, numpy and openpyxl when a command needs them, so --help and status start quickly
 import forestplots
+from forestplots import progress
 
-if __name__ == "__main__":
+COMMANDS = ("run", "replay", "triage", "coordinate", "work", "merge", "stages", "status", "thresholds", "serve")
 
-    if len(sys.argv) != 2:
-        print("USAGE: {0} PROJECT_DIRECTORY".format(sys.argv[0]))
-        sys.exit(-1)
+STAGE_HELP = "makeproject, pdf, filter, classify, dedupe, crop, ocr, results"
+
+
+def add_project_directory(parser):
+    parser.add_argument("project_directory", metavar="PROJECT_DIRECTORY")
+
+
+def add_processes(parser, what):
+    parser.add_argument("--processes", type=int, default=None,
+                        help=f"number of images to process in parallel when {what} (default: number of CPUs)")
+
+
+def add_serve_options(parser):
+    parser.add_argument("--host", default="127.0.0.1", help="address to serve on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080, help="port to serve on (default: 8080)")
+    parser.add_argument("--socket", default=None, metavar="PATH", help="serve on this Unix socket instead of a port")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of images the service extracts at once (default: number of CPUs)")
+
+
+def command_parser():
+    """Make the parser for the command line, which gives a command and then its arguments."""
+    parser = argparse.ArgumentParser(
+        description="Extract data from forest plots in a folder of papers.",
+        epilog="The options of earlier versions, such as forestplots.py --replay PROJECT_DIRECTORY, still work.")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+
+    run = commands.add_parser("run", help="process a folder of papers from start to finish")
+    add_project_directory(run)
+    run.add_argument("--resume", action="store_true",
+                     help="carry on from where an earlier run that didn't finish got to")
+
+    replay = commands.add_parser(
+        "replay", help="only rerun decoding and results generation from the OCR text of a previous run")
+    add_project_directory(replay)
+    add_processes(replay, "replaying")
+
+    triage = commands.add_parser(
+        "triage", help="only extract and classify the images, listing the candidate plots without running OCR")
+    add_project_directory(triage)
+    add_processes(triage, "triaging")
+
+    add_project_directory(commands.add_parser(
+        "coordinate", help="extract the images and queue them up to be processed by workers"))
+    add_project_directory(commands.add_parser(
+        "work", help="process images queued by the coordinator, alongside any other workers"))
+    add_project_directory(commands.add_parser(
+        "merge", help="generate the results once the workers have processed all the queued images"))
+
+    stages = commands.add_parser(
+        "stages", help="only run the out of date work of some stages, assuming the stages before them are done")
+    add_project_directory(stages)
+    stages.add_argument("stages", nargs="+", metavar="STAGE", help=f"stages to run, or all ({STAGE_HELP})")
+
+    add_project_directory(commands.add_parser(
+        "status", help="show how far a run, and any workers, have got"))
+
+    thresholds = commands.add_parser(
+        "thresholds", help="show the order each region's thresholds are read in, learnt from earlier plots")
+    add_project_directory(thresholds)
+    thresholds.add_argument("--reset", action="store_true", help="forget what has been learnt")
+    thresholds.add_argument("--retrain", action="store_true",
+                            help="learn again from scratch from the OCR text of the plots already processed")
+    add_processes(thresholds, "retraining")
 
-    if not os.path.isdir(sys.argv[1]):
-        print("USAGE: {0} PROJECT_DIRECTORY".format(sys.argv[0]))
+    add_serve_options(commands.add_parser(
+        "serve", help="run a service that extracts plots from images sent to it over HTTP"))
+    return parser
+
+
+def legacy_parser():
+    """Make the parser for the options of earlier versions, which are given before the project directory."""
+    parser = argparse.ArgumentParser(description="Extract data from forest plots in a folder of papers.")
+    parser.add_argument("project_directory", metavar="PROJECT_DIRECTORY", nargs="?")
+    parser.add_argument("--replay", action="store_true",
+                        help="only rerun decoding and results generation from the OCR text of a previous run")
+    parser.add_argument("--resume", action="store_true",
+                        help="carry on from where an earlier run that didn't finish got to")
+    parser.add_argument("--triage", action="store_true",
+                        help="only extract and classify the images, listing the candidate plots without running OCR")
+    parser.add_argument("--coordinator", action="store_true",
+                        help="extract the images and queue them up to be processed by workers")
+    parser.add_argument("--worker", action="store_true",
+                        help="process images queued by the coordinator, alongside any other workers")
+    parser.add_argument("--merge", action="store_true",
+                        help="generate the results once the workers have processed all the queued images")
+    add_processes(parser, "replaying or triaging")
+    parser.add_argument("--stage", action="append", default=[], metavar="NAME",
+                        help="only run the out of date work of this stage, assuming the stages before it are done; "
+                             f"can be given more than once (stages: {STAGE_HELP})")
+    parser.add_argument("--stages", default=None, metavar="NAMES",
+                        help="comma separated list of stages to run as for --stage, or all to run every stage")
+    parser.add_argument("--serve", action="store_true",
+                        help="run a service that extracts plots from images sent to it over HTTP, instead of "
+                             "processing a project")
+    add_serve_options(parser)
+    return parser
+
+
+def legacy_command(args):
+    """Work out which command the options of earlier versions ask for."""
+    stages = list(args.stage)
+    if args.stages is not None:
+        stages.extend(x.strip() for x in args.stages.split(",") if x.strip())
+    args.stages = stages
+
+    if args.serve:
+        args.command = "serve"
+    elif stages:
+        args.command = "stages"
+    elif args.replay:
+        args.command = "replay"
+    elif args.triage:
+        args.command = "triage"
+    elif args.coordinator:
+        args.command = "coordinate"
+    elif args.worker:
+        args.command = "work"
+    elif args.merge:
+        args.command = "merge"
+    else:
+        args.command = "run"
+    return args
+
+
+def show_status(controller):
+    statuses = controller.statuses()
+    if not statuses:
+        print("No run has reported its progress in this folder")
+    for name, status in statuses:
+        finished = ", finished" if status.get("finished") else ""
+        print(f"{name}: {progress.status_line(status)}{finished}")
+
+
+def show_thresholds(controller):
+    from forestplots.plots import THRESHOLDS # pylint: disable=import-outside-toplevel
+    lines = controller.threshold_profile.lines(THRESHOLDS)
+    if not lines:
+        print(f"No thresholds have been learnt in {controller.threshold_profile.path}")
+    for line in lines:
+        print(line)
+
+
+def run_command(parser, args):
+    if args.command == "serve":
+        from forestplots import service # pylint: disable=import-outside-toplevel
+        service.serve(args.host, args.port, args.socket, args.workers)
+        return
+
+    if args.command is None or args.project_directory is None or not os.path.isdir(args.project_directory):
+        parser.print_usage()
         sys.exit(-1)
 
-    c = forestplots.Controller(sys.argv[1])
-    c.main()
+    c = forestplots.Controller(args.project_directory)
+    if args.command == "status":
+        show_status(c)
+    elif args.command == "thresholds":
+        if args.retrain:
+            c.train_thresholds(args.processes)
+        elif args.reset:
+            c.threshold_profile.reset()
+        show_thresholds(c)
+    elif args.command == "stages":
+        args.stages = [y.strip() for x in args.stages for y in x.split(",") if y.strip()]
+        known = [x.name for x in c.stages()] + ["all"]
+        unknown = [x for x in args.stages if x not in known]
+        if unknown:
+            parser.error(f"unknown stage {unknown[0]}, choose from {', '.join(known)}")
+        c.run_stages(None if "all" in args.stages else args.stages)
+    elif args.command == "replay":
+        c.replay(args.processes)
+    elif args.command == "triage":
+        c.triage(args.processes)
+    elif args.command == "coordinate":
+        c.coordinate()
+    elif args.command == "work":
+        c.work()
+    elif args.command == "merge":
+        c.merge()
+    else:
+        c.main(args.resume)
+
+
+def main(argv):
+    if not argv or argv[0] in COMMANDS or argv[0] in ("-h", "--help"):
+        parser = command_parser()
+        args = parser.parse_args(argv)
+    else:
+        parser = legacy_parser()
+        args = legacy_command(parser.parse_args(argv))
+    run_command(parser, args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,7 +1,31 @@
-"""Contains logic for processing forest plots using the ContentMine normami tool chain."""
+"""Contains logic for processing forest plots using the ContentMine normami tool chain.
 
-from .controller import Controller
-from .plots import ForestPlot, InvalidForestPlot
-from .spssplots import SPSSForestPlot
-from .stataplots import StataForestPlot
-from .results import Results
+The classes are imported from their modules when first used, so importing the package doesn't load OpenCV, numpy or
+openpyxl until something needs them."""
+
+import importlib
+
+# Where each of the names exported by the package is defined
+_EXPORTS = {
+    "Controller": "controller",
+    "ForestPlot": "plots",
+    "InvalidForestPlot": "plots",
+    "SPSSForestPlot": "spssplots",
+    "StataForestPlot": "stataplots",
+    "Results": "results",
+    "extract": "api",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,174 @@
+"""Extracting the data from a single forest plot image held in memory.
+
+This is for embedding the decoders in other programs, such as a web service, where there's no CProject and nothing
+should be written to disk. The image is classified and cropped in memory, each region is binarised with numpy, and
+tesseract is given the binarised image on its standard input and writes its TSV output to its standard output. Every
+call works on its own plot object, so extract can be called from many threads at once."""
+
+import subprocess
+
+import cv2
+import numpy as np
+
+from forestplots.ocr import black_threshold, parse_tsv, words_text
+from forestplots.plots import InvalidForestPlot
+from forestplots.skeleton import Skeleton
+from forestplots.spssplots import SPSSForestPlot
+from forestplots.stataplots import StataForestPlot
+
+# Plots need an image directory name to take their ID from, which in memory is just a placeholder
+IMAGE_NAME = "image.0_memory"
+
+
+class BadImage(ValueError):
+    """Raised if what we're given can't be read as an image."""
+
+
+class InMemoryPlot():
+    """Mixin that keeps a plot's image, regions and OCR results in memory rather than on disk."""
+
+    def _setup_memory(self, image):
+        self.image = image
+        self.regions = {}
+        self.ocr_results = {}
+
+    def _raw_image(self):
+        return self.image
+
+    def _save_region(self, region, image):
+        self.regions[region] = image
+
+    def _region_image_path(self, region):
+        # there's no file, but the decoders still need to know when a region is missing
+        image = self.regions.get(region)
+        if image is None or not image.size:
+            raise InvalidForestPlot
+
+    def _ocr_batch(self, region, thresholds):
+        # tesseract only reads one image from its standard input, so each threshold is OCRed as it's asked for
+        pass
+
+    def _ocr_words(self, region, threshold):
+        """Get the OCRWords for a region at a threshold, running tesseract the first time they're asked for. Returns
+        None if OCR failed or timed out."""
+        self._await_prefetch(region, [threshold])
+        return self._cached_words(region, threshold)
+
+    def _prefetch_ocr(self, region, thresholds):
+        for threshold in thresholds:
+            self._cached_words(region, threshold)
+
+    def _cached_words(self, region, threshold):
+        key = (region, threshold)
+        if key not in self.ocr_results:
+            self.ocr_results[key] = self._read_words(region, threshold)
+        return self.ocr_results[key]
+
+    def _ocr(self, region, threshold):
+        words = self._ocr_words(region, threshold)
+        return words_text(words) if words is not None else None
+
+    def _read_words(self, region, threshold):
+        """Binarise a region and run tesseract over it through pipes."""
+        self._region_image_path(region)
+        image = self.regions[region]
+        _, png = cv2.imencode(".png", black_threshold(image, threshold))
+        try:
+            result = self._run_ocr_command(["tesseract", "stdin", "stdout", "tsv"], stdin=png.tobytes())
+        except subprocess.TimeoutExpired:
+            return None
+        if result.returncode != 0:
+            return None
+        return parse_tsv(result.stdout.decode("utf-8", "replace"))
+
+
+class InMemorySPSSForestPlot(InMemoryPlot, SPSSForestPlot):
+    """An SPSS forest plot processed in memory."""
+
+    def __init__(self, image, projections):
+        super().__init__(IMAGE_NAME, projections)
+        self._setup_memory(image)
+
+
+class InMemoryStataForestPlot(InMemoryPlot, StataForestPlot):
+    """A Stata forest plot processed in memory."""
+
+    def __init__(self, image, projections):
+        super().__init__(IMAGE_NAME, projections)
+        self._setup_memory(image)
+
+
+def load_image(image):
+    """Get a greyscale image from encoded image bytes, such as the contents of a PNG or JPEG file, or from a numpy
+    array in greyscale, BGR or BGRA. Raises BadImage if it isn't an image."""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        decoded = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if decoded is None:
+            raise BadImage("Can't decode image")
+        return decoded
+
+    if not isinstance(image, np.ndarray) or image.dtype != np.uint8 or not image.size:
+        raise BadImage("Image must be bytes or a uint8 numpy array")
+    if image.ndim == 2:
+        return image
+    if image.ndim == 3 and image.shape[2] == 3:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if image.ndim == 3 and image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
+    raise BadImage(f"Unexpected image shape {image.shape}")
+
+
+def describe_table(table):
+    """Get a JSON compatible description of a Table, with the value of each cell decided by the vote between
+    thresholds."""
+    return {
+        "title": table.collapse_titles(),
+        "rows": [list(row) for row in table.collapse_data()],
+        "agreement": [[round(x, 3) for x in row] for row in table.agreement()],
+        "metadata": table.metadata,
+        "passes": table.passes,
+    }
+
+
+def describe(plot):
+    """Get a JSON compatible description of everything decoded from a plot. The last table is the plot as a whole,
+    and any before it are its subgroups."""
+    tables = [describe_table(x) for x in plot.table_list]
+    result = {
+        "plot_type": plot.PLOT_TYPE,
+        "valid": True,
+        "summary": plot.summary,
+        "heterogeneity": plot.hetrogeneity,
+        "overall_effect": plot.overall_effect,
+        "tables": tables,
+        "overall": tables[-1] if tables else None,
+        "subgroups": tables[:-1],
+    }
+    for name in ("mid_point", "group_a", "group_b"):
+        result[name] = getattr(plot, name, None)
+    return result
+
+
+def classify(image):
+    """Get an in-memory plot of the type a greyscale image looks like, or None if it doesn't look like a plot."""
+    skeleton = Skeleton(None, image=image)
+    if skeleton.likely_spss():
+        return InMemorySPSSForestPlot(image, skeleton)
+    if skeleton.likely_stata():
+        return InMemoryStataForestPlot(image, skeleton)
+    return None
+
+
+def extract(image):
+    """Extract the data from a forest plot image, given as encoded bytes or a numpy array. Returns a JSON compatible
+    dictionary, with valid false if the image isn't a plot we can read, in which case plot_type says what type it
+    looked like, if any. Raises BadImage, a ValueError, if the image can't be read."""
+    plot = classify(load_image(image))
+    if plot is None:
+        return {"plot_type": None, "valid": False}
+    try:
+        plot.break_up_image()
+        plot.process()
+    except InvalidForestPlot:
+        return {"plot_type": plot.PLOT_TYPE, "valid": False}
+    return describe(plot)
@@ -1,18 +1,30 @@
 """Module for managing the forest plot data extraction."""
 
+import collections
 import json
 import os
 import subprocess
+import time
 
-import openpyxl
+# The modules that need OpenCV are imported by the methods that use them, so that commands that don't look at the
+# images, such as merging or replaying, start quickly
 
 from forestplots.papers import Paper
-from forestplots.plots import InvalidForestPlot
+from forestplots.plots import ForestPlot, InvalidForestPlot, THRESHOLDS
 from forestplots.spssplots import SPSSForestPlot
 from forestplots.stataplots import StataForestPlot
 from forestplots.projections import Projections
-from forestplots.skeleton import Skeleton
-from forestplots.results import Results
+from forestplots.skeletoncache import SkeletonCache, CACHE_FILENAME
+from forestplots import dedupe
+from forestplots import ingest
+from forestplots import probe
+from forestplots import progress
+from forestplots import replay
+from forestplots import thresholds
+from forestplots import triage
+from forestplots.journal import Journal, JOURNAL_FILENAME
+from forestplots.workqueue import WorkQueue, run_worker, worker_name, PENDING, LEASED, FAILED
+from forestplots.pipeline import Pipeline, Stage
 
 USE_DOCKER = True
 try:
@@ -20,15 +32,41 @@ try:
 except KeyError:
     pass
 
+# Whether to OCR the small regions of all the plots together in batches before processing them
+USE_MONTAGE = False
+try:
+    USE_MONTAGE = os.environ["FORESTPLOT_MONTAGE"] == "yes"
+except KeyError:
+    pass
+
+# Whether to process only one of each set of plots that appear in more than one paper, copying its results to the rest
+USE_DEDUPE = False
+try:
+    USE_DEDUPE = os.environ["FORESTPLOT_DEDUPE"] == "yes"
+except KeyError:
+    pass
+
 IMAGE_NAME = "forestplot"
 
+# Records the plots that had OCR calls time out or ran out of time on the last run
+SLOW_PLOTS_FILENAME = "slow-plots.json"
+
+# Where the work queue is kept when processing a project with many workers
+QUEUE_DIRECTORY = "queue"
 
+# Where each worker keeps its status file, within the queue
+STATUS_DIRECTORY = "status"
+
+# The kinds of paper ami-makeproject turns into ctrees
+RAW_FILE_TYPES = ("html", "pdf", "xml")
 
 class Controller():
     """Runs the overall forest plot collecting code."""
 
     def __init__(self, project_directory):
         self.project_directory = project_directory
+        self.probe_stats = probe.ProbeStats()
+        self.threshold_profile = thresholds.ThresholdProfile(thresholds.profile_path(project_directory))
 
     def docker_wrapper(self, command, args):
         """Call a normami command in a docker container."""
@@ -39,68 +77,545 @@ class Controller():
         """Call a normami command."""
         if not args:
             args = []
-        print("Calling {0}".format(command))
+        progress.log(f"Running {command}")
+        start = time.monotonic()
         if USE_DOCKER:
             self.docker_wrapper(command, args)
         else:
             subprocess.run([command, "-p", self.project_directory] + args, capture_output=False)
-        print("Done")
+        progress.log(f"{command} finished in {progress.format_duration(time.monotonic() - start)}")
+
+    def status_path(self):
+        """Get the path of the status file that reports the progress of a run."""
+        return os.path.join(self.project_directory, progress.STATUS_FILENAME)
+
+    def statuses(self):
+        """Get the status of the run, and of each worker, from their status files, as a list of names and status
+        dictionaries."""
+        statuses = []
+        status = progress.load_status(self.status_path())
+        if status is not None:
+            statuses.append(("run", status))
+        status_directory = os.path.join(self.project_directory, QUEUE_DIRECTORY, STATUS_DIRECTORY)
+        if os.path.isdir(status_directory):
+            for filename in sorted(os.listdir(status_directory)):
+                status = progress.load_status(os.path.join(status_directory, filename))
+                if filename.endswith(".json") and status is not None:
+                    statuses.append((filename[:-len(".json")], status))
+        return statuses
+
+    def save_probe_stats(self):
+        """Report how many plots the probe rejected and the time that saved, and save the figures."""
+        if not self.probe_stats.plots:
+            return
+        progress.log(self.probe_stats.line())
+        self.probe_stats.save(os.path.join(self.project_directory, probe.STATS_FILENAME))
+
+    def train_thresholds(self, processes=None):
+        """Rebuild the threshold profile from scratch, from the winning thresholds of every plot decoded from the OCR
+        text on disk. Processes sets how many plots are decoded in parallel, defaulting to the number of CPUs."""
+        duplicates = {x.image_directory for x in dedupe.load(self.project_directory)}
+        decode = [imagedir for imagedir in self._all_image_directories()
+                  if replay.plot_type(imagedir) and os.path.abspath(imagedir) not in duplicates]
+
+        self.threshold_profile.reset()
+        progress.start("train", len(decode), status_path=self.status_path())
+        for plot in replay.replay(decode, processes):
+            if plot is not None:
+                self.threshold_profile.record_plot(plot)
+        progress.finish()
+        self.threshold_profile.save()
+        for line in self.threshold_profile.lines(THRESHOLDS):
+            progress.log(line)
+
+    def save_slow_plots(self, slow_plots):
+        """Save the list of plots that had OCR time out on this run, so they can be looked at by hand."""
+        with open(os.path.join(self.project_directory, SLOW_PLOTS_FILENAME), "w") as slow_plots_file:
+            json.dump(slow_plots, slow_plots_file, indent=4)
 
     def save_results(self, papers):
-        """Save a workbook containing a summary of all plots."""
-        res = Results(papers)
+        """Save a workbook containing a summary of all plots, the plots that were copies of others, and the paper
+        each input was processed as."""
+        from forestplots.results import Results # pylint: disable=import-outside-toplevel
+        duplicates = [(os.path.relpath(x.image_directory, self.project_directory),
+                       os.path.relpath(x.representative, self.project_directory), x.distance)
+                      for x in dedupe.load(self.project_directory)]
+        res = Results(papers, duplicates, ingest.inputs(self.project_directory))
         res.save(os.path.join(self.project_directory, "results.xlsx"))
 
+    @staticmethod
+    def copy_plot(plot, imagedir):
+        """Copy the results of a plot to a duplicate of it in another image directory, or return None if the plot
+        wasn't valid."""
+        if plot is None:
+            return None
+        duplicate = ForestPlot.load(imagedir, plot.dump())
+        duplicate.save()
+        return duplicate
 
-    def main(self):
-        """This is the main method of the tool."""
-        if not os.path.isfile(os.path.join(self.project_directory, "make_project.json")):
-            print(f"Generating CProject in {self.project_directory}...")
-            self.normami("ami-makeproject", ["--rawfiletypes", "html,pdf,xml", "--omit", "template.xml"])
+    @staticmethod
+    def mark_plot_type(imagedir, plot_type):
+        """Rename the lines image to indicate what type of plot we think it is. If the Skeleton came from the cache
+        then there'll be no new lines image, in which case the one from the earlier run is already in place."""
+        lines_path = os.path.join(imagedir, "lines.png")
+        if os.path.isfile(lines_path):
+            os.rename(lines_path, os.path.join(imagedir, f"{plot_type}.png"))
+
+    @staticmethod
+    def image_directories(ctree):
+        """Get the image directories normami has extracted for a ctree. Raises FileNotFoundError if this isn't a
+        ctree with images."""
+        pdf_images_dir = os.path.join(ctree, "pdfimages")
+        return [os.path.join(pdf_images_dir, x) for x in os.listdir(pdf_images_dir) if x.startswith("image.")]
 
-        raw_project_contents = [os.path.join(self.project_directory, x) for x in os.listdir(self.project_directory)]
-        project_contents = [x for x in raw_project_contents if os.path.isdir(x)]
+    def ctrees(self):
+        """Get the directories in the project, which should be the ctrees."""
+        raw_project_contents = [os.path.join(self.project_directory, x) for x in os.listdir(self.project_directory)
+                                if x not in (QUEUE_DIRECTORY, ingest.SET_ASIDE_DIRECTORY)]
+        return [x for x in raw_project_contents if os.path.isdir(x)]
 
+    def extract_images(self):
+        """Use normami to make the CProject and pull the images out of the papers."""
+        if not os.path.isfile(os.path.join(self.project_directory, "make_project.json")):
+            progress.log(f"Generating CProject in {self.project_directory}...")
+            self.make_project()
 
         self.normami("ami-pdf")
 
+        self.filter_images()
+
+    def make_project(self):
+        """Use normami to make a ctree for each paper in the project, skipping PDFs that are copies of others."""
+        moved = ingest.set_aside_duplicates(self.project_directory)
+        if moved:
+            progress.log(f"Moved {moved} PDFs that are copies of others to {ingest.SET_ASIDE_DIRECTORY}")
+        self.normami("ami-makeproject", ["--rawfiletypes", ",".join(RAW_FILE_TYPES), "--omit", "template.xml"])
+        ingest.link_ctrees(self.project_directory, self.ctrees())
+
+    def filter_images(self):
+        """Use normami to move aside the images that are too small, duplicated or monochrome to be plots."""
         self.normami("ami-filter", ["--small", "small", "--duplicate", "duplicate", "--monochrome", "monochrome"])
 
+    def triage(self, processes=None):
+        """Extract the images and classify them, without running any OCR, and save a report of the candidate
+        plots. Processes sets how many images are classified in parallel, defaulting to the number of CPUs."""
+        self.extract_images()
+        self.classify(processes)
+
+    def classify(self, processes=None):
+        """Classify the images already extracted, and save a report of the candidate plots."""
+        work = []
+        for ctree in self.ctrees():
+            try:
+                work.extend((ctree, imagedir) for imagedir in self.image_directories(ctree))
+            except FileNotFoundError:
+                continue
+
+        skeleton_cache = SkeletonCache(os.path.join(self.project_directory, CACHE_FILENAME))
+        progress.start("classify", len(work), len({ctree for ctree, _ in work}), self.status_path())
+        skeletons = triage.classify([imagedir for _, imagedir in work], skeleton_cache, processes)
+        progress.finish()
+        skeleton_cache.save()
+
+        classified = []
+        for (ctree, imagedir), skeleton in zip(work, skeletons):
+            plot_type = triage.plot_type(skeleton)
+            if plot_type is not None:
+                self.mark_plot_type(imagedir, plot_type)
+            classified.append((ctree, imagedir, plot_type))
+
+        report = triage.summarise(self.project_directory, classified)
+        triage.save(self.project_directory, report)
+
+        summary = report["summary"]
+        progress.log(f"{summary['images']} images in {summary['papers']} papers: {summary['spss']} SPSS and "
+                     f"{summary['stata']} Stata candidates in {summary['papers_with_candidates']} papers")
+
+    def replay(self, processes=None):
+        """Rerun just the decoding of already classified plots from the OCR text on disk, and regenerate the
+        results. Processes sets how many plots are decoded in parallel, defaulting to the number of CPUs."""
+        duplicates = {x.image_directory: x.representative for x in dedupe.load(self.project_directory)}
 
         papers = []
-        for ctree in project_contents:
+        work = []
+        for ctree in self.ctrees():
             paper = Paper(ctree)
             papers.append(paper)
-
-            pdf_images_dir = os.path.join(ctree, "pdfimages")
             try:
-                imagedirs = [os.path.join(pdf_images_dir, x) for x in os.listdir(pdf_images_dir) if x.startswith("image.")]
+                imagedirs = self.image_directories(ctree)
             except FileNotFoundError:
-                # Most likely we've hit other dirs in the corpus, like .git
                 continue
-            for imagedir in imagedirs:
-                skeleton = Skeleton(imagedir)
-                plot = None
-                if skeleton.likely_spss():
-                    os.rename(os.path.join(imagedir, "lines.png"),
-                              os.path.join(imagedir, "spss.png"))
-                    plot = SPSSForestPlot(imagedir, skeleton)
-                elif skeleton.likely_stata():
-                    os.rename(os.path.join(imagedir, "lines.png"),
-                              os.path.join(imagedir, "stata.png"))
-                    plot = StataForestPlot(imagedir, skeleton)
-
-                if not plot:
-                    continue
+            work.extend((paper, imagedir) for imagedir in imagedirs if replay.plot_type(imagedir))
+
+        # duplicates have no OCR text of their own, and are given the results of the plot they're a copy of
+        decode = [imagedir for _, imagedir in work if os.path.abspath(imagedir) not in duplicates]
+        progress.start("replay", len(decode), status_path=self.status_path())
+        decoded = {os.path.abspath(imagedir): plot for imagedir, plot in zip(decode, replay.replay(decode, processes))}
+        progress.finish()
+        for paper, imagedir in work:
+            key = os.path.abspath(imagedir)
+            if key in duplicates:
+                plot = self.copy_plot(decoded.get(duplicates[key]), imagedir)
+            else:
+                plot = decoded[key]
+            if plot is not None:
+                paper.plots.append(plot)
 
+        self.save_results(papers)
+
+    def classify_image(self, imagedir, skeleton_cache):
+        """Classify a single image, returning a plot of the type it looks like, or None if it doesn't look like
+        one."""
+        from forestplots.skeleton import Skeleton # pylint: disable=import-outside-toplevel
+        skeleton = Skeleton(imagedir, skeleton_cache)
+        if skeleton.likely_spss():
+            self.mark_plot_type(imagedir, "spss")
+            plot = SPSSForestPlot(imagedir, skeleton)
+        elif skeleton.likely_stata():
+            self.mark_plot_type(imagedir, "stata")
+            plot = StataForestPlot(imagedir, skeleton)
+        else:
+            return None
+        if thresholds.USE_PROFILE:
+            plot.threshold_profile = self.threshold_profile
+        return plot
+
+    def find_duplicates(self, candidates, skeleton_cache):
+        """Find the candidate plots that are copies of others, saving them in duplicates.json. Returns the
+        representative each duplicate is a copy of, keyed by the duplicate, both as absolute paths."""
+        hashed = []
+        for _, imagedir in candidates:
+            plot = self.classify_image(imagedir, skeleton_cache)
+            if plot is None:
+                continue
+            image_hash = dedupe.image_hash(os.path.join(imagedir, "raw.png"))
+            if image_hash is not None:
+                hashed.append((os.path.abspath(imagedir), plot.PLOT_TYPE, image_hash))
+
+        duplicates = dedupe.find_duplicates(hashed)
+        dedupe.save(self.project_directory, duplicates)
+        progress.log(f"Found {len(duplicates)} plots that are copies of others")
+        return {x.image_directory: x.representative for x in duplicates}
+
+    def montage_ocr(self, candidates, skeleton_cache, cropped=False):
+        """Classify and break up the candidate images, unless they're already cropped, and OCR the small regions of
+        all the plots at every threshold in batches, so that processing the plots finds that OCR already done. The
+        region the probe decides on is only done at the probe thresholds. Returns the image directories whose regions
+        are cropped, which needn't be again."""
+        from forestplots import montage # pylint: disable=import-outside-toplevel
+        progress.start("montage", len(candidates), status_path=self.status_path())
+        crops = []
+        ready = set()
+        for _, imagedir in candidates:
+            progress.advance()
+            plot = self.classify_image(imagedir, skeleton_cache)
+            if plot is None:
+                continue
+            if not cropped:
                 try:
                     plot.break_up_image()
-                    plot.process()
                 except InvalidForestPlot:
-                    pass
+                    continue
+            elif not all(os.path.isfile(os.path.join(imagedir, f"raw.{x}.png")) for x in plot.MONTAGE_REGIONS):
+                continue
+            ready.add(imagedir)
+            # this isn't the plot object that will be processed, so mustn't count towards the profile's exploring
+            plot.exploring = False
+            for region in plot.MONTAGE_REGIONS:
+                # the decisive region is only read in full once the probe has passed, which is what saves the OCR
+                if region == plot.PROBE_REGION and plot.probing():
+                    read_at = plot.probe_read_thresholds()
                 else:
-                    paper.plots.append(plot)
-                    plot.save()
+                    read_at = plot.sweep_thresholds(region)
+                crops.extend(montage.pending_crops(imagedir, [region], read_at))
 
-        self.save_results(papers)
+        done = montage.ocr_crops(crops)
+        progress.log(f"OCRed {done} of {len(crops)} small regions in batches")
+        progress.finish()
+        return ready
+
+    def break_up_image(self, imagedir, skeleton_cache):
+        """Classify a single image and crop it into the regions that are OCRed, if it looks like a plot."""
+        plot = self.classify_image(imagedir, skeleton_cache)
+        if plot is None:
+            return
+        try:
+            plot.break_up_image()
+        except InvalidForestPlot:
+            pass
+
+    def process_image(self, imagedir, skeleton_cache, cropped=False):
+        """Classify and process a single image, cropping it into its regions unless that's already been done.
+        Returns the plot if it's a valid one, or else None, and a record of the OCR timing out if it did."""
+        plot = self.classify_image(imagedir, skeleton_cache)
+        if not plot:
+            return None, None
+
+        start = time.monotonic()
+        valid = True
+        try:
+            if not cropped:
+                plot.break_up_image()
+            plot.process()
+        except InvalidForestPlot:
+            valid = False
+            replay.save_decoded(imagedir, None)
+        else:
+            plot.save()
+            replay.save_decoded(imagedir, plot)
+            self.threshold_profile.record_plot(plot)
+        self.probe_stats.add(plot)
+
+        slow_plot = None
+        if plot.budget_exhausted or plot.ocr_timeouts:
+            progress.log(f"OCR timed out on {imagedir}")
+            slow_plot = {
+                "image_directory": os.path.relpath(imagedir, self.project_directory),
+                "budget_exhausted": plot.budget_exhausted,
+                "ocr_timeouts": plot.ocr_timeouts,
+                "seconds": round(time.monotonic() - start, 1),
+                "valid": valid,
+            }
+
+        return plot if valid else None, slow_plot
+
+    def candidate_image_directories(self, extract=True):
+        """Extract the images from the papers if that's not been done by triage, and list the (ctree, image
+        directory) pairs that could be plots."""
+        # If triage has been run then the images are already extracted, and we know which aren't plots
+        triaged = triage.load(self.project_directory)
+        if triaged is None and extract:
+            self.extract_images()
+
+        candidates = []
+        for ctree in self.ctrees():
+            try:
+                imagedirs = self.image_directories(ctree)
+            except FileNotFoundError:
+                # Most likely we've hit other dirs in the corpus, like .git
+                continue
+            for imagedir in imagedirs:
+                if triaged is not None and triaged.get(os.path.abspath(imagedir), "unknown") is None:
+                    continue
+                candidates.append((ctree, imagedir))
+        return candidates
+
+    def _all_image_directories(self):
+        """List every image directory normami has extracted in the project."""
+        imagedirs = []
+        for ctree in self.ctrees():
+            try:
+                imagedirs.extend(self.image_directories(ctree))
+            except FileNotFoundError:
+                continue
+        return sorted(imagedirs)
+
+    def _triaged_images(self):
+        """Get the candidate plots found by classifying the images, as paths relative to the project, along with
+        the type of plot each looks like."""
+        triaged = triage.load(self.project_directory) or {}
+        return {os.path.relpath(imagedir, self.project_directory): plot_type
+                for imagedir, plot_type in sorted(triaged.items()) if plot_type is not None}
+
+    def stages(self):
+        """Describe the processing of the project as a list of Stages, so that only the out of date work need be
+        run."""
+        project = self.project_directory
+        skeleton_cache = SkeletonCache(os.path.join(project, CACHE_FILENAME))
+
+        def path(item, *names):
+            return os.path.join(project, item, *names)
+
+        def crops(item):
+            plot_type = replay.plot_type(path(item))
+            regions = replay.PLOT_CLASSES[plot_type].REGIONS if plot_type is not None else ()
+            return [path(item, f"raw.{region}.png") for region in regions]
+
+        def ocr_finish():
+            skeleton_cache.save()
+            self.threshold_profile.save()
+            self.save_probe_stats()
+
+        def ocr_prepare(items):
+            if USE_MONTAGE:
+                # the crop stage has already cropped the images
+                self.montage_ocr([(None, path(item)) for item in items], skeleton_cache, cropped=True)
+                skeleton_cache.save()
+
+        def originals():
+            duplicates = {os.path.relpath(x.image_directory, project) for x in dedupe.load(project)}
+            return [x for x in self._triaged_images() if x not in duplicates]
+
+        def find_duplicates():
+            if USE_DEDUPE:
+                self.find_duplicates([(None, path(x)) for x in self._triaged_images()], skeleton_cache)
+                skeleton_cache.save()
+            else:
+                dedupe.save(project, [])
+
+        def ctree_pdfs():
+            return [os.path.join(ctree, "fulltext.pdf") for ctree in self.ctrees()
+                    if os.path.isfile(os.path.join(ctree, "fulltext.pdf"))]
+
+        return [
+            Stage("makeproject", [], lambda item: self.make_project(),
+                  inputs=lambda item: [os.path.join(project, x) for x in os.listdir(project)
+                                       if x.rsplit(".", 1)[-1] in RAW_FILE_TYPES and x != "template.xml"],
+                  outputs=lambda item: [os.path.join(project, "make_project.json")]),
+            Stage("pdf", ["makeproject"], lambda item: self.normami("ami-pdf"),
+                  inputs=lambda item: ctree_pdfs(),
+                  outputs=lambda item: [os.path.join(os.path.dirname(x), "pdfimages") for x in ctree_pdfs()]),
+            Stage("filter", ["pdf"], lambda item: self.filter_images(),
+                  inputs=lambda item: [os.path.join(os.path.dirname(x), "pdfimages") for x in ctree_pdfs()],
+                  outputs=lambda item: []),
+            Stage("classify", ["filter"], lambda item: self.classify(),
+                  inputs=lambda item: [os.path.join(x, "raw.png") for x in self._all_image_directories()],
+                  outputs=lambda item: [os.path.join(project, triage.TRIAGE_FILENAME),
+                                        os.path.join(project, triage.TRIAGE_CSV_FILENAME)]),
+            Stage("dedupe", ["classify"], lambda item: find_duplicates(),
+                  inputs=lambda item: [path(x, "raw.png") for x in self._triaged_images()],
+                  outputs=lambda item: [os.path.join(project, dedupe.DUPLICATES_FILENAME)]),
+            Stage("crop", ["dedupe"], lambda item: self.break_up_image(path(item), skeleton_cache),
+                  inputs=lambda item: [path(item, "raw.png")], outputs=crops,
+                  items=originals, finish=skeleton_cache.save),
+            Stage("ocr", ["crop"], lambda item: self.process_image(path(item), skeleton_cache, cropped=True),
+                  inputs=crops, outputs=lambda item: [path(item, replay.DECODED_FILENAME)],
+                  items=originals, prepare=ocr_prepare, finish=ocr_finish),
+            Stage("results", ["ocr"], lambda item: self.replay(),
+                  inputs=lambda item: [path(x, replay.DECODED_FILENAME) for x in self._triaged_images()],
+                  outputs=lambda item: [os.path.join(project, "results.xlsx")]),
+        ]
+
+    def run_stages(self, names=None):
+        """Run the out of date work of the named stages, or of all of them, in order. The stages before those named
+        are assumed to have been done. Raises ValueError for an unknown stage."""
+        Pipeline(self.project_directory, self.stages()).run(names)
+
+    def coordinate(self):
+        """Fill the work queue with the images to be processed, so workers on this and other machines can share the
+        processing of the project."""
+        queue = WorkQueue(os.path.join(self.project_directory, QUEUE_DIRECTORY))
+        candidates = self.candidate_image_directories()
+
+        duplicates = {}
+        if USE_DEDUPE:
+            skeleton_cache = SkeletonCache(os.path.join(self.project_directory, CACHE_FILENAME))
+            duplicates = self.find_duplicates(candidates, skeleton_cache)
+            skeleton_cache.save()
+
+        added = 0
+        for ctree, imagedir in candidates:
+            if os.path.abspath(imagedir) in duplicates:
+                continue
+            item = {
+                "ctree": os.path.relpath(ctree, self.project_directory),
+                "image_directory": os.path.relpath(imagedir, self.project_directory),
+            }
+            if queue.enqueue(item["image_directory"].replace(os.sep, "__"), item):
+                added += 1
+        progress.log(f"Queued {added} images")
+
+    def work(self):
+        """Process images from the work queue until there are none left."""
+        queue = WorkQueue(os.path.join(self.project_directory, QUEUE_DIRECTORY))
+        skeleton_cache = SkeletonCache(os.path.join(self.project_directory, CACHE_FILENAME))
+
+        def handler(item):
+            imagedir = os.path.join(self.project_directory, item["image_directory"])
+            plot, slow_plot = self.process_image(imagedir, skeleton_cache)
+            skeleton_cache.save()
+            self.threshold_profile.save()
+            progress.advance(plots=int(plot is not None))
+            return {"valid": plot is not None, "slow_plot": slow_plot}
+
+        # each worker reports its own progress, through the images that were waiting when it started
+        status_directory = os.path.join(queue.path, STATUS_DIRECTORY)
+        os.makedirs(status_directory, exist_ok=True)
+        progress.start("work", queue.counts()[PENDING],
+                       status_path=os.path.join(status_directory, f"{worker_name().replace(':', '-')}.json"))
+        processed = run_worker(queue, handler)
+        progress.finish()
+        if self.probe_stats.plots:
+            progress.log(self.probe_stats.line())
+        progress.log(f"Processed {processed} images")
+
+    def merge(self):
+        """Build the results from everything the workers have processed."""
+        queue = WorkQueue(os.path.join(self.project_directory, QUEUE_DIRECTORY))
+        counts = queue.counts()
+        if counts[PENDING] or counts[LEASED]:
+            progress.log(f"Warning: {counts[PENDING]} images still to be processed and {counts[LEASED]} in progress")
+        for item, result in queue.results(FAILED):
+            progress.log(f"Failed to process {item['image_directory']}:\n{result['error']}")
+
+        self.save_slow_plots([result["slow_plot"] for _, result in queue.results() if result["slow_plot"]])
+        self.replay()
+
+    def main(self, resume=False):
+        """This is the main method of the tool. If resume is set, then the images finished by an earlier run that
+        didn't complete are skipped, and their results are taken from its journal."""
+        journal = Journal(os.path.join(self.project_directory, JOURNAL_FILENAME))
+        if resume:
+            journal.load()
+            progress.log(f"Resuming with {len(journal.records)} images already done")
+        else:
+            journal.reset()
+
+        # If the earlier run had got as far as finishing some images then normami has already done its work
+        candidates = self.candidate_image_directories(extract=not journal.records)
+
+        skeleton_cache = SkeletonCache(os.path.join(self.project_directory, CACHE_FILENAME))
+
+        duplicates = {}
+        if journal.records:
+            # the earlier run has already found the duplicates
+            duplicates = {x.image_directory: x.representative for x in dedupe.load(self.project_directory)}
+        elif USE_DEDUPE:
+            duplicates = self.find_duplicates(candidates, skeleton_cache)
+
+        cropped = set()
+        if USE_MONTAGE:
+            todo = [(ctree, imagedir) for ctree, imagedir in candidates
+                    if os.path.relpath(imagedir, self.project_directory) not in journal.records
+                    and os.path.abspath(imagedir) not in duplicates]
+            cropped = self.montage_ocr(todo, skeleton_cache)
+            skeleton_cache.save()
+
+        papers = collections.OrderedDict((ctree, Paper(ctree)) for ctree in self.ctrees())
+        slow_plots = []
+        progress.start("process", len(candidates), len({ctree for ctree, _ in candidates}), self.status_path())
+        # the plot found for each image, for copying to its duplicates, which always come after it
+        representatives = {}
+        for index, (ctree, imagedir) in enumerate(candidates):
+            name = os.path.relpath(imagedir, self.project_directory)
+            record = journal.records.get(name)
+            if record is not None:
+                plot = ForestPlot.load(imagedir, record["plot"]) if record["plot"] is not None else None
+                slow_plot = record["slow_plot"]
+            elif os.path.abspath(imagedir) in duplicates:
+                plot = self.copy_plot(representatives.get(duplicates[os.path.abspath(imagedir)]), imagedir)
+                slow_plot = None
+            else:
+                plot, slow_plot = self.process_image(imagedir, skeleton_cache, imagedir in cropped)
+                journal.append({
+                    "image_directory": name,
+                    "plot": plot.dump() if plot is not None else None,
+                    "slow_plot": slow_plot,
+                })
+
+            representatives[os.path.abspath(imagedir)] = plot
+            if plot is not None:
+                papers[ctree].plots.append(plot)
+            if slow_plot is not None:
+                slow_plots.append(slow_plot)
+
+            paper_done = index + 1 == len(candidates) or candidates[index + 1][0] != ctree
+            if paper_done:
+                skeleton_cache.save()
+                self.threshold_profile.save()
+            progress.advance(plots=int(plot is not None), papers=int(paper_done))
 
+        progress.finish()
+        self.save_probe_stats()
+        self.save_slow_plots(slow_plots)
+        self.save_results(list(papers.values()))
@@ -0,0 +1,164 @@
+"""Regression corpus of real OCR output and the values the decoders should get from it.
+
+A corpus is a directory of JSON files, each holding a list of cases like:
+
+    {
+        "decoder": "SPSSForestPlot._decode_footer_summary_ocr",
+        "name": "pmc5502154 image.5.1.110 threshold 60",
+        "ocr": "Heterogeneity: Chi? = 2.11, df = 5 (P = 0.83); I= 0%\\n...",
+        "expected": [{"Chi": 2.11, "df": 5.0, "P": 0.83, "I": 0.0}, {"Z": 3.8, "P": 0.0001}]
+    }
+
+The expected value is the decoder's return value with tuples as lists, or the case can have "raises": "ValueError"
+instead if the decoder should reject the text. Cases the decoders are known to get wrong still hold the correct
+expected value, plus an "xfail" key explaining the problem, so they count against the accuracy but don't fail the
+tests."""
+
+import collections
+import glob
+import json
+import os
+import time
+
+from forestplots.helpers import normalize_ocr
+from forestplots.plots import ForestPlot
+from forestplots.spssplots import SPSSForestPlot
+from forestplots.stataplots import StataForestPlot
+from forestplots import replay
+
+
+def _split_lines(ocr_prose):
+    # _decode_table_lines_ocr is given the normalized lines by _process_table, not the raw text
+    return normalize_ocr(ocr_prose).lines
+
+
+DECODERS = collections.OrderedDict([
+    ("ForestPlot._decode_table_values_ocr", ForestPlot._decode_table_values_ocr),
+    ("SPSSForestPlot._decode_footer_summary_ocr", SPSSForestPlot._decode_footer_summary_ocr),
+    ("SPSSForestPlot._decode_header_summary_ocr", SPSSForestPlot._decode_header_summary_ocr),
+    ("SPSSForestPlot._decode_table_lines_ocr",
+     lambda ocr_prose: SPSSForestPlot._decode_table_lines_ocr(_split_lines(ocr_prose))),
+    ("SPSSForestPlot._decode_table_columnwise_ocr", SPSSForestPlot._decode_table_columnwise_ocr),
+    ("SPSSForestPlot._decode_footer_scale_ocr", SPSSForestPlot._decode_footer_scale_ocr),
+    ("StataForestPlot._decode_header_ocr", StataForestPlot._decode_header_ocr),
+    ("StataForestPlot._decode_values_ocr", StataForestPlot._decode_values_ocr),
+    ("StataForestPlot._decode_table_titles_ocr", StataForestPlot._decode_table_titles_ocr),
+    ("StataForestPlot._decode_footer_scale_ocr", StataForestPlot._decode_footer_scale_ocr),
+])
+
+# Which decoders are run over the OCR text of each region of each type of plot
+REGION_DECODERS = {
+    ("spss", "footer.summary"): ["SPSSForestPlot._decode_footer_summary_ocr"],
+    ("spss", "header.graphheads"): ["SPSSForestPlot._decode_header_summary_ocr"],
+    ("spss", "body.table"): ["SPSSForestPlot._decode_table_lines_ocr", "ForestPlot._decode_table_values_ocr"],
+    ("spss", "footer.scale"): ["SPSSForestPlot._decode_footer_scale_ocr"],
+    ("stata", "header"): ["StataForestPlot._decode_header_ocr"],
+    ("stata", "titles"): ["StataForestPlot._decode_table_titles_ocr"],
+    ("stata", "values"): ["StataForestPlot._decode_values_ocr"],
+    ("stata", "scale"): ["StataForestPlot._decode_footer_scale_ocr"],
+}
+
+CORPUS_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "corpus")
+
+
+def normalise(value):
+    """Convert a decoder result into the form it's stored in the corpus."""
+    if isinstance(value, dict):
+        return {key: normalise(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalise(item) for item in value]
+    return value
+
+
+def load_corpus(directory=CORPUS_DIRECTORY):
+    """Load all the cases from the JSON files in a corpus directory."""
+    cases = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(path) as corpus_file:
+            for case in json.load(corpus_file):
+                if case["decoder"] not in DECODERS:
+                    raise ValueError(f"Unknown decoder {case['decoder']} in {path}")
+                cases.append(case)
+    return cases
+
+
+def run_case(case):
+    """Run a single corpus case. Returns a tuple of whether it passed and what the decoder gave."""
+    decoder = DECODERS[case["decoder"]]
+    try:
+        actual = normalise(decoder(case["ocr"]))
+    except ValueError:
+        return case.get("raises") == "ValueError", "ValueError"
+    if "raises" in case:
+        return False, actual
+    return actual == case["expected"], actual
+
+
+def harvest(image_directories):
+    """Make corpus cases from the OCR text of plots processed on an earlier run. The expected values are whatever
+    the decoders currently give, so they need checking by hand before the cases are added to the corpus."""
+    cases = []
+    for image_directory in image_directories:
+        plot_type = replay.plot_type(image_directory)
+        if plot_type is None:
+            continue
+        for name in sorted(os.listdir(image_directory)):
+            region, _, extension = name.rpartition(".")
+            region, _, threshold = region.rpartition(".")
+            if extension != "txt" or not threshold.isdigit():
+                continue
+            with open(os.path.join(image_directory, name)) as ocr_file:
+                ocr_prose = ocr_file.read()
+            for decoder in REGION_DECODERS.get((plot_type, region), []):
+                case = {
+                    "decoder": decoder,
+                    "name": f"{os.path.relpath(image_directory)} {region} threshold {threshold}",
+                    "ocr": ocr_prose,
+                }
+                try:
+                    case["expected"] = normalise(DECODERS[decoder](ocr_prose))
+                except ValueError:
+                    case["raises"] = "ValueError"
+                cases.append(case)
+    return cases
+
+
+def evaluate(cases):
+    """Check the decoders against the corpus. Returns a dictionary of decoder name to a tuple of the number of
+    cases passed and the number of cases, and a list of (case, actual) for the failures."""
+    scores = collections.OrderedDict()
+    failures = []
+    for case in cases:
+        passed, actual = run_case(case)
+        correct, total = scores.get(case["decoder"], (0, 0))
+        scores[case["decoder"]] = (correct + int(passed), total + 1)
+        if not passed:
+            failures.append((case, actual))
+    return scores, failures
+
+
+def benchmark(cases, minimum_time=0.5):
+    """Measure the throughput of each decoder over the corpus. Returns a dictionary of decoder name to strings
+    decoded per second."""
+    grouped = collections.OrderedDict()
+    for case in cases:
+        grouped.setdefault(case["decoder"], []).append(case["ocr"])
+
+    throughput = collections.OrderedDict()
+    for name, texts in grouped.items():
+        decoder = DECODERS[name]
+        count = 0
+        start = time.perf_counter()
+        elapsed = 0.0
+        while elapsed < minimum_time:
+            # don't let the normalized text cached on the previous pass make the decoders look faster
+            normalize_ocr.cache_clear()
+            for text in texts:
+                try:
+                    decoder(text)
+                except ValueError:
+                    pass
+            count += len(texts)
+            elapsed = time.perf_counter() - start
+        throughput[name] = count / elapsed
+    return throughput
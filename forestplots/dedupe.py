@@ -0,0 +1,149 @@
+"""Finding the same plot reproduced in more than one paper.
+
+Systematic reviews, their updates, corrigenda and supplementary material often carry the same forest plot, which
+ami-filter doesn't notice as it only looks for duplicates within a paper. Once the images are classified we take a
+perceptual hash of each candidate plot, the difference hash, which survives rescaling and recompression. Plots of the
+same type whose hashes are close, and whose thumbnails correlate closely, are put in a cluster, only the first of
+which is OCRed and decoded, its results being copied to the rest. The clusters are saved in duplicates.json."""
+
+import collections
+import json
+import os
+
+DUPLICATES_FILENAME = "duplicates.json"
+
+# The hash compares each pixel of a HASH_SIZE square thumbnail with its neighbour, giving HASH_SIZE squared bits
+HASH_SIZE = 16
+
+# The most bits two hashes can differ by for the images to be compared more closely. This must be less than the
+# number of bands, as we only compare hashes that are identical in at least one band.
+MAX_DISTANCE = 12
+try:
+    MAX_DISTANCE = int(os.environ["FORESTPLOT_DEDUPE_DISTANCE"])
+except KeyError:
+    pass
+BAND_BITS = 16
+
+# How far apart the aspect ratios of duplicates can be, as a fraction
+MAX_ASPECT_DIFFERENCE = 0.05
+
+# Forest plots from the same package share much of their layout, so images with close hashes are only taken to be
+# the same if their thumbnails are this well correlated
+THUMBNAIL_SIZE = (128, 64)
+MIN_CORRELATION = 0.95
+
+ImageHash = collections.namedtuple("ImageHash", "value aspect thumbnail")
+
+Duplicate = collections.namedtuple("Duplicate", "image_directory representative distance")
+
+
+def image_hash(path):
+    """Get the difference hash, aspect ratio and thumbnail of an image, or None if it can't be read."""
+    import cv2 # pylint: disable=import-outside-toplevel
+    import numpy as np # pylint: disable=import-outside-toplevel
+    image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if image is None or not image.size:
+        return None
+    height, width = image.shape
+
+    small = cv2.resize(image, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+    thumbnail = cv2.resize(image, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+    return ImageHash(value, width / height, thumbnail)
+
+
+def distance(first, second):
+    """Count the bits by which two hash values differ."""
+    return bin(first ^ second).count("1")
+
+
+def correlation(first, second):
+    """Get the correlation between two thumbnails, 1 being identical."""
+    import numpy as np # pylint: disable=import-outside-toplevel
+    first = first.astype(np.float32) - first.mean()
+    second = second.astype(np.float32) - second.mean()
+    scale = np.sqrt((first * first).sum() * (second * second).sum())
+    if scale == 0:
+        return 1.0 if not first.any() and not second.any() else 0.0
+    return float((first * second).sum() / scale)
+
+
+def bands(value):
+    """Split a hash value into its bands, numbered so the same bits in different places don't match."""
+    mask = (1 << BAND_BITS) - 1
+    return [(index, (value >> (index * BAND_BITS)) & mask) for index in range(HASH_SIZE * HASH_SIZE // BAND_BITS)]
+
+
+def same_image(first, second):
+    """Check whether two ImageHashes are close enough to be the same image. Returns the distance between their
+    hashes, or None."""
+    if abs(first.aspect - second.aspect) > MAX_ASPECT_DIFFERENCE * max(first.aspect, second.aspect):
+        return None
+    bits = distance(first.value, second.value)
+    if bits > MAX_DISTANCE:
+        return None
+    if correlation(first.thumbnail, second.thumbnail) < MIN_CORRELATION:
+        return None
+    return bits
+
+
+def find_duplicates(hashed):
+    """Cluster a list of (image directory, plot type, ImageHash) tuples. The first image of each cluster is its
+    representative. Returns a list of Duplicates for the rest."""
+    # the representatives having each band of their hash, by plot type
+    index = collections.defaultdict(list)
+    duplicates = []
+    for position, (image_directory, plot_type, hashed_image) in enumerate(hashed):
+        seen = set()
+        match = None
+        for band in bands(hashed_image.value):
+            for representative in index[(plot_type, band)]:
+                if representative in seen:
+                    continue
+                seen.add(representative)
+                bits = same_image(hashed[representative][2], hashed_image)
+                if bits is not None and (match is None or bits < match[1]):
+                    match = (representative, bits)
+
+        if match is not None:
+            duplicates.append(Duplicate(image_directory, hashed[match[0]][0], match[1]))
+        else:
+            for band in bands(hashed_image.value):
+                index[(plot_type, band)].append(position)
+    return duplicates
+
+
+def save(project_directory, duplicates):
+    """Write the clusters of duplicated plots, with paths relative to the project."""
+    clusters = collections.OrderedDict()
+    for duplicate in duplicates:
+        clusters.setdefault(duplicate.representative, []).append({
+            "image_directory": os.path.relpath(duplicate.image_directory, project_directory),
+            "distance": duplicate.distance,
+        })
+    report = {
+        "clusters": [{"representative": os.path.relpath(representative, project_directory), "duplicates": members}
+                     for representative, members in clusters.items()],
+    }
+    with open(os.path.join(project_directory, DUPLICATES_FILENAME), "w") as duplicates_file:
+        json.dump(report, duplicates_file, indent=4)
+
+
+def load(project_directory):
+    """Get the duplicated plots found on an earlier run, as a list of Duplicates with absolute paths, or an empty
+    list if none were looked for."""
+    try:
+        with open(os.path.join(project_directory, DUPLICATES_FILENAME)) as duplicates_file:
+            report = json.load(duplicates_file)
+    except FileNotFoundError:
+        return []
+
+    duplicates = []
+    for cluster in report["clusters"]:
+        representative = os.path.abspath(os.path.join(project_directory, cluster["representative"]))
+        for member in cluster["duplicates"]:
+            duplicates.append(Duplicate(os.path.abspath(os.path.join(project_directory, member["image_directory"])),
+                                        representative, member["distance"]))
+    return duplicates
@@ -0,0 +1,59 @@
+"""A lock on a file shared between processes, on one machine or many sharing a network file system, so that they take
+turns to read it, merge in what they've added and write it back, without one losing what another wrote in between.
+
+The lock is held by creating a lock file next to the shared file, which only one process can do successfully, and is
+released by removing it. The shared file itself is still written to a temporary file that replaces it, so readers
+that don't take the lock never see it half written. If a process dies holding the lock, its lock file is left behind,
+so once that's older than the stale time any other process removes it and carries on. As with the leases of the work
+queue, the clocks of the machines sharing a file need to be roughly in step."""
+
+import os
+import socket
+import time
+
+# How many seconds a lock can be held before it's taken to have been left by a process that died. Merging and writing
+# the files this guards takes well under a second
+STALE_TIME = 60.0
+
+# How many seconds to wait between tries at taking a lock someone else holds
+POLL_INTERVAL = 0.05
+
+
+class FileLock():
+    """A context manager holding the lock on a shared file."""
+
+    def __init__(self, path, stale_time=STALE_TIME, poll_interval=POLL_INTERVAL):
+        self.path = f"{path}.lock"
+        self.stale_time = stale_time
+        self.poll_interval = poll_interval
+
+    def __enter__(self):
+        while True:
+            try:
+                handle = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                self._remove_stale()
+                time.sleep(self.poll_interval)
+                continue
+            # who holds it, for anyone looking at a lock that's been left behind
+            with os.fdopen(handle, "w") as lock_file:
+                lock_file.write(f"{socket.gethostname()}:{os.getpid()}\n")
+            return self
+
+    def __exit__(self, *exc_info):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _remove_stale(self):
+        try:
+            age = time.time() - os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return
+        if age > self.stale_time:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                # someone else got there first
+                pass
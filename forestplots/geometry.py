@@ -0,0 +1,94 @@
+"""Rebuilding the rows and columns of a table from the positions of the words OCR found in it.
+
+Tesseract sometimes reads a table row by row and sometimes column by column, so the order of its text can't be
+trusted. The word boxes from its TSV output can: words whose vertical centres fall within the same band are on the
+same row, and the columns are the spans across the page that are covered by words in most of the rows."""
+
+import collections
+import statistics
+
+# The fraction of rows that may have a word straddling the gap between two columns, such as a long title or a
+# heterogeneity line running across the whole table
+COLUMN_STRAGGLERS = 0.2
+
+TableRow = collections.namedtuple("TableRow", "cells confidence")
+
+
+def cluster_rows(words):
+    """Group OCRWords into rows, top to bottom, each row being a list of words from left to right."""
+    rows = []
+    bounds = []
+    for word in sorted(words, key=lambda x: (x.top, x.left)):
+        middle = word.top + word.height / 2
+        if bounds and bounds[-1][0] <= middle <= bounds[-1][1]:
+            rows[-1].append(word)
+            top, bottom = bounds[-1]
+            bounds[-1] = (min(top, word.top), max(bottom, word.top + word.height))
+        else:
+            rows.append([word])
+            bounds.append((word.top, word.top + word.height))
+    return [sorted(row, key=lambda x: x.left) for row in rows]
+
+
+def cluster_columns(rows):
+    """Find the columns of a table from its rows of OCRWords. Returns a list of (left, right) pixel spans, left to
+    right, which is a single span if no columns stand out. Gaps narrower than the typical word height are taken to be
+    the spaces between words in the same column."""
+    words = [word for row in rows for word in row]
+    if not words:
+        return []
+    gap = statistics.median(word.height for word in words)
+    width = max(word.left + word.width for word in words)
+
+    # count how many rows have a word over each pixel
+    coverage = [0] * (width + 1)
+    for row in rows:
+        covered = set()
+        for word in row:
+            covered.update(range(word.left, word.left + word.width))
+        for x in covered:
+            coverage[x] += 1
+
+    allowance = int(len(rows) * COLUMN_STRAGGLERS)
+    columns = []
+    start = None
+    for x, count in enumerate(coverage):
+        if count > allowance and start is None:
+            start = x
+        elif count <= allowance and start is not None:
+            if columns and start - columns[-1][1] < gap:
+                start = columns.pop()[0]
+            columns.append((start, x))
+            start = None
+    if not columns:
+        # the words are too scattered for any span to be covered in enough rows, as in a noisy reading, so take the
+        # whole table as one column and leave the rows to be parsed from their text
+        columns = [(min(word.left for word in words), width)]
+    return columns
+
+
+def column_index(columns, word):
+    """Get the index of the column a word belongs to, being the one nearest its horizontal centre."""
+    middle = word.left + word.width / 2
+    distances = [0 if left <= middle <= right else min(abs(middle - left), abs(middle - right))
+                 for left, right in columns]
+    return distances.index(min(distances))
+
+
+def layout_table(words):
+    """Lay out OCRWords as a table. Returns a list of TableRows, each holding the text in each column, with an empty
+    string for empty cells, and the mean confidence of the row's words."""
+    rows = cluster_rows(words)
+    columns = cluster_columns(rows)
+    table = []
+    for row in rows:
+        cells = [[] for _ in columns]
+        for word in row:
+            cells[column_index(columns, word)].append(word.text)
+        table.append(TableRow([" ".join(cell) for cell in cells], statistics.mean(word.confidence for word in row)))
+    return table
+
+
+def table_cells(words):
+    """Lay out OCRWords as a table. Returns a list of rows, each a list of the text in each column."""
+    return [row.cells for row in layout_table(words)]
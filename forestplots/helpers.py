@@ -1,23 +1,70 @@
 """Common helper code."""
 
+import collections
+import difflib
+import functools
+import re
+
+# Common mistakes tesseract makes reading the characters in forest plots
+OCR_TRANSLATION = str.maketrans({
+    '§': '5',
+    '$': '5',
+    '£': '[-',
+})
+
+FLOAT_TRANSLATION = str.maketrans({
+    '~': '-',
+    '—': '-',
+    ',': '.',
+    ':': '.',
+    ';': '.',
+    ' ': '.',
+    '$': '5',
+    '§': '5',
+})
+
+NUMBER_RE = re.compile(r'[-—~]?\d+[,.]*\d*')
+
+OCRText = collections.namedtuple("OCRText", "text lines")
+NumericToken = collections.namedtuple("NumericToken", "text value")
+Vote = collections.namedtuple("Vote", "winner agreement margin")
+
 
 def forgiving_float(float_string):
     """Takes a string and tries to clear up common OCR errors before trying to convert to a float."""
-    REPLACEMENTS = [
-        ('~', '-'),
-        ('—', '-'),
-        (',', '.'),
-        (':', '.'),
-        (';', '.'),
-        (' ', '.'),
-        ('$', '5'),
-        ('§', '5'),
-    ]
+    return float(float_string.translate(FLOAT_TRANSLATION))
+
 
-    for replacement in REPLACEMENTS:
-        float_string = float_string.replace(replacement[0], replacement[1])
+@functools.lru_cache(maxsize=64)
+def normalize_ocr(ocr_prose):
+    """Fixes common character mistakes in some OCR text, and splits it into its stripped non-blank lines. The result
+    is cached, as several decoders get given the same text."""
+    text = ocr_prose.translate(OCR_TRANSLATION)
+    lines = tuple(x.strip() for x in text.split('\n') if x.strip())
+    return OCRText(text, lines)
 
-    return float(float_string)
+
+def numeric_tokens(line):
+    """Returns a list of NumericTokens for the whitespace separated numbers at the start of a line."""
+    tokens = []
+    for word in line.split():
+        if not NUMBER_RE.fullmatch(word):
+            break
+        try:
+            tokens.append(NumericToken(word, forgiving_float(word)))
+        except ValueError:
+            break
+    return tokens
+
+
+@functools.lru_cache(maxsize=1024)
+def resolve_label(label, known_labels):
+    """Works out which of a tuple of known labels a label read by OCR is meant to be, or None if it's not close to
+    any of them."""
+    matches = difflib.get_close_matches(label, known_labels)
+    if not matches:
+        return None
+    return matches[0]
 
 
 def sanity_check_values(value):
@@ -28,3 +75,20 @@ def sanity_check_values(value):
         if value[1] < -value[0] < value[2]:
             value = (-value[0], value[1], value[2])
     return value
+
+
+def weighted_vote(votes):
+    """Takes an iterable of (value, weight) pairs and returns a Vote for the value with the greatest total weight,
+    along with the fraction of the total weight it got and how far ahead it is of the runner up. Ties go to the value
+    seen first, so the result doesn't depend on hashing."""
+    totals = {}
+    for value, weight in votes:
+        totals[value] = totals.get(value, 0.0) + weight
+    if not totals:
+        raise ValueError("No votes")
+
+    ranked = sorted(totals.items(), key=lambda x: -x[1])
+    winner, weight = ranked[0]
+    runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+    total = sum(totals.values())
+    return Vote(winner, weight / total if total else 0.0, weight - runner_up)
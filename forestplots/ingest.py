@@ -0,0 +1,91 @@
+"""Spotting the same PDF dropped into a project more than once before normami makes a ctree for each.
+
+Each PDF in the top of the project is hashed, ignoring the creation and modification dates and the document ID,
+which are often all that differs between two downloads of a paper. Any that match a PDF seen before are moved into
+the duplicate-inputs folder, so they don't go through extraction and OCR again. aliases.json records the hash of
+every input and which input each duplicate is a copy of, and once the ctrees are made which ctree holds each hash,
+so the results can list every input against the paper it was processed as."""
+
+import hashlib
+import json
+import os
+import re
+
+ALIASES_FILENAME = "aliases.json"
+
+# Where PDFs that are copies of others are moved to
+SET_ASIDE_DIRECTORY = "duplicate-inputs"
+
+# Parts of a PDF that differ between copies of the same document
+VOLATILE_RE = re.compile(rb"/(?:CreationDate|ModDate)\s*\([^)]*\)|/ID\s*\[[^\]]*\]")
+
+
+def pdf_digest(path):
+    """Get a hash of a PDF, leaving out the parts that change each time the same document is saved."""
+    with open(path, "rb") as pdf_file:
+        content = pdf_file.read()
+    return hashlib.sha256(VOLATILE_RE.sub(b"", content)).hexdigest()
+
+
+def load(project_directory):
+    """Read the record of the project's inputs, or an empty one if there is none."""
+    try:
+        with open(os.path.join(project_directory, ALIASES_FILENAME)) as aliases_file:
+            return json.load(aliases_file)
+    except FileNotFoundError:
+        return {"inputs": {}, "ctrees": {}}
+
+
+def save(project_directory, aliases):
+    """Write the record of the project's inputs."""
+    with open(os.path.join(project_directory, ALIASES_FILENAME), "w") as aliases_file:
+        json.dump(aliases, aliases_file, indent=4)
+
+
+def set_aside_duplicates(project_directory):
+    """Hash the PDFs waiting to be made into ctrees, and move aside any that are copies of one seen before. Returns
+    how many were moved."""
+    aliases = load(project_directory)
+    originals = {x["digest"]: name for name, x in aliases["inputs"].items() if x["copy_of"] is None}
+
+    moved = 0
+    # copies usually have longer names than the original, such as "paper (1).pdf", so we keep the shortest
+    for name in sorted(os.listdir(project_directory), key=lambda x: (len(x), x)):
+        path = os.path.join(project_directory, name)
+        if not name.lower().endswith(".pdf") or not os.path.isfile(path):
+            continue
+        digest = pdf_digest(path)
+        copy_of = originals.get(digest)
+        if copy_of is not None and copy_of != name:
+            os.makedirs(os.path.join(project_directory, SET_ASIDE_DIRECTORY), exist_ok=True)
+            os.replace(path, os.path.join(project_directory, SET_ASIDE_DIRECTORY, name))
+            moved += 1
+        else:
+            copy_of = None
+            originals[digest] = name
+        aliases["inputs"][name] = {"digest": digest, "copy_of": copy_of}
+
+    save(project_directory, aliases)
+    return moved
+
+
+def link_ctrees(project_directory, ctrees):
+    """Find which ctree each input PDF became, by hashing the PDFs in any ctrees not already known."""
+    aliases = load(project_directory)
+    known = set(aliases["ctrees"].values())
+    for ctree in ctrees:
+        pdf_path = os.path.join(ctree, "fulltext.pdf")
+        if os.path.basename(ctree) in known or not os.path.isfile(pdf_path):
+            continue
+        aliases["ctrees"][pdf_digest(pdf_path)] = os.path.basename(ctree)
+    save(project_directory, aliases)
+
+
+def inputs(project_directory):
+    """List the (input file, input it's a copy of, ctree) for every PDF given to the project. The input it's a copy
+    of is the file itself if it isn't a duplicate, and the ctree is None if it isn't known."""
+    aliases = load(project_directory)
+    rows = []
+    for name, record in sorted(aliases["inputs"].items()):
+        rows.append((name, record["copy_of"] or name, aliases["ctrees"].get(record["digest"])))
+    return rows
@@ -0,0 +1,59 @@
+"""Append only journal of the images a run has finished, so that a run that dies part way through can be resumed.
+
+The journal is a file of JSON records, one per line. Each record is flushed to disk before we move on to the next
+image, so at most the image being worked on is lost. If we died while writing a record then the last line will be
+incomplete, in which case it's ignored and cut off before anything more is written."""
+
+import json
+import os
+
+JOURNAL_FILENAME = "journal.jsonl"
+
+
+class Journal():
+    """The finished images of a run, keyed by their image directory relative to the project."""
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+
+    def load(self):
+        """Read the records from an earlier run, dropping any incomplete record at the end."""
+        self.records = {}
+        try:
+            with open(self.path, "rb") as journal_file:
+                data = journal_file.read()
+        except FileNotFoundError:
+            return self.records
+
+        valid_length = 0
+        for line in data.split(b"\n"):
+            if valid_length + len(line) >= len(data):
+                # no newline at the end, so we died part way through writing this
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            self.records[record["image_directory"]] = record
+            valid_length += len(line) + 1
+
+        if valid_length != len(data):
+            with open(self.path, "r+b") as journal_file:
+                journal_file.truncate(valid_length)
+        return self.records
+
+    def reset(self):
+        """Start a new journal, forgetting any earlier run."""
+        self.records = {}
+        with open(self.path, "wb"):
+            pass
+
+    def append(self, record):
+        """Add a record for a finished image, making sure it's on disk before returning."""
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with open(self.path, "ab") as journal_file:
+            journal_file.write(line.encode("utf-8"))
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        self.records[record["image_directory"]] = record
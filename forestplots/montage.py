@@ -0,0 +1,143 @@
+"""Running OCR over many small crops at once by stacking them into a single image.
+
+Most of the time tesseract spends on the small header, footer and scale crops goes on starting up and loading its
+model rather than on reading the text. So before the plots are processed we binarise each of these crops at every
+threshold, stack them one above another with white space between into a few tall sheets, and run tesseract once per
+sheet. Each word it finds is handed back to the crop it lies in, using its box, and the text and TSV files for each
+crop are written just as if tesseract had been run on the crop alone, so the plots find their OCR already done."""
+
+import bisect
+import collections
+import os
+import subprocess
+import tempfile
+
+import cv2
+import numpy as np
+
+from forestplots.ocr import black_threshold, format_tsv, parse_tsv, words_text
+from forestplots.plots import OCR_TIMEOUT
+from forestplots import progress
+from forestplots.skeleton import png_size
+
+# Crops bigger than this are left to be OCRed on their own
+MAX_CROP_WIDTH = 4000
+MAX_CROP_HEIGHT = 400
+
+# White space around each crop in a sheet, which stops tesseract running text from neighbouring crops together
+PADDING = 60
+
+# The most pixels high a sheet can be
+MAX_SHEET_HEIGHT = 20000
+
+Crop = collections.namedtuple("Crop", "image_directory region threshold")
+
+# Where a crop is in a sheet, all crops being PADDING pixels in from the left
+Placement = collections.namedtuple("Placement", "crop top width height")
+
+
+def pending_crops(image_directory, regions, thresholds):
+    """List the Crops for the regions of a plot at each threshold that don't have OCR text yet."""
+    return [Crop(image_directory, region, threshold) for region in regions for threshold in thresholds
+            if not os.path.isfile(os.path.join(image_directory, f"{region}.{threshold}.txt"))]
+
+
+def layout(sized_crops):
+    """Place (crop, width, height) tuples one above the other on as few sheets as will hold them. Returns a list of
+    sheets, each a list of Placements."""
+    sheets = []
+    placements = []
+    top = PADDING
+    for crop, width, height in sized_crops:
+        if placements and top + height + PADDING > MAX_SHEET_HEIGHT:
+            sheets.append(placements)
+            placements = []
+            top = PADDING
+        placements.append(Placement(crop, top, width, height))
+        top += height + PADDING
+    if placements:
+        sheets.append(placements)
+    return sheets
+
+
+def render_sheet(placements):
+    """Draw the binarised crops onto a white sheet."""
+    width = max(x.width for x in placements) + 2 * PADDING
+    height = placements[-1].top + placements[-1].height + PADDING
+    sheet = np.full((height, width), 255, np.uint8)
+
+    images = {}
+    for placement in placements:
+        crop = placement.crop
+        path = os.path.join(crop.image_directory, f"raw.{crop.region}.png")
+        if path not in images:
+            images[path] = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        sheet[placement.top:placement.top + placement.height, PADDING:PADDING + placement.width] = \
+            black_threshold(images[path], crop.threshold)
+    return sheet
+
+
+def split_words(words, placements):
+    """Hand the OCRWords found on a sheet back to the crops they lie in, moving their boxes to be relative to the
+    crop. Returns a list of the words for each placement. Words in the padding are dropped."""
+    tops = [x.top for x in placements]
+    crop_words = [[] for _ in placements]
+    for word in words:
+        middle = word.top + word.height / 2
+        index = bisect.bisect_right(tops, middle) - 1
+        if index < 0 or middle >= placements[index].top + placements[index].height:
+            continue
+        crop_words[index].append(word._replace(left=word.left - PADDING, top=word.top - placements[index].top))
+    return crop_words
+
+
+def ocr_sheet(placements):
+    """Run tesseract over a sheet of crops. Returns the list of OCRWords, or None if tesseract failed or timed
+    out, in which case the crops are left to be OCRed on their own."""
+    with tempfile.TemporaryDirectory() as temp_directory:
+        sheet_path = os.path.join(temp_directory, "sheet.png")
+        cv2.imwrite(sheet_path, render_sheet(placements))
+        output_base = os.path.join(temp_directory, "sheet")
+        progress.ocr_call()
+        try:
+            subprocess.run(["tesseract", sheet_path, output_base, "tsv"], capture_output=True,
+                           timeout=OCR_TIMEOUT * len(placements))
+            with open(f"{output_base}.tsv") as tsv_file:
+                return parse_tsv(tsv_file.read())
+        except (subprocess.TimeoutExpired, FileNotFoundError):
+            return None
+
+
+def save_crop_ocr(crop, words):
+    """Write the text and TSV files for a crop, as tesseract would have done."""
+    output_base = os.path.join(crop.image_directory, f"{crop.region}.{crop.threshold}")
+    with open(f"{output_base}.tsv", "w") as tsv_file:
+        tsv_file.write(format_tsv(words))
+    with open(f"{output_base}.txt", "w") as ocr_file:
+        ocr_file.write(words_text(words))
+
+
+def ocr_crops(crops):
+    """OCR many Crops a sheet at a time. Crops that are too big, or whose sheet fails, are skipped. Returns how many
+    crops were done."""
+    sized_crops = []
+    for crop in crops:
+        try:
+            size = png_size(os.path.join(crop.image_directory, f"raw.{crop.region}.png"))
+        except FileNotFoundError:
+            continue
+        if size is None:
+            continue
+        width, height = size
+        if 0 < width <= MAX_CROP_WIDTH and 0 < height <= MAX_CROP_HEIGHT:
+            sized_crops.append((crop, width, height))
+
+    done = 0
+    for placements in layout(sized_crops):
+        words = ocr_sheet(placements)
+        if words is None:
+            continue
+        for placement, crop_words in zip(placements, split_words(words, placements)):
+            save_crop_ocr(placement.crop, crop_words)
+            done += 1
+    return done
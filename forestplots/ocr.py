@@ -0,0 +1,126 @@
+"""Reading and writing tesseract's output files.
+
+As well as the plain text, we ask tesseract for a TSV file listing every word it found along with its bounding box
+and how confident it was. This lets the decoders work from where the words are on the page rather than from the order
+tesseract happened to read them in.
+
+When tesseract is run once over many images, its output has a page for each image, which is split back into the
+files for each image that a run over that image alone would have written."""
+
+import collections
+import os
+
+# Tesseract ends the text of each page with a form feed
+PAGE_SEPARATOR = "\f"
+
+# The level of the TSV rows that hold single words, the others being pages, blocks, paragraphs and lines
+WORD_LEVEL = 5
+
+TSV_COLUMNS = ("level", "page_num", "block_num", "par_num", "line_num", "word_num", "left", "top", "width", "height",
+               "conf", "text")
+
+OCRWord = collections.namedtuple("OCRWord", "text confidence left top width height block paragraph line")
+
+
+def parse_tsv(tsv):
+    """Get the list of OCRWords from tesseract's TSV output, in the order tesseract read them, skipping empty words
+    and any rows that can't be parsed."""
+    words = []
+    for row in tsv.split("\n")[1:]:
+        fields = row.split("\t")
+        if len(fields) != len(TSV_COLUMNS):
+            continue
+        text = fields[-1].strip()
+        if not text:
+            continue
+        try:
+            level, _, block, paragraph, line, _, left, top, width, height = (int(x) for x in fields[:10])
+            confidence = float(fields[10])
+        except ValueError:
+            continue
+        if level != WORD_LEVEL or confidence < 0:
+            continue
+        words.append(OCRWord(text, confidence, left, top, width, height, block, paragraph, line))
+    return words
+
+
+def format_tsv(words):
+    """Write OCRWords out in tesseract's TSV format, giving just the word rows."""
+    rows = ["\t".join(TSV_COLUMNS)]
+    for index, word in enumerate(words, 1):
+        rows.append("\t".join(str(x) for x in (WORD_LEVEL, 1, word.block, word.paragraph, word.line, index, word.left,
+                                                word.top, word.width, word.height, word.confidence, word.text)))
+    return "\n".join(rows) + "\n"
+
+
+def words_text(words):
+    """Lay out OCRWords as text in the way tesseract does, one line of text per line it found, with a blank line
+    between paragraphs."""
+    text = ""
+    previous = None
+    for word in words:
+        if previous is not None:
+            if (word.block, word.paragraph) != (previous.block, previous.paragraph):
+                text += "\n\n"
+            elif word.line != previous.line:
+                text += "\n"
+            else:
+                text += " "
+        text += word.text
+        previous = word
+    return text + "\n" if text else ""
+
+
+def black_threshold(image, threshold):
+    """Do the same as ImageMagick's -black-threshold, making every pixel darker than threshold percent black."""
+    result = image.copy()
+    result[image < threshold * 255 / 100] = 0
+    return result
+
+
+def split_batch_output(batch_base, output_bases):
+    """Split the text and TSV output of one tesseract run over a list of images into a .txt and .tsv file for each
+    image, at the output bases given in the same order as the list. Returns False, having written nothing, if the
+    output doesn't have a page for every image."""
+    try:
+        with open(f"{batch_base}.txt") as text_file:
+            text = text_file.read()
+        with open(f"{batch_base}.tsv") as tsv_file:
+            tsv = tsv_file.read()
+    except FileNotFoundError:
+        return False
+
+    pages = text.split(PAGE_SEPARATOR)
+    if pages[-1].strip():
+        return False
+    pages = pages[:-1]
+
+    header, *rows = tsv.rstrip("\n").split("\n")
+    page_rows = [[] for _ in output_bases]
+    for row in rows:
+        fields = row.split("\t")
+        try:
+            page = int(fields[1]) - 1
+        except (IndexError, ValueError):
+            continue
+        if not 0 <= page < len(page_rows):
+            return False
+        fields[1] = "1"
+        page_rows[page].append("\t".join(fields))
+
+    if len(pages) != len(output_bases) or not all(page_rows):
+        return False
+
+    # write the text last, as that's what marks an image as done
+    for output_base, page, page_tsv in zip(output_bases, pages, page_rows):
+        with open(f"{output_base}.tsv", "w") as tsv_file:
+            tsv_file.write("\n".join([header] + page_tsv) + "\n")
+        with open(f"{output_base}.txt", "w") as text_file:
+            text_file.write(page + PAGE_SEPARATOR)
+    return True
+
+
+def write_image_list(path, image_paths):
+    """Write the file listing the images for tesseract to read in one run."""
+    with open(path, "w") as list_file:
+        list_file.write("".join(os.path.abspath(x) + "\n" for x in image_paths))
@@ -0,0 +1,170 @@
+"""The stages of processing a project, and working out which of them need running.
+
+Each Stage names the stages it comes after, the items it works on, which are either the whole project or each image,
+and for each item the files it reads and the files it writes. When an item is done we record the size and
+modification time of the files it read in pipeline.json. An item is up to date if all its outputs exist and its
+inputs are the same as when it was last done, so running the stages again after a failure, or after some papers are
+added, only redoes the items whose inputs have changed or that never finished."""
+
+import json
+import os
+import time
+
+from forestplots import progress
+
+PIPELINE_FILENAME = "pipeline.json"
+
+# How often, in seconds, to save what's been done while a stage is running, so little is lost if we're killed
+SAVE_INTERVAL = 30
+
+# The item of a stage that works on the project as a whole
+PROJECT = ""
+
+
+class Stage():
+    """One step in processing a project.
+
+    run is called with each item that's out of date. inputs and outputs are called with an item and give the paths
+    of the files it reads and writes. items gives the list of items, defaulting to just the project as a whole.
+    prepare, if given, is called with the list of out of date items before any are run, and finish is called once
+    they're done, even if one failed."""
+
+    def __init__(self, name, after, run, inputs, outputs, items=None, prepare=None, finish=None):
+        self.name = name
+        self.after = after
+        self.run = run
+        self.inputs = inputs
+        self.outputs = outputs
+        self.items = items if items is not None else lambda: [PROJECT]
+        self.prepare = prepare
+        self.finish = finish
+
+
+def fingerprint(paths):
+    """Get the size and modification time of each of a list of files or directories that exists."""
+    prints = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        prints[path] = [stat.st_size if not os.path.isdir(path) else 0, stat.st_mtime_ns]
+    return prints
+
+
+def stages_by_name(stages):
+    """Key a list of stages by their names, keeping their order."""
+    by_name = {}
+    for stage in stages:
+        if stage.name in by_name:
+            raise ValueError(f"Two stages are called {stage.name}")
+        by_name[stage.name] = stage
+    return by_name
+
+
+class Pipeline():
+    """The stages of processing a project, and a record of which items of each are up to date."""
+
+    def __init__(self, project_directory, stages):
+        self.project_directory = project_directory
+        self.stages = stages_by_name(stages)
+        self.path = os.path.join(project_directory, PIPELINE_FILENAME)
+        self.stamps = {}
+
+    def load(self):
+        """Read the record of what's been done from an earlier run."""
+        try:
+            with open(self.path) as stamps_file:
+                self.stamps = json.load(stamps_file)
+        except (FileNotFoundError, ValueError):
+            self.stamps = {}
+
+    def save(self):
+        """Write the record of what's been done, replacing the file in one step so it's never left half written."""
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as stamps_file:
+            json.dump(self.stamps, stamps_file)
+        os.replace(temp_path, self.path)
+
+    def order(self, names=None):
+        """Get the named stages, or all of them, in an order that puts each after the stages it comes after. Raises
+        ValueError for an unknown stage."""
+        if names is None:
+            names = list(self.stages)
+        for name in names:
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage {name}")
+
+        ordered = []
+        visiting = set()
+
+        def visit(name):
+            if name in ordered:
+                return
+            if name in visiting:
+                raise ValueError(f"Stage {name} comes after itself")
+            visiting.add(name)
+            for before in self.stages[name].after:
+                visit(before)
+            visiting.discard(name)
+            ordered.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return [self.stages[name] for name in ordered if name in names]
+
+    def _relative(self, prints):
+        """Key a fingerprint by paths relative to the project, so the project can be moved."""
+        return {os.path.relpath(path, self.project_directory): value for path, value in prints.items()}
+
+    def up_to_date(self, stage, item):
+        """Check whether an item of a stage has all its outputs, and its inputs haven't changed since it was done."""
+        stamp = self.stamps.get(stage.name, {}).get(item)
+        if stamp is None:
+            return False
+        if not all(os.path.exists(path) for path in stage.outputs(item)):
+            return False
+        return stamp == self._relative(fingerprint(stage.inputs(item)))
+
+    def stale_items(self, stage, items=None):
+        """Get the items of a stage that need doing, out of all of them or those given."""
+        if items is None:
+            items = stage.items()
+        return [item for item in items if not self.up_to_date(stage, item)]
+
+    def run(self, names=None):
+        """Run the out of date items of the named stages, or of all of them. The stages before those named are
+        assumed to be done."""
+        self.load()
+        for stage in self.order(names):
+            items = stage.items()
+            stale = self.stale_items(stage, items)
+            progress.log(f"{stage.name}: {len(stale)} of {len(items)} to do")
+
+            stamps = self.stamps.setdefault(stage.name, {})
+            # forget items that no longer exist, such as images removed from the project
+            for item in set(stamps) - set(items):
+                del stamps[item]
+            saved = time.monotonic()
+            # stages over the whole project report their own progress, if they have any to report
+            per_item = items != [PROJECT]
+            try:
+                if stale and stage.prepare is not None:
+                    stage.prepare(stale)
+                if per_item:
+                    progress.start(stage.name, len(stale),
+                                   status_path=os.path.join(self.project_directory, progress.STATUS_FILENAME))
+                for item in stale:
+                    stamps.pop(item, None)
+                    stage.run(item)
+                    stamps[item] = self._relative(fingerprint(stage.inputs(item)))
+                    progress.advance()
+                    if time.monotonic() - saved > SAVE_INTERVAL:
+                        self.save()
+                        saved = time.monotonic()
+            finally:
+                if per_item:
+                    progress.finish()
+                if stage.finish is not None:
+                    stage.finish()
+                self.save()
@@ -1,76 +1,320 @@
 """Module containing plot management."""
 
+import concurrent.futures
+import contextlib
 import os
 import re
+import subprocess
+import tempfile
+import threading
+import time
 
-import openpyxl
+# cv2 and openpyxl are imported where they're used, so that decoding OCR text doesn't wait for them to load
 
-from forestplots.helpers import forgiving_float, sanity_check_values
-
-TABLE_VALUE_SPLIT_RE = re.compile(r'([-—~]{0,1}\d+[.,: ]\d*\s*[/\[\({][-—~]{0,1}\d+[.,: ]\d*\s*[.,]\s*[-—~]{0,1}\d+[.,: ]\d*[\]}\)]|\(Excluded\))')
-TABLE_VALUE_GROK_RE = re.compile(r'([-—~]{0,1}\d+[.,: ]\d*)\s*[/\[\({]([-—~]{0,1}\d+[.,: ]\d*)\s*[.,]\s*([-—~]{0,1}\d+[.,: ]\d*)[\]}\)]')
+from forestplots.helpers import forgiving_float, normalize_ocr, sanity_check_values, weighted_vote
+from forestplots.ocr import black_threshold, parse_tsv, split_batch_output, write_image_list
+from forestplots import probe
+from forestplots import progress
+from forestplots.tableparser import find_table_values
 
 NAME_RE = re.compile(r'^image\.([\d\.]+)_.*$')
 
+# The black thresholds, as percentages, at which we OCR each region of a plot
+THRESHOLDS = range(50, 80, 2)
+
+# The most seconds any one convert or tesseract call may take
+OCR_TIMEOUT = 60.0
+try:
+    OCR_TIMEOUT = float(os.environ["FORESTPLOT_OCR_TIMEOUT"])
+except KeyError:
+    pass
+
+# How many thresholds of a region to OCR at once with a single tesseract call when a decoder asks for one that's
+# not been done yet. Decoders that always read every threshold ask for them all at once.
+OCR_BATCH_SIZE = 4
+try:
+    OCR_BATCH_SIZE = int(os.environ["FORESTPLOT_OCR_BATCH"])
+except KeyError:
+    pass
+
+# The most seconds we'll spend running OCR on one plot, after which we decode whatever text we already have
+PLOT_BUDGET = 600.0
+try:
+    PLOT_BUDGET = float(os.environ["FORESTPLOT_PLOT_BUDGET"])
+except KeyError:
+    pass
+
+# Whether to OCR the regions of a plot at the same time, each on its own thread, rather than one after another as the
+# decoders get to them. This makes a single plot quicker on a machine with cores to spare, but does OCR the decoders
+# might not have needed, so is best left off when processing many plots at once.
+CONCURRENT_REGIONS = False
+try:
+    CONCURRENT_REGIONS = os.environ["FORESTPLOT_CONCURRENT_REGIONS"] == "yes"
+except KeyError:
+    pass
+
+# How far ahead, in votes from fully confident readings, every cell of a table must be before we stop reading it at
+# more thresholds
+VOTE_MARGIN = 1.5
+
+# How many readings must agree on the number of rows in a table before we stop reading it at more thresholds, as light
+# thresholds often lose the last rows and a longer reading throws away everything read before it
+SETTLED_PASSES = 3
+
 class InvalidForestPlot(Exception):
     """Raised if during processing we realise this isn't a valid forest plot."""
 
+class PrefetchCancelled(subprocess.TimeoutExpired):
+    """Raised on a prefetch thread when its OCR command was killed, or not started, because the prefetch was
+    cancelled. It's a TimeoutExpired so that whatever the command was writing is cleaned up as for one that timed
+    out."""
+
+class RegionPrefetch():
+    """OCRs each region of a plot on its own thread, working through the thresholds in the order the decoders read
+    them, so that by the time a decoder asks for a region's text it's already been read, once started. Decoders asking
+    for a threshold that's still being read wait for it. Once cancelled no more OCR is started, and any that's running
+    is killed."""
+
+    def __init__(self, plot, regions):
+        self.plot = plot
+        self.cancelled = threading.Event()
+        self.local = threading.local()
+        # the OCR commands running on our threads, and the lock held while starting or killing them
+        self.processes = set()
+        self.lock = threading.Lock()
+        # set once each threshold of each region has been read, or won't be
+        self.ready = {region: {x: threading.Event() for x in plot.sweep_thresholds(region)} for region in regions}
+        self.executor = concurrent.futures.ThreadPoolExecutor(len(regions), thread_name_prefix="region")
+        self.futures = []
+
+    def start(self):
+        """Start reading the regions, which should be once the plot's prefetch is set so our threads run their OCR
+        through us."""
+        self.futures = [self.executor.submit(self._read_region, region) for region in self.ready]
+
+    def _read_region(self, region):
+        self.local.prefetching = True
+        thresholds = self.plot.sweep_thresholds(region)
+        try:
+            for start in range(0, len(thresholds), OCR_BATCH_SIZE):
+                if self.cancelled.is_set():
+                    break
+                batch = thresholds[start:start + OCR_BATCH_SIZE]
+                try:
+                    self.plot._prefetch_ocr(region, batch) # pylint: disable=protected-access
+                finally:
+                    for threshold in batch:
+                        self.ready[region][threshold].set()
+        except (InvalidForestPlot, subprocess.TimeoutExpired):
+            # the region's missing or the plot's out of time, either of which the decoder will find for itself
+            pass
+        finally:
+            for event in self.ready[region].values():
+                event.set()
+
+    def prefetching(self):
+        """Check whether we're on one of our own threads."""
+        return getattr(self.local, "prefetching", False)
+
+    def run(self, command, timeout, stdin=None):
+        """Run an OCR command for one of our threads as subprocess.run would, but so that cancelling kills it.
+        Raises PrefetchCancelled if it was killed or we'd already been cancelled."""
+        with self.lock:
+            if self.cancelled.is_set():
+                raise PrefetchCancelled(command, 0)
+            process = subprocess.Popen(command, stdin=None if stdin is None else subprocess.PIPE,
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            self.processes.add(process)
+        try:
+            stdout, stderr = process.communicate(stdin, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise
+        finally:
+            with self.lock:
+                self.processes.discard(process)
+        if self.cancelled.is_set():
+            raise PrefetchCancelled(command, timeout)
+        return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+    def wait(self, region, thresholds):
+        """Wait until the given thresholds of a region have been read, unless called from one of our own threads."""
+        if self.prefetching() or region not in self.ready:
+            return
+        for threshold in thresholds:
+            if threshold in self.ready[region]:
+                self.ready[region][threshold].wait()
+
+    def cancel(self):
+        """Stop starting more OCR and kill whatever is running, then wait for our threads to clean up after it so
+        nothing is written afterwards."""
+        with self.lock:
+            self.cancelled.set()
+            for process in self.processes:
+                process.kill()
+        for future in self.futures:
+            future.cancel()
+        self.executor.shutdown(wait=True)
+
+
 class Table():
     """Representing the data of a single table."""
 
     def __init__(self):
         self.table_data = []
+        self.confidences = []
         self.title_list = []
+        self.title_confidences = []
         self.metadata = {}
 
-    def add_data(self, data):
-        """Adds more data about the table."""
+        # The number of rows of each reading added, with the mean confidence of its rows, to vote on how many rows
+        # the table really has. This is only needed while reading the table, so isn't saved.
+        self.row_counts = []
+
+        # How many thresholds the table was read at, whether or not each reading decoded. SPSS tables stop being read
+        # once the vote is settled, Stata tables are read at every threshold.
+        self.passes = 0
+
+    def add_data(self, data, confidences=None):
+        """Adds more data about the table, as read at one threshold, optionally with a confidence between 0 and 1
+        for each row, which weights its vote."""
         if not data:
             raise ValueError
+        if confidences is None:
+            confidences = [1.0] * len(data)
+        self.row_counts.append((len(data), sum(confidences) / len(confidences)))
         if not self.table_data:
             self.table_data = [data]
+            self.confidences = [confidences]
         else:
             if len(self.table_data[0]) == len(data):
                 self.table_data.append(data)
+                self.confidences.append(confidences)
             elif len(self.table_data[0]) < len(data):
                 self.table_data = [data]
+                self.confidences = [confidences]
+
+    def _cell_votes(self):
+        """Get the Vote for each cell of the table, as a list of rows."""
+        votes = []
+        for i in range(len(self.table_data[0])):
+            row = []
+            for datum in range(len(self.table_data[0][i])):
+                row.append(weighted_vote((table[i][datum], weights[i])
+                                         for table, weights in zip(self.table_data, self.confidences)))
+            votes.append(row)
+        return votes
 
     def collapse_data(self):
-        """Takes the mode of all the table data entered and returns it as a single table."""
+        """Takes the confidence weighted mode of each cell of all the table data entered and returns it as a single
+        table."""
+        if not self.table_data:
+            return []
+        return [tuple(vote.winner for vote in row) for row in self._cell_votes()]
 
+    def agreement(self):
+        """Get the fraction of the vote that the collapsed value of each cell got, as a list of rows."""
         if not self.table_data:
             return []
-        if len(self.table_data) == 1:
-            return self.table_data[0]
+        return [tuple(vote.agreement for vote in row) for row in self._cell_votes()]
 
-        mode_data = []
-        for i in range(len(self.table_data[0])):
-            final_row = []
-            for datum in range(len(self.table_data[0][i])):
-                data = []
-                for table in self.table_data:
-                    data.append(table[i][datum])
-                mode = max(set(data), key=data.count)
-                final_row.append(mode)
-            mode_data.append(tuple(final_row))
-        return mode_data
-
-    def add_title(self, title):
+    def settled(self, margin, passes=SETTLED_PASSES):
+        """Check whether at least the given number of readings agree on the number of rows, which is ahead of any
+        other by at least the margin, and every cell's collapsed value is ahead of any other reading by at least the
+        margin, in which case more readings are unlikely to change the table."""
+        if not self.table_data:
+            return False
+        rows = len(self.table_data[0])
+        if sum(1 for count, _ in self.row_counts if count == rows) < passes:
+            return False
+        row_vote = weighted_vote(self.row_counts)
+        if row_vote.winner != rows or row_vote.margin < margin:
+            return False
+        return all(vote.margin >= margin for row in self._cell_votes() for vote in row)
+
+    def add_title(self, title, confidence=1.0):
         if title:
             self.title_list.append(title)
+            self.title_confidences.append(confidence)
 
     def collapse_titles(self):
         try:
-            return max(set(self.title_list), key=self.title_list.count)
+            return weighted_vote(zip(self.title_list, self.title_confidences)).winner
         except ValueError:
             return ""
 
+    def dump(self):
+        """Creates a JSON compatible dictionary of the table contents."""
+        return {
+            "table_data": self.table_data,
+            "confidences": self.confidences,
+            "title_list": self.title_list,
+            "title_confidences": self.title_confidences,
+            "metadata": self.metadata,
+            "passes": self.passes,
+        }
+
+    @staticmethod
+    def load(state):
+        """Recreates a table from the output of dump."""
+        table = Table()
+        table.table_data = [[tuple(row) for row in data] for data in state["table_data"]]
+        table.confidences = state.get("confidences", [[1.0] * len(data) for data in table.table_data])
+        table.title_list = [tuple(x) if isinstance(x, list) else x for x in state["title_list"]]
+        table.title_confidences = state.get("title_confidences", [1.0] * len(table.title_list))
+        table.metadata = state["metadata"]
+        table.passes = state.get("passes", 0)
+        return table
+
 class ForestPlot():
     """Represents a single forest plot image held within a ctree."""
 
-    def __init__(self, image_directory, projections):
+    # Short name for the type of plot, as used to mark the image directory
+    PLOT_TYPE = None
+
+    # The regions break_up_image crops the plot into, each saved as raw.{region}.png
+    REGIONS = ()
+
+    # The small regions of the plot that are worth OCRing in batches along with those of other plots
+    MONTAGE_REGIONS = ()
+
+    # The region that decides whether an image is a plot, which the probe reads first, and a pattern matching text
+    # that could have been read from that region of a plot, however badly
+    PROBE_REGION = None
+    PROBE_RE = None
+
+    # Tuples of regions whose readings at each threshold are matched up with each other, and so must be read at the
+    # same thresholds
+    SHARED_THRESHOLDS = ()
+
+    def __init__(self, image_directory, projections, replay=False):
         self.image_directory = image_directory
 
+        # In replay mode we only decode the OCR text already on disk, we never run convert or tesseract
+        self.replay = replay
+
+        self.ocr_timeout = OCR_TIMEOUT
+        self.concurrent_regions = CONCURRENT_REGIONS
+        self.prefetch = None
+
+        # the ThresholdProfile giving the order to read the thresholds of each region in, if any
+        self.threshold_profile = None
+        # whether this plot reads every threshold to help the profile learn, decided when first asked
+        self.exploring = None
+        # the thresholds whose readings won the vote for each region
+        self.winning_thresholds = {}
+
+        self.use_probe = probe.USE_PROBE
+        self.probe_thresholds = probe.THRESHOLDS
+        self.probe_outcome = None
+        self.probe_seconds = 0.0
+        # how long reading the decisive region took after the probe passed
+        self.sweep_seconds = None
+        self.deadline = time.monotonic() + PLOT_BUDGET
+        self.budget_exhausted = False
+        self.ocr_timeouts = 0
+
         self.summary = {}
         self.hetrogeneity = {}
         self.overall_effect = {}
@@ -88,6 +332,261 @@ class ForestPlot():
         """Splits the forest plot image into sub-images required for OCR."""
         raise NotImplementedError
 
+    def _raw_image(self):
+        """Get the whole plot image, in greyscale."""
+        import cv2 # pylint: disable=import-outside-toplevel
+        return cv2.imread(os.path.join(self.image_directory, "raw.png"), cv2.IMREAD_GRAYSCALE)
+
+    def _save_region(self, region, image):
+        """Keep the sub-image for a region, to be OCRed."""
+        import cv2 # pylint: disable=import-outside-toplevel
+        cv2.imwrite(os.path.join(self.image_directory, f"raw.{region}.png"), image)
+
+    def _region_image_path(self, region):
+        """Get the path of the sub-image for a region, raising InvalidForestPlot if it's not there."""
+        image_path = os.path.join(self.image_directory, f"raw.{region}.png")
+        if not os.path.isfile(image_path):
+            raise InvalidForestPlot
+        return image_path
+
+    def _profile_regions(self, region):
+        """Get the regions whose profiles decide the thresholds a region is read at."""
+        for regions in self.SHARED_THRESHOLDS:
+            if region in regions:
+                return regions
+        return region
+
+    def _exploring(self):
+        """Check whether this plot is one of those the profile has read every threshold of."""
+        if self.exploring is None:
+            self.exploring = self.threshold_profile is not None and self.threshold_profile.explore(self.PLOT_TYPE)
+        return self.exploring
+
+    def sweep_thresholds(self, region):
+        """Get the thresholds to read a region at, in the order to read them. This is from lightest to darkest unless
+        we have a profile of the thresholds that have won the region for other plots."""
+        if self.threshold_profile is None:
+            return list(THRESHOLDS)
+        return self.threshold_profile.order(self.PLOT_TYPE, self._profile_regions(region), THRESHOLDS,
+                                            prune=not self._exploring())
+
+    def _read_every_threshold(self, region):
+        """Check whether a decoder that stops at the first threshold that reads should go on through the rest, so
+        that every one that reads can be counted. That's when replaying, where reading costs nothing, while the
+        profile is still learning the region, and for the plots it explores with."""
+        if self.replay:
+            return True
+        profile = self.threshold_profile
+        return profile is not None and (not profile.trained(self.PLOT_TYPE, region) or self._exploring())
+
+    def _record_winners(self, region, thresholds):
+        """Note the thresholds whose readings won the vote for a region."""
+        thresholds = sorted(set(thresholds))
+        if thresholds:
+            self.winning_thresholds[region] = thresholds
+
+    @staticmethod
+    def _closest_readings(readings, collapsed, columns=slice(None)):
+        """Get the thresholds whose reading of a table, as a list of rows, agrees with the collapsed table in the
+        most cells, only comparing the given columns."""
+        scores = {}
+        for threshold, rows in readings.items():
+            if len(rows) == len(collapsed):
+                scores[threshold] = sum(a == b for row, winner in zip(rows, collapsed)
+                                        for a, b in zip(row[columns], winner[columns]))
+        best = max(scores.values(), default=0)
+        return [threshold for threshold, score in scores.items() if score == best and best > 0]
+
+    def probing(self):
+        """Check whether the decisive region will be probed before it's read in full."""
+        return self.use_probe and not self.replay and self.PROBE_REGION is not None and bool(self.probe_thresholds)
+
+    def probe_read_thresholds(self):
+        """Get the thresholds the probe reads the decisive region at."""
+        # once the profile has learnt which thresholds read the region best, we probe at as many of those
+        thresholds = self.probe_thresholds
+        if self.threshold_profile is not None and self.threshold_profile.trained(self.PLOT_TYPE, self.PROBE_REGION):
+            thresholds = self.sweep_thresholds(self.PROBE_REGION)[:len(thresholds)]
+        return list(thresholds)
+
+    def _probe(self):
+        """Read the decisive region at the probe thresholds, raising InvalidForestPlot if nothing read looks like it
+        came from a plot. If nothing could be read at all, as when OCR times out, we can't tell, so we carry on."""
+        if not self.probing():
+            return
+        thresholds = self.probe_read_thresholds()
+
+        start = time.monotonic()
+        self._region_image_path(self.PROBE_REGION)
+        self._ocr_batch(self.PROBE_REGION, thresholds)
+        texts = [self._ocr(self.PROBE_REGION, x) for x in thresholds]
+        self.probe_seconds = time.monotonic() - start
+
+        texts = [normalize_ocr(x).text for x in texts if x is not None]
+        if texts and not any(self.PROBE_RE.search(x) for x in texts):
+            self.probe_outcome = probe.REJECTED
+            raise InvalidForestPlot
+        self.probe_outcome = probe.PASSED
+
+    def _timed_sweep(self, process_region):
+        """Run the decoder of the decisive region, timing it if the probe passed so we know what the probe saves."""
+        start = time.monotonic()
+        process_region()
+        if self.probe_outcome == probe.PASSED:
+            self.sweep_seconds = time.monotonic() - start
+
+    @contextlib.contextmanager
+    def _regions_read_concurrently(self):
+        """While the decoders run in the body of the with statement, OCR every region at once if concurrent region
+        OCR is on. On leaving, including when a decoder raises InvalidForestPlot, any OCR still running or not
+        yet started is cancelled, so a plot rejected on its first region costs little more than it would otherwise."""
+        if not self.concurrent_regions or self.replay or not self.REGIONS:
+            yield
+            return
+        self.prefetch = RegionPrefetch(self, self.REGIONS)
+        self.prefetch.start()
+        try:
+            yield
+        finally:
+            self.prefetch.cancel()
+            self.prefetch = None
+
+    def _await_prefetch(self, region, thresholds):
+        """Wait for the thresholds of a region being read concurrently, if any, so they're not read twice."""
+        prefetch = self.prefetch
+        if prefetch is not None:
+            prefetch.wait(region, thresholds)
+
+    def _prefetch_ocr(self, region, thresholds):
+        """OCR a region at some thresholds ahead of the decoders asking for them."""
+        self._ocr_batch(region, thresholds)
+        for threshold in thresholds:
+            self._ocr_output(region, threshold, "txt")
+
+    def _ocr(self, region, threshold):
+        """Get the OCR text for a region of the plot at the given black threshold, running convert and tesseract to
+        generate it if we don't already have it. Returns None if no text is available, which includes when OCR timed
+        out or the plot's time budget has run out."""
+        output_ocr_name = self._ocr_output(region, threshold, "txt")
+        try:
+            with open(output_ocr_name) as ocr_file:
+                return ocr_file.read()
+        except FileNotFoundError:
+            return None
+
+    def _ocr_words(self, region, threshold):
+        """Get the list of OCRWords, with their boxes and confidences, for a region of the plot at the given black
+        threshold, running OCR if need be as for _ocr. Returns None if no words are available, which includes plots
+        processed before we kept tesseract's TSV output."""
+        output_tsv_name = self._ocr_output(region, threshold, "tsv")
+        try:
+            with open(output_tsv_name) as tsv_file:
+                return parse_tsv(tsv_file.read())
+        except FileNotFoundError:
+            return None
+
+    def _pass_confidence(self, region, threshold):
+        """Get the mean confidence, between 0 and 1, of the words OCR read in a region at a threshold, or 1 if we
+        don't know it."""
+        words = self._ocr_words(region, threshold)
+        if not words:
+            return 1.0
+        return sum(word.confidence for word in words) / (100.0 * len(words))
+
+    def _ocr_output(self, region, threshold, extension):
+        """Get the path of one of tesseract's output files for a region at a threshold, having run convert and
+        tesseract to make it if it's not there and we're not in replay mode."""
+        self._await_prefetch(region, [threshold])
+        output_base = os.path.join(self.image_directory, f"{region}.{threshold}")
+        output_name = f"{output_base}.{extension}"
+        if os.path.isfile(output_name) or self.replay:
+            return output_name
+
+        # do this and the next few thresholds together, as the decoders usually go on to ask for them
+        order = self.sweep_thresholds(region)
+        self._ocr_batch(region, order[order.index(threshold):][:OCR_BATCH_SIZE] if threshold in order else [threshold])
+        if os.path.isfile(output_name):
+            return output_name
+
+        output_image_name = f"{output_base}.png"
+        outputs = [output_image_name, f"{output_base}.txt", f"{output_base}.tsv"]
+        existing = [x for x in outputs if os.path.isfile(x)]
+        try:
+            if not os.path.isfile(output_image_name):
+                self._run_ocr_command(["convert", "-black-threshold", f"{threshold}%",
+                                       self._region_image_path(region), output_image_name])
+            # we could use -c preserve_interword_spaces=1
+            self._run_ocr_command(["tesseract", output_image_name, output_base, "txt", "tsv"])
+        except subprocess.TimeoutExpired:
+            # don't leave half written files around to be mistaken for finished ones on the next run
+            for path in outputs:
+                if path in existing:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return output_name
+
+    def _ocr_batch(self, region, thresholds):
+        """OCR a region at many thresholds with a single tesseract call, for the thresholds that don't have OCR text
+        yet, splitting its output back into the text and TSV files for each threshold. If this fails for any reason
+        then the thresholds are left to be OCRed one at a time."""
+        if self.replay:
+            return
+        self._await_prefetch(region, thresholds)
+        pending = [x for x in thresholds if not os.path.isfile(os.path.join(self.image_directory, f"{region}.{x}.txt"))]
+        if len(pending) < 2:
+            return
+        import cv2 # pylint: disable=import-outside-toplevel
+        try:
+            image = cv2.imread(self._region_image_path(region), cv2.IMREAD_GRAYSCALE)
+        except InvalidForestPlot:
+            return
+        if image is None:
+            return
+
+        output_bases = [os.path.join(self.image_directory, f"{region}.{x}") for x in pending]
+        for threshold, output_base in zip(pending, output_bases):
+            if not os.path.isfile(f"{output_base}.png"):
+                cv2.imwrite(f"{output_base}.png", black_threshold(image, threshold))
+
+        with tempfile.TemporaryDirectory() as temp_directory:
+            list_path = os.path.join(temp_directory, "images.txt")
+            write_image_list(list_path, [f"{x}.png" for x in output_bases])
+            batch_base = os.path.join(temp_directory, "batch")
+            try:
+                self._run_ocr_command(["tesseract", list_path, batch_base, "txt", "tsv"], len(pending))
+            except subprocess.TimeoutExpired:
+                return
+            split_batch_output(batch_base, output_bases)
+
+    def _run_ocr_command(self, command, images=1, stdin=None):
+        """Run convert or tesseract, killing it if it takes longer than the OCR timeout for each image it's working
+        on or the rest of the plot's budget, optionally giving it bytes on its standard input. Returns the
+        CompletedProcess. Raises subprocess.TimeoutExpired if it was killed, or if the budget has already run
+        out."""
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            self.budget_exhausted = True
+            raise subprocess.TimeoutExpired(command, 0)
+        timeout = self.ocr_timeout * images
+        if command[0] == "tesseract":
+            progress.ocr_call()
+        prefetch = self.prefetch
+        try:
+            if prefetch is not None and prefetch.prefetching():
+                return prefetch.run(command, min(timeout, remaining), stdin)
+            return subprocess.run(command, input=stdin, capture_output=True, timeout=min(timeout, remaining))
+        except PrefetchCancelled:
+            raise
+        except subprocess.TimeoutExpired:
+            if timeout < remaining:
+                self.ocr_timeouts += 1
+            else:
+                self.budget_exhausted = True
+            raise
+
     def add_summary_information(self, estimator_type=None, model_type=None, confidence_interval=None):
         """Add summary information about the forest plot."""
         if estimator_type:
@@ -115,21 +614,18 @@ class ForestPlot():
     @staticmethod
     def _decode_table_values_ocr(ocr_prose):
 
-        # Fix some common number replacements in OCR
-        ocr_prose = ocr_prose.replace('§', '5').replace('$', '5').replace('£', '[-')
-
-        parts = TABLE_VALUE_SPLIT_RE.split(ocr_prose)
         values = []
-        for part in parts:
+        for _, _, groups in find_table_values(normalize_ocr(ocr_prose).text):
+            if groups is None:
+                values.append(("Excluded", "Excluded", "Excluded"))
+                continue
             try:
-                groups = TABLE_VALUE_GROK_RE.match(part).groups()
                 value = (forgiving_float(groups[0]), forgiving_float(groups[1]), forgiving_float(groups[2]))
                 value = sanity_check_values(value)
 
                 values.append(value)
-            except (AttributeError, ValueError):
-                if part == "(Excluded)":
-                    values.append(("Excluded", "Excluded", "Excluded"))
+            except ValueError:
+                continue
         return values
 
     def is_valid(self):
@@ -139,8 +635,24 @@ class ForestPlot():
     def _write_data_to_worksheet(self, worksheet):
         raise NotImplementedError
 
+    @staticmethod
+    def _write_agreement_to_worksheet(worksheet, table, count):
+        """Writes how much the readings at each threshold agreed on each cell of a table, and how many threshold
+        passes were read, starting at the given row. Returns the next free row."""
+        worksheet.cell(row=count, column=1, value="Agreement:")
+        for scores in table.agreement():
+            for column, score in enumerate(scores, 2):
+                worksheet.cell(row=count, column=column, value=round(score, 2))
+            count += 1
+        count = count + 1
+
+        worksheet.cell(row=count, column=1, value="Threshold passes:")
+        worksheet.cell(row=count, column=2, value=table.passes)
+        return count + 1
+
     def save(self):
         """Writes the plot to an excel worksheet."""
+        import openpyxl # pylint: disable=import-outside-toplevel
         workbook = openpyxl.Workbook()
         worksheet = workbook.active
         worksheet.title = "Summary"
@@ -152,3 +664,42 @@ class ForestPlot():
     def json_repr(self):
         """Creates a JSON compatible dictionary representation."""
         raise NotImplementedError
+
+    def dump(self):
+        """Creates a JSON compatible dictionary of everything decoded from the plot, which load can restore."""
+        state = {
+            "type": self.PLOT_TYPE,
+            "summary": self.summary,
+            "hetrogeneity": self.hetrogeneity,
+            "overall_effect": self.overall_effect,
+            "tables": [x.dump() for x in self.table_list],
+            "winning_thresholds": self.winning_thresholds,
+        }
+        for name in ("mid_point", "group_a", "group_b"):
+            try:
+                state[name] = getattr(self, name)
+            except AttributeError:
+                pass
+        return state
+
+    @staticmethod
+    def load(image_directory, state):
+        """Recreates a plot of the appropriate subclass from the output of dump."""
+        for cls in ForestPlot.__subclasses__():
+            if cls.PLOT_TYPE == state["type"]:
+                break
+        else:
+            raise ValueError(f"Unknown plot type {state['type']}")
+
+        plot = cls(image_directory, None, replay=True)
+        plot.summary = state["summary"]
+        plot.hetrogeneity = state["hetrogeneity"]
+        plot.overall_effect = state["overall_effect"]
+        plot.table_list = [Table.load(x) for x in state["tables"]]
+        plot.winning_thresholds = state.get("winning_thresholds", {})
+        for name in ("mid_point", "group_a", "group_b"):
+            try:
+                setattr(plot, name, state[name])
+            except KeyError:
+                pass
+        return plot
@@ -0,0 +1,94 @@
+"""Rejecting images that aren't plots before reading them in full, and counting how much time that saves.
+
+Most images that look like plots to the line detection turn out not to be, which is only found once the region that
+decides it, such as the footer of an SPSS plot, has been read at every threshold. So first that region is read at
+just the probe thresholds, and if nothing read looks like it came from a plot, the plot is rejected there and then.
+Plots that pass go on to the full sweep.
+
+For each plot that passes we time the rest of the sweep of its decisive region. The time saved is estimated as the
+average of those times for each plot the probe rejected."""
+
+import json
+import os
+
+# Whether to probe plots before the full sweep
+USE_PROBE = True
+try:
+    USE_PROBE = os.environ["FORESTPLOT_PROBE"] == "yes"
+except KeyError:
+    pass
+
+# The black thresholds, as percentages, the probe reads at, from the middle of the range where most plots read well
+THRESHOLDS = (60, 66)
+try:
+    THRESHOLDS = tuple(int(x) for x in os.environ["FORESTPLOT_PROBE_THRESHOLDS"].split(",") if x.strip())
+except KeyError:
+    pass
+
+STATS_FILENAME = "probe.json"
+
+PASSED = "passed"
+REJECTED = "rejected"
+
+
+class ProbeStats():
+    """Counts the plots the probe passed and rejected over a run, and the time it took and saved."""
+
+    def __init__(self):
+        self.plots = 0
+        self.probed = 0
+        self.rejected = 0
+        self.probe_seconds = 0.0
+        self.sweep_seconds = []
+
+    def add(self, plot):
+        """Count a plot that has been processed, whether or not it was valid."""
+        self.plots += 1
+        if plot.probe_outcome is None:
+            return
+        self.probed += 1
+        self.probe_seconds += plot.probe_seconds
+        if plot.probe_outcome == REJECTED:
+            self.rejected += 1
+        elif plot.sweep_seconds is not None:
+            self.sweep_seconds.append(plot.sweep_seconds)
+
+    def rejection_rate(self):
+        """Get the fraction of the plots probed that were rejected, or None if none were."""
+        return self.rejected / self.probed if self.probed else None
+
+    def saved_seconds(self):
+        """Estimate the seconds of OCR saved by not sweeping the plots that were rejected, or None if no plot passed
+        to tell us how long a sweep takes."""
+        if not self.sweep_seconds:
+            return None
+        return self.rejected * sum(self.sweep_seconds) / len(self.sweep_seconds)
+
+    def summary(self):
+        """Get the counts as a JSON compatible dictionary."""
+        rate = self.rejection_rate()
+        saved = self.saved_seconds()
+        return {
+            "plots": self.plots,
+            "probed": self.probed,
+            "rejected": self.rejected,
+            "rejection_rate": round(rate, 3) if rate is not None else None,
+            "probe_seconds": round(self.probe_seconds, 1),
+            "mean_sweep_seconds": (round(sum(self.sweep_seconds) / len(self.sweep_seconds), 2)
+                                   if self.sweep_seconds else None),
+            "saved_seconds": round(saved, 1) if saved is not None else None,
+        }
+
+    def line(self):
+        """Describe the counts in a line."""
+        if not self.probed:
+            return f"Probe not run on any of {self.plots} plots"
+        saved = self.saved_seconds()
+        saving = (f"saving about {int(round(saved))}s of OCR" if saved is not None
+                  else "no plot passed to estimate the time saved from")
+        return (f"Probe rejected {self.rejected} of {self.probed} plots ({self.rejection_rate():.0%}) in "
+                f"{self.probe_seconds:.0f}s, {saving}")
+
+    def save(self, path):
+        with open(path, "w") as stats_file:
+            json.dump(self.summary(), stats_file, indent=4)
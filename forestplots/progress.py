@@ -0,0 +1,221 @@
+"""Reporting how far a run has got, how fast it's going and when it should finish.
+
+A run starts a Progress for each long step, giving the number of images it has to get through. As the images are
+done, whether one after another or by a pool of processes, the controller advances it, and the OCR code counts each
+tesseract call against it. Every so often a line is printed with the papers and images done, the rate at which
+images and OCR calls are going, the plots found and the expected time left, which is worked out from the rate over
+the last few minutes so that it follows changes of pace. The same numbers are kept in a JSON status file, which is
+replaced in one step so another process can poll it at any time. OCR calls can be counted from many threads at once,
+as when the regions of a plot are read concurrently.
+
+If nothing has been started, as when the decoders are used from the tests, advancing and counting do nothing."""
+
+import collections
+import json
+import os
+import tempfile
+import threading
+import time
+
+STATUS_FILENAME = "status.json"
+
+# How often, in seconds, to print a progress line and to rewrite the status file
+REPORT_INTERVAL = 30
+try:
+    REPORT_INTERVAL = float(os.environ["FORESTPLOT_PROGRESS_INTERVAL"])
+except KeyError:
+    pass
+STATUS_INTERVAL = 2
+
+# How many seconds back to look when working out the current rate
+RATE_WINDOW = 300
+
+_CURRENT = None
+
+
+def log(message):
+    """Print a line about what the run is doing, with the time."""
+    print(f"{time.strftime('%H:%M:%S')} {message}", flush=True)
+
+
+def format_duration(seconds):
+    """Format a number of seconds as hours, minutes and seconds."""
+    seconds = int(round(seconds))
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def status_line(status):
+    """Describe the state of progress given by a status dictionary, as kept in a status file, in a line."""
+    parts = [status["stage"]]
+    if status["papers"]["total"] is not None:
+        parts.append(f"{status['papers']['done']}/{status['papers']['total']} papers")
+    total = status["images"]["total"] if status["images"]["total"] is not None else "?"
+    parts.append(f"{status['images']['done']}/{total} images")
+    parts.append(f"{status['plots_found']} plots")
+    parts.append(f"{status['images_per_second'] * 60:.1f} images/min")
+    parts.append(f"{status['ocr_calls_per_second']:.1f} OCR calls/s")
+    eta = status["eta_seconds"]
+    parts.append(f"ETA {format_duration(eta)}" if eta is not None else "ETA unknown")
+    return ", ".join(parts)
+
+
+def load_status(path):
+    """Read a status file, returning None if it's missing or is being replaced."""
+    try:
+        with open(path) as status_file:
+            return json.load(status_file)
+    except (OSError, ValueError):
+        return None
+
+
+class Progress():
+    """Counts the images, papers and OCR calls done in one step of a run."""
+
+    def __init__(self, stage, images, papers=None, status_path=None, clock=time.monotonic):
+        self.stage = stage
+        self.images_total = images
+        self.papers_total = papers
+        self.status_path = status_path
+        self.clock = clock
+
+        self.images_done = 0
+        self.papers_done = 0
+        self.plots_found = 0
+        self.ocr_calls = 0
+        self.finished = False
+
+        self.started = self.clock()
+        self.started_at = time.time()
+        # (time, images done, OCR calls) now and then, for the rolling rates
+        self.samples = collections.deque([(self.started, 0, 0)])
+        self.last_report = self.started
+        self.last_status = None
+        # held while counting and writing the status file, which the threads reading regions concurrently all do
+        self.lock = threading.RLock()
+
+    def advance(self, images=1, plots=0, papers=0):
+        """Record that images have been done, and how many plots and whole papers they finished."""
+        with self.lock:
+            self.images_done += images
+            self.plots_found += plots
+            self.papers_done += papers
+            self._sample()
+            self._maybe_report()
+
+    def ocr_call(self, calls=1):
+        """Record that tesseract has been run."""
+        with self.lock:
+            self.ocr_calls += calls
+            self._maybe_report(print_line=False)
+
+    def _sample(self):
+        now = self.clock()
+        self.samples.append((now, self.images_done, self.ocr_calls))
+        # keep one sample older than the window, so the window is always covered
+        while len(self.samples) > 2 and self.samples[1][0] < now - RATE_WINDOW:
+            self.samples.popleft()
+
+    def rates(self):
+        """Get the images and OCR calls per second over the last few minutes."""
+        now = self.clock()
+        then, images, calls = self.samples[0]
+        if now <= then:
+            return 0.0, 0.0
+        return (self.images_done - images) / (now - then), (self.ocr_calls - calls) / (now - then)
+
+    def eta(self):
+        """Get the number of seconds the rest of the images should take, or None if we can't tell yet."""
+        if self.images_total is None:
+            return None
+        remaining = self.images_total - self.images_done
+        if remaining <= 0:
+            return 0.0
+        image_rate, _ = self.rates()
+        if image_rate <= 0:
+            return None
+        return remaining / image_rate
+
+    def status(self):
+        """Get the state of progress as a JSON compatible dictionary."""
+        image_rate, ocr_rate = self.rates()
+        eta = self.eta()
+        return {
+            "stage": self.stage,
+            "pid": os.getpid(),
+            "started": self.started_at,
+            "updated": time.time(),
+            "elapsed_seconds": round(self.clock() - self.started, 1),
+            "finished": self.finished,
+            "images": {"done": self.images_done, "total": self.images_total},
+            "papers": {"done": self.papers_done, "total": self.papers_total},
+            "plots_found": self.plots_found,
+            "ocr_calls": self.ocr_calls,
+            "images_per_second": round(image_rate, 3),
+            "ocr_calls_per_second": round(ocr_rate, 3),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+        }
+
+    def line(self):
+        """Describe the state of progress in a line."""
+        return status_line(self.status())
+
+    def write_status(self):
+        """Replace the status file, if there is one."""
+        if self.status_path is None:
+            return
+        with self.lock:
+            directory = os.path.dirname(os.path.abspath(self.status_path))
+            handle, temp_path = tempfile.mkstemp(dir=directory, prefix=".status.")
+            with os.fdopen(handle, "w") as status_file:
+                json.dump(self.status(), status_file, indent=4)
+            os.replace(temp_path, self.status_path)
+            self.last_status = self.clock()
+
+    def _maybe_report(self, print_line=True):
+        now = self.clock()
+        if print_line and now - self.last_report >= REPORT_INTERVAL:
+            log(self.line())
+            self.last_report = now
+        if self.last_status is None or now - self.last_status >= STATUS_INTERVAL:
+            self.write_status()
+
+    def finish(self):
+        """Print the final line and mark the status file finished."""
+        with self.lock:
+            self.finished = True
+            log(f"{self.line()}, took {format_duration(self.clock() - self.started)}")
+            self.write_status()
+
+
+def start(stage, images, papers=None, status_path=None):
+    """Start counting the progress of a step of the run, which becomes the one that advance and ocr_call count
+    against. Returns the Progress."""
+    global _CURRENT # pylint: disable=global-statement
+    _CURRENT = Progress(stage, images, papers, status_path)
+    _CURRENT.write_status()
+    return _CURRENT
+
+
+def current():
+    """Get the Progress being counted against, or None."""
+    return _CURRENT
+
+
+def advance(images=1, plots=0, papers=0):
+    """Record that images have been done, if progress is being counted."""
+    if _CURRENT is not None:
+        _CURRENT.advance(images, plots, papers)
+
+
+def ocr_call(calls=1):
+    """Record that tesseract has been run, if progress is being counted."""
+    if _CURRENT is not None:
+        _CURRENT.ocr_call(calls)
+
+
+def finish():
+    """Finish counting the progress of the current step."""
+    global _CURRENT # pylint: disable=global-statement
+    if _CURRENT is not None:
+        _CURRENT.finish()
+    _CURRENT = None
@@ -0,0 +1,119 @@
+"""Decode-only replay of forest plots from the OCR text already on disk.
+
+The decoded state of each plot is cached in plot-results.json in its image directory, stamped with a hash of the
+decoder source code and of the OCR output files. A replay reuses that cached state when neither has changed, and
+otherwise runs the decoders again over the `*.{threshold}.txt` and `*.{threshold}.tsv` files."""
+
+import hashlib
+import json
+import multiprocessing
+import os
+
+from forestplots.plots import ForestPlot, InvalidForestPlot
+from forestplots.spssplots import SPSSForestPlot
+from forestplots.stataplots import StataForestPlot
+from forestplots import progress
+
+# Modules whose source determines how OCR text is decoded. Changing any of these invalidates cached results.
+DECODER_MODULES = ["geometry.py", "helpers.py", "ocr.py", "plots.py", "spssplots.py", "stataplots.py",
+                   "tableparser.py"]
+
+DECODED_FILENAME = "plot-results.json"
+
+PLOT_CLASSES = {cls.PLOT_TYPE: cls for cls in (SPSSForestPlot, StataForestPlot)}
+
+_DECODER_VERSION = None
+
+
+def decoder_version():
+    """Get a hash of the decoder source code."""
+    global _DECODER_VERSION # pylint: disable=global-statement
+    if _DECODER_VERSION is None:
+        digest = hashlib.sha1()
+        package_directory = os.path.dirname(os.path.abspath(__file__))
+        for name in DECODER_MODULES:
+            with open(os.path.join(package_directory, name), "rb") as source:
+                digest.update(source.read())
+        _DECODER_VERSION = digest.hexdigest()
+    return _DECODER_VERSION
+
+
+def ocr_fingerprint(image_directory):
+    """Get a cheap fingerprint of the OCR text files for a plot, so we notice if they've been regenerated."""
+    digest = hashlib.sha1()
+    for name in sorted(x for x in os.listdir(image_directory) if x.endswith((".txt", ".tsv"))):
+        stat = os.stat(os.path.join(image_directory, name))
+        digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def decode_stamp(image_directory):
+    """Get the stamp that a cached decode must match to be reused."""
+    return f"{decoder_version()}:{ocr_fingerprint(image_directory)}"
+
+
+def plot_type(image_directory):
+    """Get the type of plot the image was classified as on an earlier run, or None."""
+    for name in PLOT_CLASSES:
+        if os.path.isfile(os.path.join(image_directory, f"{name}.png")):
+            return name
+    return None
+
+
+def load_decoded(image_directory):
+    """Get the cached decoded state for a plot if it's still current. Returns a (found, state) tuple, where state is
+    None if the image was found not to be a valid plot."""
+    try:
+        with open(os.path.join(image_directory, DECODED_FILENAME)) as decoded_file:
+            cached = json.load(decoded_file)
+    except (FileNotFoundError, ValueError):
+        return False, None
+    if cached.get("stamp") != decode_stamp(image_directory):
+        return False, None
+    return True, cached.get("plot")
+
+
+def save_decoded(image_directory, plot):
+    """Cache the decoded state of a plot, or that it wasn't a valid plot if plot is None."""
+    cached = {
+        "stamp": decode_stamp(image_directory),
+        "plot": plot.dump() if plot is not None else None,
+    }
+    with open(os.path.join(image_directory, DECODED_FILENAME), "w") as decoded_file:
+        json.dump(cached, decoded_file)
+
+
+def decode_image(image_directory):
+    """Decode a single plot from its OCR text, reusing the cached result if nothing has changed. Returns the
+    decoded state, or None if it isn't a valid plot."""
+    found, state = load_decoded(image_directory)
+    if found:
+        return state
+
+    name = plot_type(image_directory)
+    if name is None:
+        return None
+
+    plot = PLOT_CLASSES[name](image_directory, None, replay=True)
+    try:
+        plot.process()
+    except InvalidForestPlot:
+        plot = None
+    else:
+        plot.save()
+    save_decoded(image_directory, plot)
+
+    return plot.dump() if plot is not None else None
+
+
+def replay(image_directories, processes=None):
+    """Decode many plots in parallel. Returns a list in the same order as the image directories given, holding
+    the decoded plot for each, or None where the image isn't a valid plot."""
+    image_directories = list(image_directories)
+    states = []
+    with multiprocessing.Pool(processes) as pool:
+        for state in pool.imap(decode_image, image_directories, chunksize=8):
+            states.append(state)
+            progress.advance(plots=int(state is not None))
+    return [ForestPlot.load(image_directory, state) if state is not None else None
+            for image_directory, state in zip(image_directories, states)]
@@ -33,6 +33,7 @@ OVERALL_HEADERS = Headers([
     Header('', ['Has subplots']),
     Header('effect size', ['effect size', 'CI lower bound', 'CI upper bound']),
     Header('weight', ['weight']),
+    Header('OCR', ['threshold passes', 'lowest agreement']),
 ])
 
 SUBGROUP_HEADERS = Headers([
@@ -53,8 +54,12 @@ SUBGROUP_HEADERS = Headers([
 
 class Results:
 
-    def __init__(self, papers):
+    def __init__(self, papers, duplicates=None, inputs=None):
         self.papers_list = papers
+        # (image directory, representative image directory, hash distance) for each plot copied from another
+        self.duplicates = duplicates or []
+        # (input file, input it's a copy of, ctree) for each PDF given to the project
+        self.inputs = inputs or []
 
     @staticmethod
     def bordered_cell(worksheet, row, column, value):
@@ -166,6 +171,10 @@ class Results:
                 except IndexError:
                     pass
 
+                self.plain_cell(worksheet, row, 2 + OVERALL_HEADERS.COLUMN_THRESHOLD_PASSES, last_table.passes)
+                self.plain_cell(worksheet, row, 2 + OVERALL_HEADERS.COLUMN_LOWEST_AGREEMENT,
+                                round(min(min(x) for x in last_table.agreement()), 2))
+
                 subplots = None
                 if len(plot.table_list) > 1:
                     subplots = plot.table_list[:-1]
@@ -270,5 +279,33 @@ class Results:
 
                 row += 1
 
+        if self.duplicates:
+            self.write_duplicates(workbook.create_sheet("Duplicates"))
+        if self.inputs:
+            self.write_inputs(workbook.create_sheet("Inputs"))
 
         workbook.save(path)
+
+    def write_duplicates(self, worksheet):
+        """List the plots whose results were copied from the same plot in another paper."""
+        for column, title in enumerate(["Image", "Copy of", "Hash distance"], 2):
+            self.bordered_cell(worksheet, ROW_MINOR_TITLE, column, title)
+        worksheet.column_dimensions["B"].width = 50
+        worksheet.column_dimensions["C"].width = 50
+
+        for row, (image_directory, representative, distance) in enumerate(self.duplicates, ROW_MINOR_TITLE + 1):
+            self.plain_cell(worksheet, row, 2, image_directory)
+            self.plain_cell(worksheet, row, 3, representative)
+            self.plain_cell(worksheet, row, 4, distance)
+
+    def write_inputs(self, worksheet):
+        """List every PDF given to the project against the paper it was processed as."""
+        for column, title in enumerate(["Input file", "Processed as", "Paper"], 2):
+            self.bordered_cell(worksheet, ROW_MINOR_TITLE, column, title)
+        for column in "BCD":
+            worksheet.column_dimensions[column].width = 40
+
+        for row, (name, processed_as, ctree) in enumerate(self.inputs, ROW_MINOR_TITLE + 1):
+            self.plain_cell(worksheet, row, 2, name)
+            self.plain_cell(worksheet, row, 3, processed_as)
+            self.plain_cell(worksheet, row, 4, ctree)
@@ -0,0 +1,295 @@
+"""A long running service that extracts plots from images sent to it over HTTP.
+
+Starting Python and importing OpenCV, numpy and the decoders takes longer than extracting a single plot, so for
+interactive use the service is started once and then sent images, on a TCP port or a Unix socket. Images are
+extracted in memory by a pool of threads that stays warm between jobs.
+
+    POST /jobs              submit the bytes of an image file, returning the job's ID and status (202)
+    GET  /jobs/ID           poll the status of a job: queued, running, done or failed
+    GET  /jobs/ID/result    fetch the result of a finished job (409 if it isn't finished yet)
+    POST /extract           submit an image and wait for its result
+    GET  /health            the numbers of workers and of queued and running jobs
+
+At most workers jobs run at once, and at most max_queued more wait for a worker. Submitting beyond that is refused
+with 503, so a busy service pushes back on its clients rather than building up an unbounded backlog."""
+
+import collections
+import concurrent.futures
+import http.server
+import json
+import os
+import re
+import socketserver
+import threading
+import time
+import traceback
+import uuid
+
+import numpy as np
+
+from forestplots import api
+from forestplots import progress
+
+# How many images are extracted at once
+WORKERS = os.cpu_count() or 1
+try:
+    WORKERS = int(os.environ["FORESTPLOT_SERVICE_WORKERS"])
+except KeyError:
+    pass
+
+# How many jobs can wait for a worker before more are refused
+MAX_QUEUED = 64
+
+# The largest image, in bytes, that will be accepted
+MAX_IMAGE_BYTES = 50 * 1024 * 1024
+
+# How many finished jobs are kept for their results to be fetched, the oldest being forgotten first
+JOB_HISTORY = 1000
+
+# How long, in seconds, POST /extract waits for its result
+EXTRACT_TIMEOUT = 600
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+JOB_RE = re.compile(r"^/jobs/([0-9a-f]+)(/result)?$")
+
+
+def warm_up_image():
+    """Draw the axes of an SPSS plot, which takes an extraction through line detection, cropping and OCR before the
+    decoders find there's no text and reject it."""
+    image = np.full((600, 800), 255, np.uint8)
+    # the vertical axis, the line under the headings and the scale
+    image[60:540, 519:521] = 0
+    image[69:71, :] = 0
+    image[529:531, 300:760] = 0
+    return image
+
+
+class Job():
+    """An image submitted for extraction, and what became of it."""
+
+    def __init__(self, image):
+        self.id = uuid.uuid4().hex
+        self.image = image
+        self.status = QUEUED
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        # whether the job failed because the image couldn't be read, rather than something going wrong
+        self.bad_image = False
+        self.done = threading.Event()
+
+    def describe(self):
+        """Get the status of the job as a JSON compatible dictionary."""
+        description = {
+            "id": self.id,
+            "status": self.status,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+        }
+        if self.error is not None:
+            description["error"] = self.error
+        return description
+
+
+class Service():
+    """Runs extraction jobs on a pool of threads, keeping track of them so their status and results can be fetched.
+    The extractor is called with the image bytes of each job, defaulting to api.extract."""
+
+    def __init__(self, extractor=None, workers=None, max_queued=MAX_QUEUED):
+        self.extractor = extractor if extractor is not None else api.extract
+        self.workers = workers if workers is not None else WORKERS
+        self.max_queued = max_queued
+        self.executor = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix="extract")
+        self.lock = threading.Lock()
+        self.jobs = collections.OrderedDict()
+        self.active = 0
+
+    def submit(self, image):
+        """Queue an image to be extracted. Returns the Job, or None if the service is too busy to take it."""
+        job = Job(image)
+        with self.lock:
+            if self.active >= self.workers + self.max_queued:
+                return None
+            self.active += 1
+            self.jobs[job.id] = job
+            self._forget_old_jobs()
+        self.executor.submit(self._run, job)
+        return job
+
+    def _forget_old_jobs(self):
+        """Drop the oldest finished jobs once there are too many. Called with the lock held."""
+        excess = len(self.jobs) - JOB_HISTORY - self.active
+        for job_id in list(self.jobs):
+            if excess <= 0:
+                break
+            if self.jobs[job_id].done.is_set():
+                del self.jobs[job_id]
+                excess -= 1
+
+    def _run(self, job):
+        job.status = RUNNING
+        job.started = time.time()
+        try:
+            job.result = self.extractor(job.image)
+        except api.BadImage as error:
+            job.error = str(error)
+            job.bad_image = True
+        except Exception: # pylint: disable=broad-except
+            job.error = traceback.format_exc()
+        job.image = None
+        job.finished = time.time()
+        job.status = FAILED if job.error is not None else DONE
+        with self.lock:
+            self.active -= 1
+        job.done.set()
+
+    def get(self, job_id):
+        """Get a job by its ID, or None if there's no such job."""
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def counts(self):
+        """Get the numbers of queued and running jobs."""
+        with self.lock:
+            statuses = collections.Counter(job.status for job in self.jobs.values())
+        return {"workers": self.workers, QUEUED: statuses[QUEUED], RUNNING: statuses[RUNNING]}
+
+    def warm_up(self):
+        """Run the extractor over the axes of a plot on each worker, so the first real job doesn't pay for loading
+        anything, and so a service that can't run tesseract fails as it starts."""
+        image = warm_up_image()
+        list(self.executor.map(lambda _: self.extractor(image), range(self.workers)))
+
+    def shutdown(self):
+        """Stop the workers, once they've finished the jobs they have."""
+        self.executor.shutdown(wait=True)
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    """Handles the HTTP API of the Service given as the server's service attribute."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        # each request would otherwise be logged, which is too much for a busy service
+        pass
+
+    def _send_json(self, status, body):
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _read_image(self):
+        """Read the request body, or send an error and return None if it's missing or too large."""
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            self._send_json(411, {"error": "Content-Length required"})
+            return None
+        if length <= 0:
+            self._send_json(400, {"error": "No image given"})
+            return None
+        if length > MAX_IMAGE_BYTES:
+            self.close_connection = True
+            self._send_json(413, {"error": f"Images can be at most {MAX_IMAGE_BYTES} bytes"})
+            return None
+        return self.rfile.read(length)
+
+    def _send_result(self, job):
+        if job.status == DONE:
+            self._send_json(200, job.result)
+        elif job.status == FAILED:
+            self._send_json(400 if job.bad_image else 500, job.describe())
+        else:
+            self._send_json(409, job.describe())
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """Poll a job or fetch its result, or check the service is up."""
+        service = self.server.service
+        if self.path == "/health":
+            self._send_json(200, dict(service.counts(), status="ok"))
+            return
+
+        match = JOB_RE.match(self.path)
+        job = service.get(match.group(1)) if match else None
+        if job is None:
+            self._send_json(404, {"error": "No such job"})
+        elif match.group(2):
+            self._send_result(job)
+        else:
+            self._send_json(200, job.describe())
+
+    def do_POST(self): # pylint: disable=invalid-name
+        """Submit an image, either to be fetched later or waiting for the result."""
+        if self.path not in ("/jobs", "/extract"):
+            self._send_json(404, {"error": "Unknown endpoint"})
+            return
+        image = self._read_image()
+        if image is None:
+            return
+
+        job = self.server.service.submit(image)
+        if job is None:
+            self._send_json(503, {"error": "Too many jobs, try again later"})
+        elif self.path == "/jobs":
+            self._send_json(202, job.describe())
+        else:
+            job.done.wait(EXTRACT_TIMEOUT)
+            self._send_result(job)
+
+
+class HTTPServer(http.server.ThreadingHTTPServer):
+    """Serves a Service's API on a TCP port."""
+
+    def __init__(self, service, address):
+        self.service = service
+        super().__init__(address, RequestHandler)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves a Service's API on a Unix socket."""
+
+    daemon_threads = True
+
+    def __init__(self, service, path):
+        self.service = service
+        # a socket left behind by a service that died would stop us binding
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, RequestHandler)
+
+    def get_request(self):
+        # Unix sockets have no client address, which the request handler expects
+        request, _ = super().get_request()
+        return request, ("local", 0)
+
+
+def serve(host="127.0.0.1", port=8080, socket_path=None, workers=None):
+    """Run the service until interrupted, on a Unix socket if a path is given, or else on a TCP port."""
+    service = Service(workers=workers)
+    service.warm_up()
+    if socket_path is not None:
+        server = UnixHTTPServer(service, socket_path)
+        progress.log(f"Serving on {socket_path} with {service.workers} workers")
+    else:
+        server = HTTPServer(service, (host, port))
+        progress.log(f"Serving on http://{host}:{server.server_address[1]} with {service.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
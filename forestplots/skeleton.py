@@ -1,58 +1,207 @@
 
 import collections
 import os
-import random
+import struct
 
 import cv2
 import numpy as np
 
 
+# Line detection can be run on the image shrunk by one of these factors, which is quicker and uses less memory, but
+# may miss lines in small images
+IMREAD_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+REDUCTION = 1
+try:
+    REDUCTION = int(os.environ["FORESTPLOT_SKELETON_REDUCTION"])
+except KeyError:
+    pass
+if REDUCTION not in IMREAD_FLAGS:
+    raise ValueError(f"FORESTPLOT_SKELETON_REDUCTION must be one of {sorted(IMREAD_FLAGS)}")
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
 HorizontalLine = collections.namedtuple('HorizontalLine', 'y x1 x2')
 VerticalLine = collections.namedtuple('VerticalLine', 'x y1 y2')
 
-def auto_canny(image, sigma=0.33):
+# The Hough line parameters were tuned on images with their longest side in this range of sizes, and are scaled in
+# proportion for images outside it
+TUNED_SIZES = (500, 2000)
+MIN_LINE_LENGTH = 150  # minimum number of pixels making up a line
+MAX_LINE_GAP = 30  # maximum gap in pixels between connectable line segments
+DEBOUNCE = 20  # lines closer than this are taken to be the same line
+
+HOUGH_RHO = 1  # distance resolution in pixels of the Hough grid
+HOUGH_THETA = np.pi / 180  # angular resolution in radians of the Hough grid
+HOUGH_THRESHOLD = 15  # minimum number of votes (intersections in Hough grid cell)
+
+# Images with a side longer than this have their lines found on a shrunk copy first, and then only the bands around
+# those lines are searched in the full image
+PYRAMID_SIZE = 2000
+# The shrunk copy is made by halving the image until its longest side is no more than this, up to eight times smaller
+PYRAMID_COARSE_SIZE = 1000
+# How many coarse pixels either side of a coarse line to search in the full image
+PYRAMID_BAND = 2
+
+
+def canny_thresholds(image, sigma=0.33):
 	# compute the median of the single channel pixel intensities
 	v = np.median(image)
 
-	# apply automatic Canny edge detection using the computed median
+	# get the automatic Canny edge detection thresholds using the computed median
 	lower = int(max(0, (1.0 - sigma) * v))
 	upper = int(min(255, (1.0 + sigma) * v))
+	return lower, upper
+
+def auto_canny(image, sigma=0.33):
+	lower, upper = canny_thresholds(image, sigma)
 	edged = cv2.Canny(image, lower, upper)
 
 	# return the edged image
 	return edged
 
-class Skeleton:
-
-    def __init__(self, image_directory):
+def line_parameters(width, height):
+    """Get the minimum line length, maximum line gap and debounce distance to use for an image of the given size."""
+    longest = max(width, height)
+    scale = 1.0
+    if longest < TUNED_SIZES[0]:
+        scale = longest / TUNED_SIZES[0]
+    elif longest > TUNED_SIZES[1]:
+        scale = longest / TUNED_SIZES[1]
+    return int(MIN_LINE_LENGTH * scale), max(1, int(MAX_LINE_GAP * scale)), DEBOUNCE * scale
+
+def find_lines(edges, min_line_length, max_line_gap):
+    """Run Hough on an edge detected image. Returns an array of the end points of the line segments found, as
+    [[x1, y1, x2, y2]] rows, or None if there are none."""
+    return cv2.HoughLinesP(edges, HOUGH_RHO, HOUGH_THETA, HOUGH_THRESHOLD, np.array([]), min_line_length, max_line_gap)
+
+def pyramid_lines(image, min_line_length, max_line_gap):
+    """Find the horizontal and vertical line segments in a large image, by looking for them in a shrunk copy and
+    then only searching narrow bands around what was found there at full resolution. Returns the same as
+    find_lines."""
+    height, width = image.shape[0:2]
+    factor = 2
+    while max(height, width) / factor > PYRAMID_COARSE_SIZE and factor < 8:
+        factor *= 2
+
+    coarse = cv2.resize(image, (-(-width // factor), -(-height // factor)), interpolation=cv2.INTER_AREA)
+    lower, upper = canny_thresholds(coarse)
+    coarse_lines = find_lines(cv2.Canny(coarse, lower, upper), max(1, min_line_length // factor),
+                              max(1, max_line_gap // factor))
+    if coarse_lines is None:
+        return None
+
+    # Merge the coarse lines along the same row or column into bands, so we don't search the same area twice
+    bands = []
+    for horizontal in (False, True):
+        segments = sorted((y1, min(x1, x2), max(x1, x2)) if horizontal else (x1, min(y1, y2), max(y1, y2))
+                          for x1, y1, x2, y2 in coarse_lines[:, 0] if (y1 == y2 if horizontal else x1 == x2))
+        merged = []
+        for position, start, end in segments:
+            if merged and position - merged[-1][1] <= PYRAMID_BAND:
+                merged[-1][1] = position
+                merged[-1][2] = min(merged[-1][2], start)
+                merged[-1][3] = max(merged[-1][3], end)
+            else:
+                merged.append([position, position, start, end])
+        bands.extend((horizontal, band) for band in merged)
+
+    found = []
+    for horizontal, (first, last, start, end) in bands:
+        across = slice(max(0, (first - PYRAMID_BAND) * factor), (last + PYRAMID_BAND + 1) * factor)
+        along = slice(max(0, (start - PYRAMID_BAND) * factor), (end + PYRAMID_BAND + 1) * factor)
+        rows, columns = (across, along) if horizontal else (along, across)
+        band_lines = find_lines(cv2.Canny(image[rows, columns], lower, upper), min_line_length, max_line_gap)
+        if band_lines is not None:
+            found.append(band_lines + np.array([columns.start, rows.start, columns.start, rows.start],
+                                               dtype=band_lines.dtype))
+
+    if not found:
+        return None
+    return np.concatenate(found)
+
+def png_size(path):
+    """Get the width and height of a PNG from its header, without decoding it. Returns None if it's not a PNG."""
+    with open(path, "rb") as image_file:
+        header = image_file.read(24)
+    if len(header) < 24 or not header.startswith(PNG_SIGNATURE) or header[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", header[16:24])
 
-        print(image_directory)
 
-        img = cv2.imread(os.path.join(image_directory, "raw.png"))
+class Skeleton:
 
-        self.height, self.width = img.shape[0:2]
+    def __init__(self, image_directory, cache=None, reduction=REDUCTION, image=None):
+        """Find the lines of the raw.png in an image directory, or if image is given, of that greyscale image held in
+        memory, in which case the cache isn't used."""
 
+        self.height = 0
+        self.width = 0
         self.horizontal_lines = []
         self.vertical_lines = []
+        self._verdicts = None
 
-        low_threshold = 100
-        high_threshold = 150
-        #edges = cv2.Canny(img, low_threshold, high_threshold)
-        edges = auto_canny(img)
-
-        cv2.imwrite("/tmp/edges.png", edges)
+        if image is not None:
+            self._detect_lines(image_directory, reduction, image)
+            return
 
-        rho = 1  # distance resolution in pixels of the Hough grid
-        theta = np.pi / 180  # angular resolution in radians of the Hough grid
-        threshold = 15  # minimum number of votes (intersections in Hough grid cell)
-        min_line_length = 150  # minimum number of pixels making up a line
-        max_line_gap = 30  # maximum gap in pixels between connectable line segments
-        line_image = np.copy(img) * 0  # creating a blank to draw lines on
+        key = None
+        if cache is not None:
+            key = cache.key(os.path.join(image_directory, "raw.png"), reduction)
+            entry = cache.get(key)
+            if entry is not None:
+                self._restore(entry)
+                return
+
+        self._detect_lines(image_directory, reduction)
+
+        if cache is not None:
+            cache.put(key, self)
+
+    def _restore(self, entry):
+        """Load the results of an earlier run from a SkeletonCache entry."""
+        self.width, self.height, vertical, horizontal, likely_spss, likely_stata = entry
+        self.vertical_lines = [VerticalLine(*vertical[i:i + 3]) for i in range(0, len(vertical), 3)]
+        self.horizontal_lines = [HorizontalLine(*horizontal[i:i + 3]) for i in range(0, len(horizontal), 3)]
+        self._verdicts = (likely_spss, likely_stata)
+
+    def _detect_lines(self, image_directory, reduction=1, image=None):
+        """Find the main axes of the plot using OpenCV. If reduction is more than one then we look at the image shrunk
+        by that factor, and scale the lines found back up to the full size image."""
+
+        if image is not None:
+            img = image
+            if reduction > 1:
+                img = cv2.resize(image, (image.shape[1] // reduction, image.shape[0] // reduction),
+                                 interpolation=cv2.INTER_AREA)
+            size = image.shape[1], image.shape[0]
+        else:
+            image_path = os.path.join(image_directory, "raw.png")
+            img = cv2.imread(image_path, IMREAD_FLAGS[reduction])
+
+            size = png_size(image_path) if reduction > 1 else None
+            if size is None:
+                size = img.shape[1] * reduction, img.shape[0] * reduction
+        self.width, self.height = size
+
+        # the parameters are for the full size image, so need scaling to the one we loaded
+        min_line_length, max_line_gap, debounce = line_parameters(self.width, self.height)
+        min_line_length //= reduction
+        max_line_gap = max(1, max_line_gap // reduction)
+        debounce /= reduction
+        line_image = np.zeros(img.shape, np.uint8)  # creating a blank to draw lines on
 
-        # Run Hough on edge detected image
         # Output "lines" is an array containing endpoints of detected line segments
-        lines = cv2.HoughLinesP(edges, rho, theta, threshold, np.array([]),
-                            min_line_length, max_line_gap)
+        if max(img.shape) > PYRAMID_SIZE:
+            lines = pyramid_lines(img, min_line_length, max_line_gap)
+        else:
+            edges = auto_canny(img)
+            lines = find_lines(edges, min_line_length, max_line_gap)
 
         try:
             vertical_lines = [x for x in lines if x[0][0] == x[0][2]]
@@ -65,7 +214,7 @@ class Skeleton:
         for i in range(len(vertical_lines) - 1):
             line = vertical_lines[i + 1]
             last = clean[-1]
-            if abs(last[0][0] - line[0][0]) < 20:
+            if abs(last[0][0] - line[0][0]) < debounce:
                 # two very close line, just keep the longest
                 last_len = last[0][1] - last[0][3]
                 line_len = line[0][1] - line[0][3]
@@ -95,7 +244,7 @@ class Skeleton:
         for i in range(len(horizontal_lines) - 1):
             line = horizontal_lines[i + 1]
             last = clean[-1]
-            if abs(last[0][1] - line[0][1]) < 20:
+            if abs(last[0][1] - line[0][1]) < debounce:
                 # two very close line, just keep the longest
                 last_len = last[0][2] - last[0][0]
                 line_len = line[0][2] - line[0][0]
@@ -122,22 +271,38 @@ class Skeleton:
 
         # Find the longest vertical line_image - ideally just one
         for vline in self.vertical_lines:
-            _ = cv2.line(line_image,(vline.x, vline.y1),(vline.x, vline.y2),
-                (128 + int(random.random() * 128), 128, 128),1)
+            _ = cv2.line(line_image,(vline.x, vline.y1),(vline.x, vline.y2), 255, 1)
 
         for hline in self.horizontal_lines:
-            _ = cv2.line(line_image,(hline.x1, hline.y), (hline.x2, hline.y),
-                (128, 128 + int(random.random() * 128), 128),1)
+            _ = cv2.line(line_image,(hline.x1, hline.y), (hline.x2, hline.y), 128, 1)
         #
         #
         # lines_edges = cv2.addWeighted(img, 0.8, line_image, 1, 0)
 
-        cv2.imwrite(os.path.join(image_directory, "lines.png"), line_image)
+        # images held in memory have no directory, and nothing should be written to disk for them
+        if image_directory is not None:
+            cv2.imwrite(os.path.join(image_directory, "lines.png"), line_image)
+
+        if reduction > 1:
+            self._scale_lines(reduction)
+
+    def _scale_lines(self, reduction):
+        """Map lines found in a reduced image back to the middle of the pixels they cover in the full image."""
+        def scale(value, limit):
+            return min(int(value) * reduction + reduction // 2, limit - 1)
+
+        self.vertical_lines = [VerticalLine(scale(x.x, self.width), scale(x.y1, self.height), scale(x.y2, self.height))
+                               for x in self.vertical_lines]
+        self.horizontal_lines = [HorizontalLine(scale(x.y, self.height), scale(x.x1, self.width),
+                                                scale(x.x2, self.width)) for x in self.horizontal_lines]
 
 
     def likely_spss(self):
         """Guess if this is likely an SPSS plot."""
 
+        if self._verdicts is not None:
+            return self._verdicts[0]
+
         try:
             main_line = self.vertical_lines[0]
             top_line = self.horizontal_lines[0]
@@ -173,6 +338,9 @@ class Skeleton:
     def likely_stata(self):
         """Guess if this is likely a stata plot."""
 
+        if self._verdicts is not None:
+            return self._verdicts[1]
+
         try:
             main_line = self.vertical_lines[0]
             bottom_line = self.horizontal_lines[-1]
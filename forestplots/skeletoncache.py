@@ -0,0 +1,85 @@
+"""Persistent cache of Skeleton line detection results, keyed by image content."""
+
+import hashlib
+import json
+import os
+import tempfile
+
+from forestplots.filelock import FileLock
+
+# Bump this if the line detection or the likely_spss/likely_stata heuristics change, as that invalidates every
+# cached entry.
+CACHE_VERSION = 3
+
+CACHE_FILENAME = "skeletons.json"
+
+
+def image_hash(path):
+    """Get a hash of the contents of an image file."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as image_file:
+        for chunk in iter(lambda: image_file.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SkeletonCache():
+    """Stores the lines, size and plot type verdicts found by Skeleton for each raw.png we've seen.
+
+    Entries are stored compactly as [width, height, vertical lines, horizontal lines, likely spss, likely stata],
+    with the lines flattened into lists of ints."""
+
+    def __init__(self, path):
+        self.path = path
+        self.dirty = False
+        self.entries = self._read()
+
+    def _read(self):
+        try:
+            with open(self.path) as cache_file:
+                data = json.load(cache_file)
+        except (FileNotFoundError, ValueError):
+            return {}
+        if data.get("version") != CACHE_VERSION:
+            return {}
+        return data.get("images", {})
+
+    @staticmethod
+    def key(raw_image_path, reduction=1):
+        """Get the cache key for an image, when line detection is run on it shrunk by the given factor."""
+        if reduction == 1:
+            return image_hash(raw_image_path)
+        return f"{image_hash(raw_image_path)}/{reduction}"
+
+    def get(self, key):
+        """Get the cached entry for an image hash, or None if we've not seen it."""
+        return self.entries.get(key)
+
+    def put(self, key, skeleton):
+        """Record the results of a Skeleton for the given image hash."""
+        self.entries[key] = [
+            skeleton.width,
+            skeleton.height,
+            [int(value) for line in skeleton.vertical_lines for value in line],
+            [int(value) for line in skeleton.horizontal_lines for value in line],
+            skeleton.likely_spss(),
+            skeleton.likely_stata(),
+        ]
+        self.dirty = True
+
+    def save(self):
+        """Write the cache back to disk, merging in anything other processes have added since we loaded it."""
+        if not self.dirty:
+            return
+        # another worker saving between our reading and replacing the file would lose its entries
+        with FileLock(self.path):
+            entries = self._read()
+            entries.update(self.entries)
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+            handle, temp_path = tempfile.mkstemp(dir=directory, prefix=".skeletons.")
+            with os.fdopen(handle, "w") as cache_file:
+                json.dump({"version": CACHE_VERSION, "images": entries}, cache_file, separators=(",", ":"))
+            os.replace(temp_path, self.path)
+        self.entries = entries
+        self.dirty = False
@@ -1,16 +1,14 @@
 """Specific implementation of SPSS forest plot parser."""
 
 import collections
-import difflib
-import os
 import re
-import subprocess
 
-import cv2
-
-from forestplots.plots import ForestPlot, InvalidForestPlot
-from forestplots.helpers import forgiving_float, sanity_check_values
+from forestplots.geometry import layout_table
+from forestplots.plots import ForestPlot, InvalidForestPlot, VOTE_MARGIN
+from forestplots.helpers import (forgiving_float, normalize_ocr, numeric_tokens, resolve_label, sanity_check_values,
+                                 weighted_vote)
 from forestplots.projections import Projections
+from forestplots.tableparser import parse_table_line
 
 TAU_LABEL = "Tau"
 CHI_LABEL = "Chi"
@@ -19,22 +17,26 @@ P_LABEL = "P"
 I_LABEL = "I"
 Z_LABEL = "Z"
 
-HETROGENEITY_KEYS = [TAU_LABEL, CHI_LABEL, DF_LABEL, P_LABEL, I_LABEL]
-OVERALL_EFFECT_KEYS = [Z_LABEL, P_LABEL]
+HETROGENEITY_KEYS = (TAU_LABEL, CHI_LABEL, DF_LABEL, P_LABEL, I_LABEL)
+OVERALL_EFFECT_KEYS = (Z_LABEL, P_LABEL)
 
 PARTS_SPLIT_RE = re.compile(r"([\w7\?]+.?\s*[=<>]\s*\d+[,.]*\d*)")
 PARTS_GROK_RE = re.compile(r"([\w7\?]+.?)\s*[=<>]\s*(\d+[,.]*\d*)")
 
 HEADER_RE = re.compile(r"^.*\n\s*(M[_-]?H|[1IT]V)[\s.,]*(Fixed|Random)[\s.,]*(\d+)%\s*C[ilI!].*", re.MULTILINE)
 
-TABLE_LINE_PARSE_RE = re.compile(r'^(.*?)\s+(\d+)\s+(\d+)\s+.*\s+([-—~]{0,1}\d+[.,:]\d*)\s*[/\[\({]([-—~]{0,1}\d+[.,:]\d*)\s*,\s*([-—~]{0,1}\d+[.,:]\d*)[\]}\)]\s*$')
 
-SCALE_RE = re.compile(r'([-—~]{0,1}\d+[,.]*\d*)\s+([-—~]{0,1}\d+[,.]*\d*)\s+([-—~]{0,1}\d+[,.]*\d*)\s+([-—~]{0,1}\d+[,.]*\d*)\s+([-—~]{0,1}\d+[,.]*\d*)')
 FAVOURS_RE = re.compile(r'.*rs\s*[\[{\(](.*)[\]}\)]\s*Favours\s*[\[{\(](.*)[\]}\)]')
 
 class SPSSForestPlot(ForestPlot):
     """Concrete subclass for processing SPSS forest plots."""
 
+    PLOT_TYPE = "spss"
+    REGIONS = ("header.graphheads", "body.table", "footer.summary", "footer.scale")
+    MONTAGE_REGIONS = ("header.graphheads", "footer.summary", "footer.scale")
+    PROBE_REGION = "footer.summary"
+    PROBE_RE = re.compile(r"eterogen|overall|effect|Chi|Tau|df\s*=", re.IGNORECASE)
+
     def break_up_image(self):
         """Splits the forest plot image into sub-images required for OCR."""
         projections = self.projections
@@ -44,27 +46,27 @@ class SPSSForestPlot(ForestPlot):
         y_top = int(projections.horizontal_lines[0].y)
         y_bottom = int(projections.horizontal_lines[1].y)
 
-        image = cv2.imread(os.path.join(self.image_directory, "raw.png"))
+        image = self._raw_image()
 
         y_max, x_max = image.shape[0:2]
 
         raw_header_graphheads = image[0:y_top, x_line:x_max]
-        cv2.imwrite(os.path.join(self.image_directory, "raw.header.graphheads.png"), raw_header_graphheads)
+        self._save_region("header.graphheads", raw_header_graphheads)
 
         raw_body_table = image[y_top:y_bottom, 0:x_line]
-        cv2.imwrite(os.path.join(self.image_directory, "raw.body.table.png"), raw_body_table)
+        self._save_region("body.table", raw_body_table)
 
         # this will clip, so we add a little margin for error
         raw_footer_summary = image[y_bottom - 10:y_max, 0:x_line]
-        cv2.imwrite(os.path.join(self.image_directory, "raw.footer.summary.png"), raw_footer_summary)
+        self._save_region("footer.summary", raw_footer_summary)
 
         raw_footer_scale = image[y_bottom:y_max, x_line:x_max]
-        cv2.imwrite(os.path.join(self.image_directory, "raw.footer.scale.png"), raw_footer_scale)
+        self._save_region("footer.scale", raw_footer_scale)
 
     @staticmethod
     def _decode_footer_summary_ocr(ocr_prose):
 
-        lines = [x.strip() for x in ocr_prose.split('\n') if x.strip()]
+        lines = normalize_ocr(ocr_prose).lines
 
         hetrogeneity = collections.OrderedDict()
         overall_effect = collections.OrderedDict()
@@ -95,45 +97,53 @@ class SPSSForestPlot(ForestPlot):
                 if prefix == "Heterogeneity:":
                     if key in ("7", "?", "F"):
                         key = "I"
-                    possible_keys = difflib.get_close_matches(key, HETROGENEITY_KEYS)
+                    key = resolve_label(key, HETROGENEITY_KEYS)
+                    if key is None:
+                        continue
                     try:
-                        hetrogeneity[possible_keys[0]] = forgiving_float(value)
-                    except (IndexError, ValueError):
+                        hetrogeneity[key] = forgiving_float(value)
+                    except ValueError:
                         pass
                 else:
-                    possible_keys = difflib.get_close_matches(key, OVERALL_EFFECT_KEYS)
+                    key = resolve_label(key, OVERALL_EFFECT_KEYS)
+                    if key is None:
+                        continue
                     try:
-                        overall_effect[possible_keys[0]] = forgiving_float(value)
-                    except (IndexError, ValueError):
+                        overall_effect[key] = forgiving_float(value)
+                    except ValueError:
                         pass
 
         return hetrogeneity, overall_effect
 
     def _process_footer(self):
-        footer_image_path = os.path.join(self.image_directory, "raw.footer.summary.png")
-        if not os.path.isfile(footer_image_path):
-            raise InvalidForestPlot
-
-        for threshold in range(50, 80, 2):
-            output_ocr_name = os.path.join(self.image_directory, f"footer.summary.{threshold}.txt")
-            if not os.path.isfile(output_ocr_name):
-                output_image_name = os.path.join(self.image_directory, f"footer.summary.{threshold}.png")
-                if not os.path.isfile(output_image_name):
-                    subprocess.run(["convert", "-black-threshold", f"{threshold}%", footer_image_path,
-                                    output_image_name])
-                subprocess.run(["tesseract", output_image_name, os.path.splitext(output_ocr_name)[0]],
-                               capture_output=True)
-
-            ocr_prose = open(output_ocr_name).read()
+        self._region_image_path("footer.summary")
+        thresholds = self.sweep_thresholds("footer.summary")
+        self._ocr_batch("footer.summary", thresholds)
+
+        # the thresholds that read the figures we keep
+        hetrogeneity_winners = []
+        overall_effect_winners = []
+        for threshold in thresholds:
+            ocr_prose = self._ocr("footer.summary", threshold)
+            if ocr_prose is None:
+                continue
             hetrogeneity, overall_effect = SPSSForestPlot._decode_footer_summary_ocr(ocr_prose)
             if len(hetrogeneity) > len(self.hetrogeneity):
                 self.hetrogeneity = hetrogeneity
+                hetrogeneity_winners = [threshold]
+            elif hetrogeneity and hetrogeneity == self.hetrogeneity:
+                hetrogeneity_winners.append(threshold)
             if len(overall_effect) > len(self.overall_effect):
                 self.overall_effect = overall_effect
+                overall_effect_winners = [threshold]
+            elif overall_effect and overall_effect == self.overall_effect:
+                overall_effect_winners.append(threshold)
+
+        self._record_winners("footer.summary", hetrogeneity_winners + overall_effect_winners)
 
     @staticmethod
     def _decode_header_summary_ocr(ocr_prose):
-        match = HEADER_RE.match(ocr_prose)
+        match = HEADER_RE.match(normalize_ocr(ocr_prose).text)
         try:
             groups = list(match.groups())
             groups[0] = groups[0].replace('1', 'I').replace('T', 'I').replace('MH', 'M-H').replace('_', '-')
@@ -142,45 +152,38 @@ class SPSSForestPlot(ForestPlot):
             raise ValueError
 
     def _process_header(self):
-        header_image_path = os.path.join(self.image_directory, "raw.header.graphheads.png")
-        if not os.path.isfile(header_image_path):
-            raise InvalidForestPlot
-
-        for threshold in range(50, 80, 2):
-            output_ocr_name = os.path.join(self.image_directory, f"header.graphheads.{threshold}.txt")
-            if not os.path.isfile(output_ocr_name):
-                output_image_name = os.path.join(self.image_directory, f"header.graphheads.{threshold}.png")
-                if not os.path.isfile(output_image_name):
-                    subprocess.run(["convert", "-black-threshold", f"{threshold}%",
-                                    header_image_path, output_image_name])
-                # we could use -c preserve_interword_spaces=1
-                subprocess.run(["tesseract", output_image_name, os.path.splitext(output_ocr_name)[0]],
-                               capture_output=True)
-
-            ocr_prose = open(output_ocr_name).read()
+        self._region_image_path("header.graphheads")
+
+        # we keep the first reading, but may go on to find every threshold that reads for the profile
+        winners = []
+        for threshold in self.sweep_thresholds("header.graphheads"):
+            ocr_prose = self._ocr("header.graphheads", threshold)
+            if ocr_prose is None:
+                continue
             try:
                 estimator_type, model_type, confidence_interval = SPSSForestPlot._decode_header_summary_ocr(ocr_prose)
+            except ValueError:
+                continue
+            if not winners:
                 self.add_summary_information(estimator_type=estimator_type, model_type=model_type,
                                              confidence_interval=confidence_interval)
+            winners.append(threshold)
+            if not self._read_every_threshold("header.graphheads"):
                 break
-            except ValueError:
-                continue
+
+        self._record_winners("header.graphheads", winners)
 
     @staticmethod
-    def _decode_table_lines_ocr(ocr_prose):
+    def _decode_table_lines_ocr(lines):
+        """Decodes the table row by row, given the lines of OCR text from normalize_ocr."""
 
         titles = []
         values = []
 
-        for line in ocr_prose:
-
-            # Fix some common number replacements in OCR
-            line = line.replace('§', '5').replace('£', '[-')
-
-            matches = TABLE_LINE_PARSE_RE.match(line)
-            if not matches:
+        for line in lines:
+            groups = parse_table_line(line)
+            if not groups:
                 continue
-            groups = matches.groups()
             title = groups[0]
             try:
                 value = (forgiving_float(groups[-3]), forgiving_float(groups[-2]), forgiving_float(groups[-1]))
@@ -200,13 +203,9 @@ class SPSSForestPlot(ForestPlot):
 
         metadata = []
         titles = []
-        lines = [x.strip() for x in ocr_prose.split('\n') if x.strip()]
+        lines = normalize_ocr(ocr_prose).lines
 
         for line in lines:
-
-            # Fix some common number replacements in OCR
-            line = line.replace('§', '5').replace('$', '5').replace('£', '[-')
-
             overall_match = OVERALL_LINE_RE.match(line)
             if not overall_match:
                 titles.append(line)
@@ -261,38 +260,96 @@ class SPSSForestPlot(ForestPlot):
 
         return plots
 
+    @staticmethod
+    def _decode_table_words_ocr(words):
+        """Decodes the table from its OCRWords, using their positions to rebuild the rows rather than trusting the
+        order tesseract read them in. Returns the titles, values and the mean confidence of the words in each row."""
+        titles = []
+        values = []
+        confidences = []
+
+        for row in layout_table(words):
+            cells = row.cells
+            filled = [cell for cell in cells if cell]
+            row_titles, row_values = SPSSForestPlot._decode_table_lines_ocr(normalize_ocr("  ".join(filled)).lines)
+            if not row_values:
+                continue
+            title = row_titles[0]
+
+            # The row parser takes the title to end at the first pair of integers, which cuts off any year, so where
+            # the first column is clearly separate from the numbers we take the whole of it
+            first_column = normalize_ocr(cells[0]).text.strip().replace("Cl", "CI")
+            if len(filled) >= 3 and cells[0] and first_column.startswith(title):
+                title = first_column
+
+            titles.append(title)
+            values.append(row_values[0])
+            confidences.append(row.confidence)
+
+        return titles, values, confidences
+
+    @staticmethod
+    def _table_data(titles, values, confidences=None):
+        """Flatten decoded titles and values into table rows, keeping one row per title. Returns the rows and the
+        confidence of each, being 1 if not given."""
+        if confidences is None:
+            confidences = [1.0] * len(titles)
+        data = collections.OrderedDict()
+        for title, value, confidence in zip(titles, values, confidences):
+            data[title] = ((title, value[0], value[1], value[2]), confidence)
+        return [x[0] for x in data.values()], [x[1] for x in data.values()]
+
     def _process_table(self):
-        image_path = os.path.join(self.image_directory, "raw.body.table.png")
-        if not os.path.isfile(image_path):
-            raise InvalidForestPlot
-
-        for threshold in range(50, 80, 2):
-            output_ocr_name = os.path.join(self.image_directory, "body.table.{0}.txt".format(threshold))
-            if not os.path.isfile(output_ocr_name):
-                output_image_name = os.path.join(self.image_directory, "body.table.{0}.png".format(threshold))
-                if not os.path.isfile(output_image_name):
-                    subprocess.run(["convert", "-black-threshold", "{0}%".format(threshold),
-                                    image_path, output_image_name])
-                subprocess.run(["tesseract", output_image_name, os.path.splitext(output_ocr_name)[0]],
-                               capture_output=True)
+        self._region_image_path("body.table")
+
+        # Where we have the word boxes we lay the table out from them, weighting each row's vote by how confident OCR
+        # was of its words, and stop once every cell has a clear winner. We fall back to the text for plots OCRed
+        # before we kept the word boxes.
+        table = self.primary_table
+        ocr_proses = []
+        # the rows read at each threshold, to find which readings won the vote
+        readings = {}
+        for threshold in self.sweep_thresholds("body.table"):
+            words = self._ocr_words("body.table", threshold)
+            if words is None:
+                ocr_prose = self._ocr("body.table", threshold)
+                if ocr_prose is not None:
+                    ocr_proses.append(ocr_prose)
+                continue
+            table.passes += 1
 
-        # We need to work out first if we have sub graphs or not
-        graph_counts = []
-        for threshold in range(50, 80, 2):
-            output_ocr_name = os.path.join(self.image_directory, "body.table.{0}.txt".format(threshold))
+            # We don't yet decode tables with sub graphs
+            if sum(word.text.count('Subtotal') for word in words) > 1:
+                continue
+            titles, values, confidences = self._decode_table_words_ocr(words)
+            data, confidences = self._table_data(titles, values, [x / 100.0 for x in confidences])
+            if not data:
+                continue
+            table.add_data(data, confidences)
+            readings[threshold] = data
+
+            if table.settled(VOTE_MARGIN):
+                break
+
+        self._record_winners("body.table", self._closest_readings(readings, table.collapse_data()))
+
+        if ocr_proses:
+            table.passes += len(ocr_proses)
+            self._process_table_text(ocr_proses)
 
-            ocr_prose = open(output_ocr_name, 'r').read()
-            graph_counts.append(ocr_prose.count('Subtotal'))
+    def _process_table_text(self, ocr_proses):
+        """Decodes the table from the plain OCR text of each threshold."""
+
+        # We need to work out first if we have sub graphs or not
+        graph_counts = [ocr_prose.count('Subtotal') for ocr_prose in ocr_proses]
 
         # Take the mode as to how many subgraphs there are
-        graph_count = max(set(graph_counts), key=graph_counts.count)
+        graph_count = weighted_vote((x, 1.0) for x in graph_counts).winner
 
         if graph_count in (0, 1):
 
-            for threshold in range(50, 80, 2):
-                output_ocr_name = os.path.join(self.image_directory, "body.table.{0}.txt".format(threshold))
-                ocr_prose = open(output_ocr_name, 'r').read()
-                lines = [x.strip() for x in ocr_prose.split('\n') if x.strip()]
+            for ocr_prose in ocr_proses:
+                lines = normalize_ocr(ocr_prose).lines
 
                 # In general tesseract will end up converting this in one of two forms:
                 # 1: it'll pull each column out one after another, and then make one single column from it all (this seems
@@ -317,15 +374,10 @@ class SPSSForestPlot(ForestPlot):
                     values, titles = ver_values, ver_titles
 
                 if values:
-                    data = collections.OrderedDict(zip(titles, values))
-                    flattened_data = [(title, values[0], values[1], values[2]) for title, values in data.items()]
-                    self.primary_table.add_data(flattened_data)
+                    self.primary_table.add_data(self._table_data(titles, values)[0])
 
         else:
-            for threshold in range(50, 80, 2):
-                output_ocr_name = os.path.join(self.image_directory, "body.table.{0}.txt".format(threshold))
-                ocr_prose = open(output_ocr_name, 'r').read()
-
+            for ocr_prose in ocr_proses:
                 try:
                     results_list = self._decode_table_columnwise_ocr(ocr_prose)
                 except ValueError:
@@ -337,55 +389,50 @@ class SPSSForestPlot(ForestPlot):
         groups = None
         mid_scale = None
 
-        ocr_prose = ocr_prose.replace('§', '5').replace('$', '5').replace('£', '[-')
-        lines = ocr_prose.split('\n')
-        for line in lines:
+        for line in normalize_ocr(ocr_prose).lines:
             match = FAVOURS_RE.match(line)
             if match:
                 groups = match.groups()
                 continue
-            match = SCALE_RE.match(line)
-            if match:
-                try:
-                    mid_scale = forgiving_float(match.groups()[2])
-                    continue
-                except AttributeError:
-                    pass
+            numbers = numeric_tokens(line)
+            if len(numbers) >= 5:
+                mid_scale = numbers[2].value
 
         return groups, mid_scale
 
     def _process_scale(self):
-        header_image_path = os.path.join(self.image_directory, "raw.footer.scale.png")
-        if not os.path.isfile(header_image_path):
-            raise InvalidForestPlot
-
-        for threshold in range(50, 80, 2):
-            output_ocr_name = os.path.join(self.image_directory, f"footer.scale.{threshold}.txt")
-            if not os.path.isfile(output_ocr_name):
-                output_image_name = os.path.join(self.image_directory, f"footer.scale.{threshold}.png")
-                if not os.path.isfile(output_image_name):
-                    subprocess.run(["convert", "-black-threshold", f"{threshold}%",
-                                    header_image_path, output_image_name])
-                # we could use -c preserve_interword_spaces=1
-                subprocess.run(["tesseract", output_image_name, os.path.splitext(output_ocr_name)[0]],
-                               capture_output=True)
-
-            ocr_prose = open(output_ocr_name).read()
+        self._region_image_path("footer.scale")
+
+        # once we have everything we stop taking readings, but may go on to find every threshold that reads for the
+        # profile
+        winners = []
+        done = False
+        for threshold in self.sweep_thresholds("footer.scale"):
+            ocr_prose = self._ocr("footer.scale", threshold)
+            if ocr_prose is None:
+                continue
             try:
                 groups, mid_point = SPSSForestPlot._decode_footer_scale_ocr(ocr_prose)
-                if mid_point is not None:
-                    self.mid_point = mid_point
-                if groups:
-                    self.group_a = groups[0]
-                    self.group_b = groups[1]
-
-                try:
-                    if self.mid_point and self.group_a and self.group_b:
-                        break
-                except AttributeError:
-                    pass
             except ValueError:
                 continue
+            if mid_point is not None or groups:
+                winners.append(threshold)
+            if done:
+                continue
+            if mid_point is not None:
+                self.mid_point = mid_point
+            if groups:
+                self.group_a = groups[0]
+                self.group_b = groups[1]
+
+            try:
+                done = bool(self.mid_point and self.group_a and self.group_b)
+            except AttributeError:
+                pass
+            if done and not self._read_every_threshold("footer.scale"):
+                break
+
+        self._record_winners("footer.scale", winners)
 
     def _write_data_to_worksheet(self, worksheet):
 
@@ -419,24 +466,28 @@ class SPSSForestPlot(ForestPlot):
                 worksheet.cell(row=count, column=4, value=value[2])
                 worksheet.cell(row=count, column=5, value=value[3])
                 count += 1
+            count = count + 1
+
+            self._write_agreement_to_worksheet(worksheet, self.primary_table, count)
 
     def process(self):
         """Process the possible SPSS forest plot."""
 
-        self._process_footer()
-        if not self.hetrogeneity or not self.overall_effect:
-            raise InvalidForestPlot
+        self._probe()
+        with self._regions_read_concurrently():
+            self._timed_sweep(self._process_footer)
+            if not self.hetrogeneity or not self.overall_effect:
+                raise InvalidForestPlot
 
-        self._process_header()
-        if not self.summary:
-            print(f"ooo {self.image_directory}")
-            raise InvalidForestPlot
+            self._process_header()
+            if not self.summary:
+                raise InvalidForestPlot
 
-        self._process_table()
-        if not self.primary_table.table_data:
-            raise InvalidForestPlot
+            self._process_table()
+            if not self.primary_table.table_data:
+                raise InvalidForestPlot
 
-        self._process_scale()
+            self._process_scale()
 
     def json_repr(self):
         """Creates a JSON compatible dictionary representation."""
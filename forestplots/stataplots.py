@@ -1,27 +1,31 @@
 """Specific implementation of Stata forest plot parser."""
 
 import collections
-import os
 import re
-import subprocess
 
-import cv2
-
-from forestplots.plots import ForestPlot, InvalidForestPlot, TABLE_VALUE_GROK_RE
-from forestplots.helpers import forgiving_float, sanity_check_values
+from forestplots.plots import ForestPlot, InvalidForestPlot, THRESHOLDS
+from forestplots.helpers import forgiving_float, normalize_ocr, numeric_tokens, sanity_check_values, weighted_vote
 from forestplots.projections import Projections
+from forestplots.tableparser import find_table_values
 
 HEADER_RE = re.compile(r".*(OR|RR|SMD|WMD|ES)\s*[\(\[](\d+)%.*")
 TABLE_LINE_PARSE_RE = re.compile(r"\s*(.*?)[\s—]*([-~]{0,1}\d+[\.,:]?\d*)\s*[/\[\({]([-—~]{0,1}\d+[\.,:]?\d*)\s*,\s*([-—~]{0,1}\d+[\.,:]?\d*)[\]}\)]\s*([-—~]{0,1}\d+[\.,:]?\d*)")
 OVERALL_LINE_RE = re.compile(r"(Overall|Subtotal) [\({\[].*squared\s*=\s*(\d+[\.,:]?\d*|[\.,])%[.,]\s*p\s*=\s*(\d+[\.,:]?\d*|[\.,])[\)}\]]")
 
 VALUES_PARSE_RE = re.compile(r"\s*([-—~]{0,1}\d+[\.,:]?\d*)\s*[/\[\({]([-—~]{0,1}\d+[\.,:]?\d*)\s*,\s*([-—~]{0,1}\d+[\.,:]?\d*)[\]}\)]\s*([-—~]{0,1}\d+[\.,:]?\d*)")
-SCALE_RE = re.compile(r'([-—~]{0,1}\d+[,.]*\d*)\s+([-—~]{0,1}\d+[,.]*\d*)\s+([-—~]{0,1}\d+[,.]*\d*)')
 
 
 class StataForestPlot(ForestPlot):
     """Concrete subclass for processing Stata forest plots."""
 
+    PLOT_TYPE = "stata"
+    REGIONS = ("header", "titles", "values", "scale")
+    MONTAGE_REGIONS = ("header", "scale")
+    PROBE_REGION = "header"
+    PROBE_RE = re.compile(r"(OR|RR|SMD|WMD|ES)\W*\d|\d\s*%|Weight|Study", re.IGNORECASE)
+    # the titles and values read at each threshold are matched up, so a threshold is no use unless both are read at it
+    SHARED_THRESHOLDS = (("titles", "values"),)
+
     def break_up_image(self):
         """Splits the forest plot image into sub-images required for OCR."""
         projections = self.projections
@@ -35,27 +39,26 @@ class StataForestPlot(ForestPlot):
         if x_left > x_right:
             x_left, x_right = x_right, x_left
 
-        image = cv2.imread(os.path.join(self.image_directory, "raw.png"))
+        image = self._raw_image()
 
         y_max, x_max = image.shape[0:2]
 
         subimage = image[0:y_top, 0:x_max]
-        cv2.imwrite(os.path.join(self.image_directory, "raw.header.png"), subimage)
+        self._save_region("header", subimage)
 
         subimage = image[y_top:y_bottom, 0:x_left]
-        cv2.imwrite(os.path.join(self.image_directory, "raw.titles.png"), subimage)
+        self._save_region("titles", subimage)
 
         subimage = image[y_top:y_bottom, x_right:x_max]
-        cv2.imwrite(os.path.join(self.image_directory, "raw.values.png"), subimage)
+        self._save_region("values", subimage)
 
         subimage = image[y_bottom:y_max, 0:x_max]
-        cv2.imwrite(os.path.join(self.image_directory, "raw.scale.png"), subimage)
+        self._save_region("scale", subimage)
 
 
     @staticmethod
     def _decode_header_ocr(ocr_prose):
-        lines = [x.strip() for x in ocr_prose.split('\n') if x.strip()]
-        for line in lines:
+        for line in normalize_ocr(ocr_prose).lines:
             match = HEADER_RE.match(line)
             try:
                 return tuple(match.groups())
@@ -64,53 +67,49 @@ class StataForestPlot(ForestPlot):
         raise ValueError
 
     def _process_header(self):
-        header_image_path = os.path.join(self.image_directory, "raw.header.png")
-        if not os.path.isfile(header_image_path):
-            raise InvalidForestPlot
+        self._region_image_path("header")
 
-        for threshold in range(50, 80, 2):
-            output_ocr_name = os.path.join(self.image_directory, "header.{0}.txt".format(threshold))
-            if not os.path.isfile(output_ocr_name):
-                output_image_name = os.path.join(self.image_directory, "header.{0}.png".format(threshold))
-                if not os.path.isfile(output_image_name):
-                    subprocess.run(["convert", "-black-threshold", "{0}%".format(threshold),
-                                    header_image_path, output_image_name])
-                subprocess.run(["tesseract", output_image_name, os.path.splitext(output_ocr_name)[0]],
-                               capture_output=True)
-
-            ocr_prose = open(output_ocr_name).read()
+        # we keep the first reading, but may go on to find every threshold that reads for the profile
+        winners = []
+        for threshold in self.sweep_thresholds("header"):
+            ocr_prose = self._ocr("header", threshold)
+            if ocr_prose is None:
+                continue
             try:
                 estimator_type, confidence_interval = StataForestPlot._decode_header_ocr(ocr_prose)
+            except ValueError:
+                continue
+            if not winners:
                 self.add_summary_information(estimator_type=estimator_type, model_type=None,
                                              confidence_interval=confidence_interval)
+            winners.append(threshold)
+            if not self._read_every_threshold("header"):
                 break
-            except ValueError:
-                continue
+
+        self._record_winners("header", winners)
 
 
     @staticmethod
     def _decode_values_ocr(ocr_prose):
 
-        # Fix some common number replacements in OCR
-        ocr_prose = ocr_prose.replace('§', '5').replace('$', '5').replace('£', '[-')
-        lines = [x.strip() for x in ocr_prose.split('\n') if x.strip()]
+        lines = normalize_ocr(ocr_prose).lines
 
         values = []
         weights = []
 
         # first find the values
         for line in lines:
-            parts = TABLE_VALUE_GROK_RE.split(line)
-            if len(parts) == 5:
+            matches = list(find_table_values(line, excluded=False))
+            if len(matches) == 1:
+                _, end, groups = matches[0]
                 try:
-                    value = (forgiving_float(parts[1]), forgiving_float(parts[2]), forgiving_float(parts[3]))
+                    value = (forgiving_float(groups[0]), forgiving_float(groups[1]), forgiving_float(groups[2]))
                     value = sanity_check_values(value)
                     values.append(value)
                 except ValueError:
-                    if parts == "(Excluded)":
-                        values.append(("Excluded", "Excluded", "Excluded"))
+                    pass
                 try:
-                    weight = forgiving_float(parts[4].strip())
+                    weight = forgiving_float(line[end:].strip())
                     weights.append(weight)
                 except ValueError:
                     pass
@@ -130,24 +129,18 @@ class StataForestPlot(ForestPlot):
 
         return res
 
-    def _process_values(self):
-        values_image_path = os.path.join(self.image_directory, "raw.values.png")
-        if not os.path.isfile(values_image_path):
-            raise InvalidForestPlot
+    def _process_values(self, read):
+        self._region_image_path("values")
+        thresholds = self.sweep_thresholds("values")
+        self._ocr_batch("values", thresholds)
 
         total_values = {}
 
-        for threshold in range(50, 80, 2):
-            output_ocr_name = os.path.join(self.image_directory, "values.{0}.txt".format(threshold))
-            if not os.path.isfile(output_ocr_name):
-                output_image_name = os.path.join(self.image_directory, "values.{0}.png".format(threshold))
-                if not os.path.isfile(output_image_name):
-                    subprocess.run(["convert", "-black-threshold", "{0}%".format(threshold),
-                                    values_image_path, output_image_name])
-                subprocess.run(["tesseract", output_image_name, os.path.splitext(output_ocr_name)[0]],
-                               capture_output=True)
-
-            ocr_prose = open(output_ocr_name, 'r').read()
+        for threshold in thresholds:
+            ocr_prose = self._ocr("values", threshold)
+            if ocr_prose is None:
+                continue
+            read.add(threshold)
             try:
                 values = self._decode_values_ocr(ocr_prose)
                 if not total_values:
@@ -167,9 +160,8 @@ class StataForestPlot(ForestPlot):
     def _decode_table_titles_ocr(ocr_prose):
 
         titles = []
-        lines = [x.strip() for x in ocr_prose.split('\n') if x.strip()]
 
-        for line in lines:
+        for line in normalize_ocr(ocr_prose).lines:
             match = OVERALL_LINE_RE.match(line)
             if not match:
                 titles.append(line)
@@ -181,24 +173,18 @@ class StataForestPlot(ForestPlot):
 
         raise ValueError
 
-    def _process_titles(self):
+    def _process_titles(self, read):
 
-        titles_image_path = os.path.join(self.image_directory, "raw.titles.png")
-        if not os.path.isfile(titles_image_path):
-            raise InvalidForestPlot
+        self._region_image_path("titles")
+        thresholds = self.sweep_thresholds("titles")
+        self._ocr_batch("titles", thresholds)
 
         total_titles = {}
-        for threshold in range(50, 80, 2):
-            output_ocr_name = os.path.join(self.image_directory, "titles.{0}.txt".format(threshold))
-            if not os.path.isfile(output_ocr_name):
-                output_image_name = os.path.join(self.image_directory, "titles.{0}.png".format(threshold))
-                if not os.path.isfile(output_image_name):
-                    subprocess.run(["convert", "-black-threshold", "{0}%".format(threshold),
-                                    titles_image_path, output_image_name])
-                subprocess.run(["tesseract", output_image_name, os.path.splitext(output_ocr_name)[0]],
-                               capture_output=True)
-
-            ocr_prose = open(output_ocr_name, 'r').read()
+        for threshold in thresholds:
+            ocr_prose = self._ocr("titles", threshold)
+            if ocr_prose is None:
+                continue
+            read.add(threshold)
             try:
                 titles = self._decode_table_titles_ocr(ocr_prose)
                 total_titles[threshold] = titles
@@ -209,16 +195,21 @@ class StataForestPlot(ForestPlot):
 
     def _process_body(self):
 
-        values_collection = self._process_values()
-        titles_collection = self._process_titles()
+        # Unlike the SPSS table, which stops once its vote is settled, every threshold of the sweep is read, as the
+        # number of groups is voted on before any rows can be matched up. The sweep is only short of every threshold
+        # if the profile prunes it. Passes count the thresholds read, as for SPSS, whether or not they decoded.
+        read = set()
+        values_collection = self._process_values(read)
+        titles_collection = self._process_titles(read)
 
         if not values_collection or not titles_collection:
             raise InvalidForestPlot
 
         values_count = len(values_collection[next(iter(values_collection))])
+        passes = len(read)
 
         # match the titles and value thresholds. Not sure this is necessary, but for now it simplifies things a little
-        for threshold in range(50, 80, 2):
+        for threshold in THRESHOLDS:
             if threshold in values_collection.keys() and threshold not in titles_collection.keys():
                 del(values_collection[threshold])
             if threshold not in values_collection.keys() and threshold in titles_collection.keys():
@@ -231,9 +222,17 @@ class StataForestPlot(ForestPlot):
         clean_group_counts = {k: group_counts[k] for k in group_counts if len(titles_collection[k]) == values_count + (group_counts[k] - 1)}
         if not clean_group_counts:
             raise InvalidForestPlot
-        raw_group_counts = list(clean_group_counts.values())
-        most_common_groups = max(set(raw_group_counts), key=raw_group_counts.count)
 
+        # weight each threshold's reading by how confident OCR was of it, a row being as good as the worse of its
+        # title and its values
+        title_confidences = {k: self._pass_confidence("titles", k) for k in clean_group_counts}
+        row_confidences = {k: min(title_confidences[k], self._pass_confidence("values", k))
+                           for k in clean_group_counts}
+        most_common_groups = weighted_vote((clean_group_counts[k], title_confidences[k])
+                                           for k in clean_group_counts).winner
+
+        # the rows of every table read at each threshold, to find which readings won the vote
+        readings = {}
         for threshold in clean_group_counts:
             if clean_group_counts[threshold] != most_common_groups:
                 continue
@@ -244,10 +243,11 @@ class StataForestPlot(ForestPlot):
             count = 0
             while count < most_common_groups:
                 table = self.get_table(count)
+                table.passes = passes
                 count += 1
 
                 if count != most_common_groups:
-                    table.add_title(titles[0])
+                    table.add_title(titles[0], title_confidences[threshold])
                     titles = titles[1:]
 
                 sub_titles = []
@@ -270,7 +270,8 @@ class StataForestPlot(ForestPlot):
 
                 data = collections.OrderedDict(zip(sub_titles, sub_values))
                 flattened_data = [(title, values[0], values[1], values[2], values[3]) for title, values in data.items()]
-                table.add_data(flattened_data)
+                table.add_data(flattened_data, [row_confidences[threshold]] * len(flattened_data))
+                readings.setdefault(threshold, []).extend(flattened_data)
                 table.metadata["i^2"] = i_squared_str
                 try:
                     table.metadata["i^2"] = forgiving_float(i_squared_str)
@@ -282,6 +283,10 @@ class StataForestPlot(ForestPlot):
                 except ValueError:
                     pass
 
+        collapsed = [row for table in self.table_list for row in table.collapse_data()]
+        self._record_winners("titles", self._closest_readings(readings, collapsed, slice(0, 1)))
+        self._record_winners("values", self._closest_readings(readings, collapsed, slice(1, None)))
+
 
     def _write_data_to_worksheet(self, worksheet):
         count = 1
@@ -314,52 +319,51 @@ class StataForestPlot(ForestPlot):
                 worksheet.cell(row=count, column=3, value=value)
                 count = count + 1
             count = count + 1
+            if table.table_data:
+                count = self._write_agreement_to_worksheet(worksheet, table, count) + 1
 
     @staticmethod
     def _decode_footer_scale_ocr(ocr_prose):
 
-        ocr_prose = ocr_prose.replace('§', '5').replace('$', '5').replace('£', '[-')
-        lines = [x.strip() for x in ocr_prose.split('\n') if x.strip()]
-        for line in lines:
-            match = SCALE_RE.match(line)
-            try:
-                return forgiving_float(match.groups()[1])
-            except (ValueError, AttributeError):
-                pass
+        for line in normalize_ocr(ocr_prose).lines:
+            numbers = numeric_tokens(line)
+            if len(numbers) >= 3:
+                return numbers[1].value
         raise ValueError
 
     def _process_scale(self):
-        header_image_path = os.path.join(self.image_directory, "raw.scale.png")
-        if not os.path.isfile(header_image_path):
-            raise InvalidForestPlot
+        self._region_image_path("scale")
 
-        for threshold in range(50, 80, 2):
-            output_ocr_name = os.path.join(self.image_directory, "scale.{0}.txt".format(threshold))
-            if not os.path.isfile(output_ocr_name):
-                output_image_name = os.path.join(self.image_directory, "scale.{0}.png".format(threshold))
-                if not os.path.isfile(output_image_name):
-                    subprocess.run(["convert", "-black-threshold", "{0}%".format(threshold),
-                                    header_image_path, output_image_name])
-                subprocess.run(["tesseract", output_image_name, os.path.splitext(output_ocr_name)[0]],
-                               capture_output=True)
-
-            ocr_prose = open(output_ocr_name).read()
+        # we keep the first reading, but may go on to find every threshold that reads for the profile
+        winners = []
+        for threshold in self.sweep_thresholds("scale"):
+            ocr_prose = self._ocr("scale", threshold)
+            if ocr_prose is None:
+                continue
             try:
-                self.mid_point = StataForestPlot._decode_footer_scale_ocr(ocr_prose)
-                break
+                mid_point = StataForestPlot._decode_footer_scale_ocr(ocr_prose)
             except ValueError:
                 continue
+            if not winners:
+                self.mid_point = mid_point
+            winners.append(threshold)
+            if not self._read_every_threshold("scale"):
+                break
+
+        self._record_winners("scale", winners)
 
 
     def process(self):
         """Process the possible Stata forest plot."""
-        self._process_header()
-        if not self.summary:
-            raise InvalidForestPlot
+        self._probe()
+        with self._regions_read_concurrently():
+            self._timed_sweep(self._process_header)
+            if not self.summary:
+                raise InvalidForestPlot
 
-        self._process_scale()
+            self._process_scale()
 
-        self._process_body()
+            self._process_body()
 
     def json_repr(self):
         repr = {}
@@ -0,0 +1,179 @@
+"""Linear time parsers for the effect size and confidence interval columns of forest plot tables.
+
+These replace regular expressions that mixed lazy and greedy wildcards, which could backtrack for a very long time on
+long lines of OCR garbage. The text is first split into tokens, being runs of digits, runs of whitespace, the word
+"(Excluded)", or any other single character, and the parsers then match against the tokens. Each possible starting
+point only ever looks at a bounded number of tokens, so parsing is linear in the length of the text."""
+
+import collections
+import re
+
+# Lines longer than this are never genuine table rows, so we don't try to parse them
+MAX_LINE_LENGTH = 500
+
+SIGNS = "-—~"
+OPEN_BRACKETS = "/[({"
+CLOSE_BRACKETS = "]})"
+EXCLUDED = "(Excluded)"
+
+# Decimal separators allowed in the values column, where OCR will often read the point as a space
+VALUE_SEPARATORS = ".,: "
+# Decimal separators allowed when parsing a whole table row
+LINE_SEPARATORS = ".,:"
+
+DIGITS = "digits"
+SPACE = "space"
+OTHER = "other"
+
+Token = collections.namedtuple("Token", "kind text start end")
+
+TOKEN_RE = re.compile(r"(\d+)|(\s+)|\(Excluded\)|.", re.DOTALL)
+
+# A table row ends with "effect [lower, upper]", which is at most this many tokens including trailing whitespace
+MAX_VALUE_TOKENS = 19
+
+
+def tokenize(text):
+    """Split text into a list of Tokens."""
+    tokens = []
+    for match in TOKEN_RE.finditer(text):
+        if match.group(1):
+            kind = DIGITS
+        elif match.group(2):
+            kind = SPACE
+        else:
+            kind = OTHER
+        tokens.append(Token(kind, match.group(0), match.start(), match.end()))
+    return tokens
+
+
+def _match_number(tokens, index, separators):
+    """Match a number of the form [-—~]?\\d+[separators]\\d* at the token index. Returns a tuple of the number's
+    text, the index of the next token, and whether there is some whitespace left over from the token used as the
+    separator, or None if there's no number here."""
+    text = ""
+    if _is_one_of(tokens, index, SIGNS):
+        text = tokens[index].text
+        index += 1
+    if index >= len(tokens) or tokens[index].kind != DIGITS:
+        return None
+    text += tokens[index].text
+    index += 1
+
+    if index >= len(tokens):
+        return None
+    separator = tokens[index]
+    if separator.kind == SPACE:
+        if " " not in separators or separator.text[0] != " ":
+            return None
+        text += " "
+        index += 1
+        if len(separator.text) > 1:
+            # the rest of the whitespace can't be followed by more digits
+            return text, index, True
+    elif _is_one_of(tokens, index, separators):
+        text += separator.text
+        index += 1
+    else:
+        return None
+
+    if index < len(tokens) and tokens[index].kind == DIGITS:
+        text += tokens[index].text
+        index += 1
+    return text, index, False
+
+
+def _skip_space(tokens, index):
+    if index < len(tokens) and tokens[index].kind == SPACE:
+        return index + 1
+    return index
+
+
+def _is_one_of(tokens, index, characters):
+    return index < len(tokens) and tokens[index].kind == OTHER and tokens[index].text in characters
+
+
+def _match_interval(tokens, index, separators, commas):
+    """Match "effect [lower, upper]" at the token index, allowing whitespace in the same places as OCR puts it.
+    Returns a tuple of the three number strings and the index of the next token, or None if there's no match."""
+    effect = _match_number(tokens, index, separators)
+    if not effect:
+        return None
+    effect, index, _ = effect
+    index = _skip_space(tokens, index)
+    if not _is_one_of(tokens, index, OPEN_BRACKETS):
+        return None
+
+    lower = _match_number(tokens, index + 1, separators)
+    if not lower:
+        return None
+    lower, index, _ = lower
+    index = _skip_space(tokens, index)
+    if not _is_one_of(tokens, index, commas):
+        return None
+    index = _skip_space(tokens, index + 1)
+
+    upper = _match_number(tokens, index, separators)
+    if not upper:
+        return None
+    upper, index, leftover_space = upper
+    if leftover_space or not _is_one_of(tokens, index, CLOSE_BRACKETS):
+        return None
+
+    return (effect, lower, upper), index + 1
+
+
+def find_table_values(text, excluded=True):
+    """Find each "effect [lower, upper]" in the text, from left to right, with OCR's usual mistakes in the
+    punctuation. Generates tuples of the start and end offsets of each match and the three number strings, or None
+    instead of the numbers for "(Excluded)" if excluded is set."""
+    lines = text.split("\n")
+    if any(len(line) > MAX_LINE_LENGTH for line in lines):
+        # blank out the long lines, keeping the offsets into the text the same
+        text = "\n".join(line if len(line) <= MAX_LINE_LENGTH else " " * len(line) for line in lines)
+
+    tokens = tokenize(text)
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        if token.kind == DIGITS or _is_one_of(tokens, index, SIGNS):
+            match = _match_interval(tokens, index, VALUE_SEPARATORS, ".,")
+            if match:
+                numbers, end = match
+                yield token.start, tokens[end - 1].end, numbers
+                index = end
+                continue
+        elif excluded and token.text == EXCLUDED:
+            yield token.start, token.end, None
+        index += 1
+
+
+def parse_table_line(line):
+    """Parse a whole table row as read by tesseract, in the form "title count total ... effect [lower, upper]".
+    Returns a tuple of the title and the three number strings, or None if the line isn't a table row."""
+    if len(line) > MAX_LINE_LENGTH or not any(x in line for x in CLOSE_BRACKETS):
+        return None
+
+    tokens = tokenize(line)
+
+    # The values must finish the line, and are preceded by whitespace. Take the last place they can start.
+    values = None
+    for index in range(len(tokens) - 1, max(0, len(tokens) - MAX_VALUE_TOKENS - 1), -1):
+        if tokens[index - 1].kind != SPACE:
+            continue
+        match = _match_interval(tokens, index, LINE_SEPARATORS, ",")
+        if match and _skip_space(tokens, match[1]) == len(tokens):
+            values = match[0]
+            values_start = tokens[index].start
+            break
+    if values is None:
+        return None
+
+    # The title is everything up to the first pair of whitespace separated integers, which must leave at least one
+    # whitespace character before the values
+    for index in range(len(tokens) - 4):
+        if (tokens[index].kind == SPACE and tokens[index + 1].kind == DIGITS and tokens[index + 2].kind == SPACE and
+                tokens[index + 3].kind == DIGITS and tokens[index + 4].kind == SPACE and
+                tokens[index + 3].end < values_start - 1):
+            return (line[:tokens[index].start],) + values
+    return None
@@ -0,0 +1,189 @@
+"""Learning which black thresholds each region of each type of plot reads best at, so later runs read those first.
+
+For each valid plot we record the thresholds whose readings won the vote for each region: every one read that decoded
+the header or scale, those that gave the heterogeneity and overall effect figures kept from the footer, and those
+whose table readings agreed most with the table as voted. The count of wins of each threshold is kept per plot type
+and region in the profile, which is saved in the project, or shared between projects if FORESTPLOT_THRESHOLD_PROFILE
+gives a path.
+
+Once a region has enough plots recorded, its thresholds are read in order of how often they've won, so the decoders that
+stop at the first good reading, or once the table's vote is settled, stop sooner. If FORESTPLOT_THRESHOLD_TOP is set
+only that many of the best thresholds are read, even by the decoders that otherwise read them all. Until then, and when
+replaying, thresholds are read from lightest to darkest as before. Regions whose readings are matched up with each
+other, such as the titles and values of a Stata plot, are ranked together so they're read at the same thresholds.
+
+The header and scale decoders would otherwise stop at the first threshold that reads, so only ever record the first
+few of the order they were given, and the profile would keep whatever order it started with. So until a region has
+enough plots recorded, and then for one plot in every FORESTPLOT_THRESHOLD_EXPLORE, they go on to read every threshold,
+keeping what the first one read but recording every one that read, and the sweep isn't pruned.
+
+Workers sharing a profile take turns to save it, holding its FileLock while they read what's on disk, add their counts
+and replace the file."""
+
+import json
+import os
+import tempfile
+
+from forestplots.filelock import FileLock
+
+# Bump this if what counts as a win changes, as that invalidates the counts recorded
+PROFILE_VERSION = 2
+
+PROFILE_FILENAME = "threshold-profile.json"
+
+# Where to keep the profile, if not in the project
+PROFILE_PATH = None
+try:
+    PROFILE_PATH = os.environ["FORESTPLOT_THRESHOLD_PROFILE"]
+except KeyError:
+    pass
+
+# Whether to read the thresholds of each region in the order of the profile
+USE_PROFILE = True
+try:
+    USE_PROFILE = os.environ["FORESTPLOT_THRESHOLD_ORDER"] == "yes"
+except KeyError:
+    pass
+
+# How many of the best thresholds of each region to read, or 0 to read them all
+TOP = 0
+try:
+    TOP = int(os.environ["FORESTPLOT_THRESHOLD_TOP"])
+except KeyError:
+    pass
+
+# One plot in this many of each type reads every threshold of every region, so that thresholds outside the current
+# order still get counted, or 0 never to
+EXPLORE_EVERY = 10
+try:
+    EXPLORE_EVERY = int(os.environ["FORESTPLOT_THRESHOLD_EXPLORE"])
+except KeyError:
+    pass
+
+# How many plots must have been recorded for a region before its thresholds are reordered or pruned
+MIN_PLOTS = 20
+
+
+def profile_path(project_directory):
+    """Get the path of the profile used for a project."""
+    if PROFILE_PATH is not None:
+        return PROFILE_PATH
+    return os.path.join(project_directory, PROFILE_FILENAME)
+
+
+class ThresholdProfile():
+    """Counts how many plots each threshold has won each region of each type of plot for.
+
+    Counts are stored by "plot type/region" as the number of plots recorded and the number of wins of each
+    threshold. Saving adds what we've recorded since to whatever is on disk, so that workers can share a profile."""
+
+    def __init__(self, path, top=TOP, min_plots=MIN_PLOTS, explore_every=EXPLORE_EVERY):
+        self.path = path
+        self.top = top
+        self.min_plots = min_plots
+        self.explore_every = explore_every
+        self.regions = self._read()
+        # what we've recorded since loading or saving, to be added to the file on disk
+        self.added = {}
+        # how many plots of each type have asked whether to explore
+        self.explore_counts = {}
+
+    def _read(self):
+        try:
+            with open(self.path) as profile_file:
+                data = json.load(profile_file)
+        except (FileNotFoundError, ValueError):
+            return {}
+        if data.get("version") != PROFILE_VERSION:
+            return {}
+        return data.get("regions", {})
+
+    @staticmethod
+    def _add(regions, key, plots, wins):
+        counts = regions.setdefault(key, {"plots": 0, "wins": {}})
+        counts["plots"] += plots
+        for threshold, count in wins.items():
+            counts["wins"][threshold] = counts["wins"].get(threshold, 0) + count
+
+    def record(self, plot_type, region, thresholds):
+        """Record the thresholds that won a region of one plot."""
+        wins = {str(x): 1 for x in set(thresholds)}
+        for regions in (self.regions, self.added):
+            self._add(regions, f"{plot_type}/{region}", 1, wins)
+
+    def record_plot(self, plot):
+        """Record the winning thresholds of every region of a valid plot."""
+        for region, thresholds in plot.winning_thresholds.items():
+            if thresholds:
+                self.record(plot.PLOT_TYPE, region, thresholds)
+
+    def plots(self, plot_type, region):
+        """Get how many plots have been recorded for a region."""
+        return self.regions.get(f"{plot_type}/{region}", {}).get("plots", 0)
+
+    def trained(self, plot_type, regions):
+        """Check whether enough plots have been recorded for a region, or for each of a tuple of regions read
+        together, to go by its counts."""
+        regions = (regions,) if isinstance(regions, str) else regions
+        return all(self.plots(plot_type, x) >= self.min_plots for x in regions)
+
+    def explore(self, plot_type):
+        """Count a plot of a type, returning whether it should read every threshold of every region."""
+        count = self.explore_counts.get(plot_type, 0) + 1
+        self.explore_counts[plot_type] = count
+        return self.explore_every > 0 and count % self.explore_every == 0
+
+    def order(self, plot_type, regions, thresholds, prune=True):
+        """Get the thresholds to read a region at, or a tuple of regions read together, most often winning first and
+        pruned to the top few if asked. Returns them in the order given until enough plots have been recorded."""
+        thresholds = list(thresholds)
+        if not self.trained(plot_type, regions):
+            return thresholds
+        regions = (regions,) if isinstance(regions, str) else regions
+        wins = {}
+        for region in regions:
+            for threshold, count in self.regions[f"{plot_type}/{region}"]["wins"].items():
+                wins[threshold] = wins.get(threshold, 0) + count
+        # the sort is stable, so thresholds that have won as often are read in the order given
+        ordered = sorted(thresholds, key=lambda x: -wins.get(str(x), 0))
+        if prune and self.top > 0:
+            ordered = ordered[:self.top]
+        return ordered
+
+    def save(self):
+        """Write the profile back to disk, adding what we've recorded to anything other processes have saved."""
+        if not self.added:
+            return
+        # another worker saving between our reading and replacing the file would lose its counts
+        with FileLock(self.path):
+            regions = self._read()
+            for key, counts in self.added.items():
+                self._add(regions, key, counts["plots"], counts["wins"])
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+            handle, temp_path = tempfile.mkstemp(dir=directory, prefix=".threshold-profile.")
+            with os.fdopen(handle, "w") as profile_file:
+                json.dump({"version": PROFILE_VERSION, "regions": regions}, profile_file, indent=4, sort_keys=True)
+            os.replace(temp_path, self.path)
+        self.regions = regions
+        self.added = {}
+
+    def reset(self):
+        """Forget everything recorded, removing the file on disk."""
+        self.regions = {}
+        self.added = {}
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def lines(self, thresholds):
+        """Describe the profile, giving each region's thresholds in the order they'd be read."""
+        lines = []
+        for key in sorted(self.regions):
+            plot_type, region = key.split("/", 1)
+            plots = self.plots(plot_type, region)
+            order = " ".join(str(x) for x in self.order(plot_type, region, thresholds))
+            untrained = "" if self.trained(plot_type, region) else ", too few to reorder"
+            lines.append(f"{plot_type} {region}: {plots} plots{untrained}, read at {order}")
+        return lines
@@ -0,0 +1,107 @@
+"""Classify every image in a project as a likely SPSS plot, Stata plot or neither, without running any OCR.
+
+This is much quicker than a full run, so is useful to see how many candidate plots a corpus holds before committing
+to processing it. The results are written as triage.json, which a later full run reads to skip the images already
+found not to be plots, and triage.csv, listing the candidates for use in a spreadsheet. The line detection for each
+image is stored in the skeleton cache, so isn't repeated by the full run either."""
+
+import csv
+import json
+import multiprocessing
+import os
+
+from forestplots import progress
+
+TRIAGE_FILENAME = "triage.json"
+TRIAGE_CSV_FILENAME = "triage.csv"
+
+PLOT_TYPES = ["spss", "stata"]
+
+
+def classify_image(image_directory):
+    """Run line detection on a single image. Returns the Skeleton."""
+    from forestplots.skeleton import Skeleton # pylint: disable=import-outside-toplevel
+    return Skeleton(image_directory)
+
+
+def plot_type(skeleton):
+    """Get which type of plot a Skeleton looks like, or None if neither."""
+    if skeleton.likely_spss():
+        return "spss"
+    if skeleton.likely_stata():
+        return "stata"
+    return None
+
+
+def classify(image_directories, cache, processes=None):
+    """Find the Skeleton for many images, running the line detection in parallel on those not already in the
+    cache, and adding them to it. Returns a list of the Skeletons in the same order as the image directories."""
+    from forestplots.skeleton import Skeleton, REDUCTION # pylint: disable=import-outside-toplevel
+    image_directories = list(image_directories)
+    skeletons = [None] * len(image_directories)
+
+    keys = []
+    for index, image_directory in enumerate(image_directories):
+        key = cache.key(os.path.join(image_directory, "raw.png"), REDUCTION)
+        if cache.get(key) is not None:
+            skeletons[index] = Skeleton(image_directory, cache)
+        keys.append(key)
+
+    todo = [index for index, skeleton in enumerate(skeletons) if skeleton is None]
+    progress.advance(len(image_directories) - len(todo))
+    with multiprocessing.Pool(processes) as pool:
+        found = pool.imap(classify_image, [image_directories[index] for index in todo], chunksize=8)
+        for index, skeleton in zip(todo, found):
+            cache.put(keys[index], skeleton)
+            skeletons[index] = skeleton
+            progress.advance()
+
+    return skeletons
+
+
+def summarise(project_directory, classified):
+    """Make the triage report from a list of (ctree, image directory, plot type) tuples."""
+    papers = {}
+    counts = {"papers": 0, "papers_with_candidates": 0, "images": 0}
+    counts.update({name: 0 for name in PLOT_TYPES})
+
+    for ctree, image_directory, name in classified:
+        paper = papers.setdefault(os.path.basename(ctree), {})
+        paper[os.path.relpath(image_directory, project_directory)] = name
+        counts["images"] += 1
+        if name is not None:
+            counts[name] += 1
+
+    counts["papers"] = len(papers)
+    counts["papers_with_candidates"] = sum(1 for images in papers.values() if any(images.values()))
+    return {"summary": counts, "papers": papers}
+
+
+def save(project_directory, report):
+    """Write the triage report as JSON, and the candidate plots as CSV."""
+    with open(os.path.join(project_directory, TRIAGE_FILENAME), "w") as triage_file:
+        json.dump(report, triage_file, indent=4)
+
+    with open(os.path.join(project_directory, TRIAGE_CSV_FILENAME), "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["paper", "image", "type"])
+        for paper, images in sorted(report["papers"].items()):
+            for image_directory, name in sorted(images.items()):
+                if name is not None:
+                    writer.writerow([paper, os.path.basename(image_directory), name])
+
+
+def load(project_directory):
+    """Get the plot type found by triage for each image directory, keyed by its absolute path, or None if triage
+    hasn't been run on this project."""
+    try:
+        with open(os.path.join(project_directory, TRIAGE_FILENAME)) as triage_file:
+            report = json.load(triage_file)
+    except FileNotFoundError:
+        return None
+
+    types = {}
+    for images in report["papers"].values():
+        for image_directory, name in images.items():
+            types[os.path.abspath(os.path.join(project_directory, image_directory))] = name
+    return types
@@ -0,0 +1,218 @@
+"""A work queue held in a directory, so that many worker processes, on one machine or many sharing a network file
+system, can split the processing of a project between them.
+
+Each work item is a JSON file, which moves between the pending, leased, done and failed subdirectories of the queue.
+A worker claims an item by renaming it from pending to leased, which only one worker can do successfully, and then
+keeps touching the leased file while it works on it. The leased file is named with a token unique to the claim, so a
+worker whose lease has expired can't touch or release a lease someone else has since taken on the same item. If a
+worker dies, its lease stops being touched, and once it's older than the lease time any other worker will move the
+item back to pending to be tried again. This means an item can occasionally be processed twice, so processing must be
+safe to repeat.
+
+Lease times are compared to the current time on the machine doing the reclaiming, so the clocks of the machines
+sharing a queue need to be roughly in step."""
+
+import collections
+import json
+import os
+import re
+import socket
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+
+from forestplots import progress
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+# How many seconds a lease lasts without a heartbeat before the item is given to another worker
+LEASE_TIME = 300.0
+
+Lease = collections.namedtuple("Lease", "item_id item path")
+
+# The name of a leased file, which gives the item and the token of the claim
+LEASE_NAME_RE = re.compile(r'^(?P<item_id>.+)\.lease-[0-9a-f]+\.json$')
+
+
+class LeaseLost(Exception):
+    """Raised if a worker finds its lease has expired and the item was given to someone else."""
+
+
+def worker_name():
+    """Get a name for this worker process that is unique across machines."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue():
+    """A queue of JSON work items in a directory."""
+
+    def __init__(self, path, lease_time=LEASE_TIME):
+        self.path = path
+        self.lease_time = lease_time
+        for state in (PENDING, LEASED, DONE, FAILED):
+            os.makedirs(os.path.join(path, state), exist_ok=True)
+
+    def _path(self, state, item_id):
+        return os.path.join(self.path, state, f"{item_id}.json")
+
+    def _write(self, state, item_id, data):
+        directory = os.path.join(self.path, state)
+        handle, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp.")
+        with os.fdopen(handle, "w") as item_file:
+            json.dump(data, item_file)
+        os.replace(temp_path, self._path(state, item_id))
+
+    def _leases(self):
+        """Get the (item ID, path) of each leased file."""
+        leases = []
+        for name in sorted(os.listdir(os.path.join(self.path, LEASED))):
+            match = LEASE_NAME_RE.match(name)
+            if match:
+                leases.append((match.group("item_id"), os.path.join(self.path, LEASED, name)))
+        return leases
+
+    def _ids(self, state):
+        if state == LEASED:
+            return [item_id for item_id, _ in self._leases()]
+        names = os.listdir(os.path.join(self.path, state))
+        return sorted(x[:-len(".json")] for x in names if x.endswith(".json") and not x.startswith("."))
+
+    def enqueue(self, item_id, item):
+        """Add an item to the queue, unless it's already there. Returns whether it was added."""
+        if item_id in self._ids(LEASED):
+            return False
+        if any(os.path.exists(self._path(state, item_id)) for state in (PENDING, DONE, FAILED)):
+            return False
+        self._write(PENDING, item_id, item)
+        return True
+
+    def claim(self):
+        """Lease the next pending item. Returns the Lease, or None if there's nothing pending."""
+        for item_id in self._ids(PENDING):
+            path = os.path.join(self.path, LEASED, f"{item_id}.lease-{uuid.uuid4().hex}.json")
+            try:
+                os.rename(self._path(PENDING, item_id), path)
+            except FileNotFoundError:
+                # someone else got there first
+                continue
+            try:
+                # the rename keeps the old mtime, so we need to start the lease now
+                os.utime(path)
+                with open(path) as item_file:
+                    return Lease(item_id, json.load(item_file), path)
+            except FileNotFoundError:
+                # reclaimed by someone who saw the old mtime
+                continue
+        return None
+
+    def heartbeat(self, lease):
+        """Extend a lease. Raises LeaseLost if it has already been reclaimed."""
+        try:
+            os.utime(lease.path)
+        except FileNotFoundError as exc:
+            raise LeaseLost(lease.item_id) from exc
+
+    def complete(self, lease, result, failed=False):
+        """Record the result of a leased item, and release the lease. Raises LeaseLost, having still recorded the
+        result, if the lease had expired and been reclaimed, in which case any new lease on the item is left alone."""
+        self._write(FAILED if failed else DONE, lease.item_id, {"item": lease.item, "result": result})
+        lost = False
+        try:
+            os.remove(lease.path)
+        except FileNotFoundError:
+            lost = True
+        if not failed:
+            # if we were slow and it got reclaimed, don't let it be done again
+            try:
+                os.remove(self._path(PENDING, lease.item_id))
+            except FileNotFoundError:
+                pass
+        if lost:
+            raise LeaseLost(lease.item_id)
+
+    def reclaim(self):
+        """Move items whose leases have expired back to pending. Returns how many were reclaimed."""
+        count = 0
+        expired = time.time() - self.lease_time
+        for item_id, path in self._leases():
+            try:
+                if os.stat(path).st_mtime > expired:
+                    continue
+                os.rename(path, self._path(PENDING, item_id))
+            except FileNotFoundError:
+                continue
+            count += 1
+        return count
+
+    def counts(self):
+        """Get the number of items in each state."""
+        return {state: len(self._ids(state)) for state in (PENDING, LEASED, DONE, FAILED)}
+
+    def results(self, state=DONE):
+        """Get the (item, result) pairs for the finished items."""
+        results = []
+        for item_id in self._ids(state):
+            with open(self._path(state, item_id)) as item_file:
+                data = json.load(item_file)
+            results.append((data["item"], data["result"]))
+        return results
+
+
+class Heartbeat(threading.Thread):
+    """Keeps a lease alive in the background while an item is being worked on."""
+
+    def __init__(self, queue, lease):
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.lease = lease
+        self.stopped = threading.Event()
+        self.lost = False
+
+    def run(self):
+        while not self.stopped.wait(self.queue.lease_time / 4):
+            try:
+                self.queue.heartbeat(self.lease)
+            except LeaseLost:
+                self.lost = True
+                return
+
+    def stop(self):
+        """Stop sending heartbeats."""
+        self.stopped.set()
+        self.join()
+
+
+def run_worker(queue, handler, poll_interval=5.0):
+    """Process items from the queue with handler, which is given each item and returns a JSON compatible result,
+    until there's nothing left pending or leased by anyone. Returns the number of items this worker processed."""
+    processed = 0
+    while True:
+        queue.reclaim()
+        lease = queue.claim()
+        if lease is None:
+            if not queue.counts()[LEASED]:
+                return processed
+            # others are still working, and may die, in which case we'll pick up their work
+            time.sleep(poll_interval)
+            continue
+
+        heartbeat = Heartbeat(queue, lease)
+        heartbeat.start()
+        try:
+            result = handler(lease.item)
+        except Exception: # pylint: disable=broad-except
+            result = {"error": traceback.format_exc(), "worker": worker_name()}
+            failed = True
+        else:
+            failed = False
+        heartbeat.stop()
+        try:
+            queue.complete(lease, result, failed=failed)
+        except LeaseLost:
+            progress.log(f"Lease on {lease.item_id} expired while working on it")
+        processed += 1
@@ -0,0 +1,251 @@
+"""Fixtures and stand ins for the programs we run, shared between the tests."""
+
+import os
+import stat
+import sys
+import threading
+import time
+from unittest import mock
+
+import cv2
+import numpy as np
+
+from forestplots import SPSSForestPlot
+from forestplots import plots
+from forestplots.ocr import OCRWord
+
+# The OCR text of each region of a valid SPSS plot, read at a threshold of 60
+FOOTER_SUMMARY = 'Heterogeneity: Chi? = 2.11, df = 5 (P = 0.83); I= 0%\nTest for overall effect: Z = 3.80 (P = 0.0001)\n'
+HEADER = 'Odds Ratio\nM-H. Fixed. 95% Cl\n'
+TABLE = """Chua D (2010) 15 47 9 48 8.9% 1.70 (0.83, 3.50)
+Dou-Dou Li (2015) 9 18 5 18 7.4% 1.80 (0.75, 4.32)
+Total (95% CI) 65 66 100.0% 1.45 [1.04, 2.02]
+"""
+SCALE = "0.01 0.1 1 10 100\nFavours [Pedicle screw] Favours [Hybrid Instrumentation]\n"
+
+
+def make_spss_image_directory(ctree):
+    """Make the image directory of a valid SPSS plot in a CTree, with the OCR text of each region. Returns its
+    path."""
+    image_directory = os.path.join(ctree, "pdfimages", "image.4.1.96_0_800_400")
+    os.makedirs(image_directory)
+    for name in ["spss.png", "raw.footer.summary.png", "raw.header.graphheads.png", "raw.body.table.png",
+                 "raw.footer.scale.png"]:
+        open(os.path.join(image_directory, name), "wb").close()
+    for region, text in [("footer.summary", FOOTER_SUMMARY), ("header.graphheads", HEADER),
+                         ("body.table", TABLE), ("footer.scale", SCALE)]:
+        with open(os.path.join(image_directory, f"{region}.60.txt"), "w") as ocr_file:
+            ocr_file.write(text)
+    return image_directory
+
+
+TSV_HEADER = "level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext\n"
+
+# The rows of an SPSS table, with the left edge of each column in pixels
+TABLE_ROWS = [
+    ["Ahmed 2006", "29", "31", "5.5%", "-1.00 [-6.17, 4.17]"],
+    ["Bell 2008", "30", "28", "18.8%", "-1.00 [-3.79, 1.79]"],
+    ["Chan et al 2010", "177", "180", "15.5%", "2.50 [-0.58, 5.58]"],
+    ["Total (95% Cl)", "236", "239", "100.0%", "0.33 [-0.88, 1.54]"],
+]
+COLUMN_LEFTS = [10, 300, 400, 500, 640]
+
+
+def layout_words(rows, column_lefts, row_height=30, column_order=False, jitter=0):
+    """Make the OCRWords for a table laid out on a grid, as tesseract would find them. If column_order is set they're
+    listed a column at a time, as tesseract often reads tables."""
+    words = []
+    for row_index, row in enumerate(rows):
+        top = 20 + row_index * row_height + (jitter if row_index % 2 else 0)
+        for column_index, cell in enumerate(row):
+            left = column_lefts[column_index]
+            for text in cell.split():
+                words.append((column_index, row_index,
+                              OCRWord(text, 90.0, left, top, 12 * len(text), 16, column_index, 1, row_index)))
+                left += 12 * len(text) + 8
+    if column_order:
+        words.sort(key=lambda x: (x[0], x[1]))
+    return [word for _, _, word in words]
+
+
+def make_tsv(words):
+    """Write OCRWords out in tesseract's TSV format, with the page and line rows it also includes."""
+    tsv = TSV_HEADER + "1\t1\t0\t0\t0\t0\t0\t0\t800\t200\t-1\t\n"
+    for index, word in enumerate(words):
+        tsv += (f"4\t1\t{word.block}\t{word.paragraph}\t{word.line}\t0\t{word.left}\t{word.top}\t100\t16\t-1\t\n"
+                f"5\t1\t{word.block}\t{word.paragraph}\t{word.line}\t{index}\t{word.left}\t{word.top}\t"
+                f"{word.width}\t{word.height}\t{word.confidence}\t{word.text}\n")
+    return tsv
+
+
+def fill_every_threshold(image_directory):
+    """Copy the OCR text of each region of a plot made by make_spss_image_directory to every threshold, with the words
+    of a table laid out on a grid as the table's TSV, so there's nothing left to OCR."""
+    for region in SPSSForestPlot.REGIONS:
+        with open(os.path.join(image_directory, f"{region}.60.txt")) as ocr_file:
+            text = ocr_file.read()
+        for threshold in plots.THRESHOLDS:
+            with open(os.path.join(image_directory, f"{region}.{threshold}.txt"), "w") as ocr_file:
+                ocr_file.write(text)
+    for threshold in plots.THRESHOLDS:
+        with open(os.path.join(image_directory, f"body.table.{threshold}.tsv"), "w") as tsv_file:
+            tsv_file.write(make_tsv(layout_words(TABLE_ROWS, COLUMN_LEFTS)))
+
+
+def make_gradient_image_directory(directory):
+    """Make the image directory of an SPSS plot whose regions are all a gradient, so each threshold blackens a
+    different number of pixels. Returns its path."""
+    image_directory = os.path.join(directory, "image.4.1.96_0_800_400")
+    os.makedirs(image_directory)
+    image = np.tile(np.arange(256, dtype=np.uint8), (10, 1))
+    for region in SPSSForestPlot.REGIONS:
+        cv2.imwrite(os.path.join(image_directory, f"raw.{region}.png"), image)
+    return image_directory
+
+
+def ocred_thresholds(image_directory, region="footer.summary"):
+    """Get the thresholds a region of a plot has OCR text for."""
+    return [x for x in plots.THRESHOLDS if os.path.isfile(os.path.join(image_directory, f"{region}.{x}.txt"))]
+
+
+def draw_spss_like_plot():
+    """Draw the axes of an SPSS plot, with a little text, as a greyscale image."""
+    image = np.full((600, 800), 255, np.uint8)
+    for row in range(120, 500, 40):
+        cv2.putText(image, "Study 2010  12  34  1.23", (10, row), cv2.FONT_HERSHEY_SIMPLEX, 0.5, 0, 1)
+    cv2.line(image, (520, 60), (520, 540), 0, 2)
+    cv2.line(image, (0, 70), (799, 70), 0, 2)
+    cv2.line(image, (300, 530), (760, 530), 0, 2)
+    return image
+
+
+def draw_spss_axes(path):
+    """Draw the axes of an SPSS plot, and nothing else, to an image file."""
+    image = np.full((400, 800, 3), 255, np.uint8)
+    cv2.line(image, (500, 40), (500, 360), (0, 0, 0), 2)
+    cv2.line(image, (0, 50), (799, 50), (0, 0, 0), 2)
+    cv2.line(image, (300, 350), (700, 350), (0, 0, 0), 2)
+    cv2.imwrite(path, image)
+
+
+# A stand in for tesseract that reads the number of black pixels in each image, taking either an image or a file
+# listing images, and logging what it was asked to read. If FAKE_TESSERACT_DROP is set it misses the last image of a
+# list, as tesseract does with images it can't open. If FAKE_TESSERACT_SLOW is set it takes a minute over images of any
+# of the comma separated regions it gives.
+FAKE_TESSERACT = f"""#!{sys.executable}
+import os
+import sys
+import time
+import cv2
+source, output_base = sys.argv[1:3]
+with open(os.environ["FAKE_TESSERACT_LOG"], "a") as log_file:
+    log_file.write(source + "\\n")
+if source.endswith(".txt"):
+    with open(source) as list_file:
+        images = list_file.read().split()
+    if os.environ.get("FAKE_TESSERACT_DROP"):
+        images = images[:-1]
+else:
+    images = [source]
+slow = [x for x in os.environ.get("FAKE_TESSERACT_SLOW", "").split(",") if x]
+if any(f"/{{region}}." in path for region in slow for path in images):
+    time.sleep(60)
+text = ""
+rows = ["level\\tpage_num\\tblock_num\\tpar_num\\tline_num\\tword_num\\tleft\\ttop\\twidth\\theight\\tconf\\ttext"]
+for page, path in enumerate(images, 1):
+    black = int((cv2.imread(path, cv2.IMREAD_GRAYSCALE) == 0).sum())
+    text += f"black {{black}}\\n\\f"
+    rows.append(f"1\\t{{page}}\\t0\\t0\\t0\\t0\\t0\\t0\\t100\\t20\\t-1\\t")
+    rows.append(f"5\\t{{page}}\\t1\\t1\\t1\\t1\\t0\\t0\\t10\\t10\\t95\\t{{black}}")
+with open(output_base + ".txt", "w") as text_file:
+    text_file.write(text)
+with open(output_base + ".tsv", "w") as tsv_file:
+    tsv_file.write("\\n".join(rows) + "\\n")
+"""
+
+
+# A stand in for tesseract that reads an image from its standard input and writes the number of black pixels in it
+# as a word to its standard output, logging each call
+FAKE_STDIN_TESSERACT = f"""#!{sys.executable}
+import os
+import sys
+import cv2
+import numpy as np
+assert sys.argv[1:] == ["stdin", "stdout", "tsv"], sys.argv
+with open(os.environ["FAKE_TESSERACT_LOG"], "a") as log_file:
+    log_file.write("call\\n")
+image = cv2.imdecode(np.frombuffer(sys.stdin.buffer.read(), np.uint8), cv2.IMREAD_GRAYSCALE)
+black = int((image == 0).sum())
+print("level\\tpage_num\\tblock_num\\tpar_num\\tline_num\\tword_num\\tleft\\ttop\\twidth\\theight\\tconf\\ttext")
+print(f"5\\t1\\t1\\t1\\t1\\t1\\t0\\t0\\t10\\t10\\t95\\tblack")
+print(f"5\\t1\\t1\\t1\\t1\\t2\\t20\\t0\\t10\\t10\\t95\\t{{black}}")
+"""
+
+
+# A stand in for tesseract that reports each blob of ink in the image as a word, with its box
+FAKE_BLOB_TESSERACT = f"""#!{sys.executable}
+import sys
+import cv2
+image = cv2.imread(sys.argv[1], cv2.IMREAD_GRAYSCALE)
+count, _, stats, _ = cv2.connectedComponentsWithStats((image < 128).astype("uint8"))
+rows = ["level\\tpage_num\\tblock_num\\tpar_num\\tline_num\\tword_num\\tleft\\ttop\\twidth\\theight\\tconf\\ttext"]
+for index in range(1, count):
+    left, top, width, height, _ = stats[index]
+    rows.append(f"5\\t1\\t{{index}}\\t1\\t1\\t1\\t{{left}}\\t{{top}}\\t{{width}}\\t{{height}}\\t90\\tbox{{width}}")
+with open(sys.argv[2] + ".tsv", "w") as tsv_file:
+    tsv_file.write("\\n".join(rows) + "\\n")
+"""
+
+
+def use_fake_command(test_case, directory, name, script, environ=None):
+    """Put a script first on the PATH as the named command, and set any other environment variables given, until the
+    test case is cleaned up."""
+    bin_directory = os.path.join(directory, "bin")
+    os.makedirs(bin_directory, exist_ok=True)
+    command_path = os.path.join(bin_directory, name)
+    with open(command_path, "w") as command_file:
+        command_file.write(script)
+    os.chmod(command_path, os.stat(command_path).st_mode | stat.S_IEXEC)
+    patcher = mock.patch.dict(os.environ, dict(environ or {}, PATH=bin_directory + os.pathsep + os.environ["PATH"]))
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+
+
+def use_fake_tesseract(test_case, directory, script=FAKE_TESSERACT):
+    """Put one of the stand ins for tesseract on the PATH until the test case is cleaned up. Returns the path of the
+    log it writes its calls to."""
+    log_path = os.path.join(directory, "tesseract.log")
+    use_fake_command(test_case, directory, "tesseract", script, {"FAKE_TESSERACT_LOG": log_path})
+    return log_path
+
+
+class TimedSPSSForestPlot(SPSSForestPlot):
+    """Counts how many OCR commands run at once, each taking a little while, and longer for the regions after the
+    footer."""
+
+    def __init__(self, image_directory, projections):
+        super().__init__(image_directory, projections)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.most_running = 0
+        self.commands = []
+
+    @staticmethod
+    def _after_footer(command):
+        source = command[1]
+        if source.endswith(".txt"):
+            with open(source) as list_file:
+                source = list_file.read()
+        return "footer.summary" not in source
+
+    def _run_ocr_command(self, command, images=1, stdin=None):
+        with self.lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+            self.commands.append(command)
+        try:
+            time.sleep(1.0 if self._after_footer(command) else 0.0)
+            return super()._run_ocr_command(command, images, stdin)
+        finally:
+            with self.lock:
+                self.running -= 1
@@ -0,0 +1,109 @@
+import concurrent.futures
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from forestplots import api
+from forestplots import replay
+from forestplots.ocr import black_threshold
+from forestplots.plots import ForestPlot, InvalidForestPlot
+
+from tests.support import FAKE_STDIN_TESSERACT, draw_spss_like_plot, make_spss_image_directory, use_fake_tesseract
+
+
+class LoadImageTests(unittest.TestCase):
+
+    def test_bytes(self):
+        image = np.tile(np.arange(0, 250, 10, dtype=np.uint8), (5, 1))
+        _, png = cv2.imencode(".png", image)
+        self.assertTrue(np.array_equal(api.load_image(png.tobytes()), image))
+
+    def test_colour(self):
+        image = np.zeros((4, 6, 3), np.uint8)
+        image[:, :, 2] = 255
+        self.assertEqual(api.load_image(image).shape, (4, 6))
+        self.assertEqual(api.load_image(np.zeros((4, 6, 4), np.uint8)).shape, (4, 6))
+
+    def test_not_an_image(self):
+        for image in (b"not an image", np.zeros((4, 6), np.float32), np.zeros((4, 6, 2), np.uint8), "raw.png"):
+            with self.assertRaises(ValueError):
+                api.load_image(image)
+
+
+class InMemoryOCRTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.log_path = use_fake_tesseract(self, self.tempdir.name, FAKE_STDIN_TESSERACT)
+
+        self.original_directory = os.getcwd()
+        self.work_directory = os.path.join(self.tempdir.name, "work")
+        os.makedirs(self.work_directory)
+        os.chdir(self.work_directory)
+
+    def tearDown(self):
+        os.chdir(self.original_directory)
+        self.tempdir.cleanup()
+
+    def test_ocr_through_pipes(self):
+        image = np.tile(np.arange(256, dtype=np.uint8), (10, 1))
+        plot = api.InMemorySPSSForestPlot(image, None)
+        plot._save_region("footer.summary", image)
+
+        black = int((black_threshold(image, 60) == 0).sum())
+        self.assertEqual(plot._ocr("footer.summary", 60), f"black {black}\n")
+        self.assertEqual([x.text for x in plot._ocr_words("footer.summary", 60)], ["black", str(black)])
+        with open(self.log_path) as log_file:
+            self.assertEqual(len(log_file.read().split()), 1)
+
+        # nothing is written to disk
+        self.assertEqual(os.listdir(self.work_directory), [])
+
+    def test_missing_region(self):
+        plot = api.InMemoryStataForestPlot(np.zeros((10, 10), np.uint8), None)
+        with self.assertRaises(InvalidForestPlot):
+            plot._ocr("header", 60)
+        with self.assertRaises(InvalidForestPlot):
+            plot._process_header()
+
+    def test_extract_plot(self):
+        image = draw_spss_like_plot()
+        self.assertIsInstance(api.classify(image), api.InMemorySPSSForestPlot)
+        # the fake text isn't a footer, so the plot is rejected, but only once its regions have been OCRed
+        self.assertEqual(api.extract(image), {"plot_type": "spss", "valid": False})
+        with open(self.log_path) as log_file:
+            self.assertTrue(log_file.read().split())
+        self.assertEqual(os.listdir(self.work_directory), [])
+
+    def test_region_not_on_disk(self):
+        image = np.tile(np.arange(256, dtype=np.uint8), (10, 1))
+        plot = api.InMemoryStataForestPlot(image, None)
+        plot._save_region("header", image)
+        # the fake text isn't a header, but the region is there to be read
+        plot._process_header()
+        self.assertEqual(plot.summary, {})
+        self.assertEqual(os.listdir(self.work_directory), [])
+
+
+class ExtractTests(unittest.TestCase):
+
+    def test_describe(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            image_directory = make_spss_image_directory(os.path.join(tempdir, "pmc5502154"))
+            plot = ForestPlot.load(image_directory, replay.decode_image(image_directory))
+        result = api.describe(plot)
+        self.assertEqual(result["plot_type"], "spss")
+        self.assertTrue(result["valid"])
+        self.assertEqual(result["overall"]["rows"][-1][1], 1.45)
+        self.assertEqual(result["subgroups"], [])
+        self.assertEqual(result["heterogeneity"], plot.hetrogeneity)
+
+    def test_not_a_plot(self):
+        blank = np.full((300, 400), 255, np.uint8)
+        _, png = cv2.imencode(".png", blank)
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(api.extract, [blank, png.tobytes()] * 4))
+        self.assertEqual(results, [{"plot_type": None, "valid": False}] * 8)
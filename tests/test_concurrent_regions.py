@@ -0,0 +1,81 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from forestplots import InvalidForestPlot, SPSSForestPlot
+from forestplots import plots
+
+from tests.support import (TimedSPSSForestPlot, fill_every_threshold, make_gradient_image_directory,
+                           make_spss_image_directory, ocred_thresholds, use_fake_tesseract)
+
+
+class ConcurrentRegionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.image_directory = make_gradient_image_directory(self.tempdir.name)
+        use_fake_tesseract(self, self.tempdir.name)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def ocred_regions(self):
+        return {x.rsplit(".", 2)[0] for x in os.listdir(self.image_directory) if x.endswith(".txt")}
+
+    def test_one_region_at_a_time(self):
+        plot = TimedSPSSForestPlot(self.image_directory, None)
+        # the fake text isn't a footer, so the plot is rejected having read only the footer
+        with self.assertRaises(InvalidForestPlot):
+            plot.process()
+        self.assertEqual(plot.most_running, 1)
+        self.assertEqual(self.ocred_regions(), {"footer.summary"})
+
+    def test_regions_at_once(self):
+        plot = TimedSPSSForestPlot(self.image_directory, None)
+        plot.concurrent_regions = True
+        # the probe would reject the plot before any region was read concurrently
+        plot.use_probe = False
+        with self.assertRaises(InvalidForestPlot):
+            plot.process()
+        self.assertGreater(plot.most_running, 1)
+        self.assertIsNone(plot.prefetch)
+
+        # the rest of the regions were cancelled part way, and nothing more is run once process has returned
+        commands = len(plot.commands)
+        for region in SPSSForestPlot.REGIONS:
+            done = ocred_thresholds(self.image_directory, region)
+            if region == "footer.summary":
+                self.assertEqual(done, list(plots.THRESHOLDS))
+            else:
+                self.assertLess(len(done), len(plots.THRESHOLDS))
+        time.sleep(0.2)
+        self.assertEqual(len(plot.commands), commands)
+
+    def test_cancel_kills_ocr(self):
+        # everything but the footer takes a minute to read, so cancelling mustn't wait for it
+        slow = ",".join(x for x in SPSSForestPlot.REGIONS if x != "footer.summary")
+        plot = SPSSForestPlot(self.image_directory, None)
+        plot.concurrent_regions = True
+        plot.use_probe = False
+        start = time.monotonic()
+        with mock.patch.dict(os.environ, {"FAKE_TESSERACT_SLOW": slow}), self.assertRaises(InvalidForestPlot):
+            plot.process()
+        self.assertLess(time.monotonic() - start, 30)
+        self.assertEqual(self.ocred_regions(), {"footer.summary"})
+        # nor were the killed batches counted as timeouts
+        self.assertEqual(plot.ocr_timeouts, 0)
+        self.assertFalse(plot.budget_exhausted)
+
+    def test_same_results(self):
+        image_directory = make_spss_image_directory(os.path.join(self.tempdir.name, "pmc1"))
+        # with OCR output at every threshold there's nothing left to OCR, so only the order of decoding can differ
+        fill_every_threshold(image_directory)
+        expected = SPSSForestPlot(image_directory, None)
+        expected.process()
+
+        plot = SPSSForestPlot(image_directory, None)
+        plot.concurrent_regions = True
+        plot.process()
+        self.assertEqual(plot.dump(), expected.dump())
@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+
+from forestplots import corpus
+
+from tests.support import make_spss_image_directory
+
+
+class DecoderCorpusTests(unittest.TestCase):
+
+    def test_corpus(self):
+        cases = corpus.load_corpus()
+        self.assertTrue(cases)
+
+        for case in cases:
+            if "xfail" in case:
+                continue
+            with self.subTest(decoder=case["decoder"], name=case["name"]):
+                passed, actual = corpus.run_case(case)
+                self.assertTrue(passed, f"got {actual}")
+
+    def test_every_decoder_is_covered(self):
+        covered = {case["decoder"] for case in corpus.load_corpus()}
+        self.assertEqual(covered, set(corpus.DECODERS))
+
+    def test_benchmark(self):
+        cases = corpus.load_corpus()
+        throughput = corpus.benchmark(cases, minimum_time=0.01)
+        self.assertEqual(set(throughput), set(corpus.DECODERS))
+        self.assertTrue(all(x > 0 for x in throughput.values()))
+
+    def test_harvest(self):
+        with tempfile.TemporaryDirectory() as project_directory:
+            image_directory = make_spss_image_directory(os.path.join(project_directory, "pmc5502154"))
+            cases = corpus.harvest([image_directory])
+
+        self.assertEqual(sorted(case["decoder"] for case in cases), [
+            "ForestPlot._decode_table_values_ocr",
+            "SPSSForestPlot._decode_footer_scale_ocr",
+            "SPSSForestPlot._decode_footer_summary_ocr",
+            "SPSSForestPlot._decode_header_summary_ocr",
+            "SPSSForestPlot._decode_table_lines_ocr",
+        ])
+        for case in cases:
+            self.assertTrue(corpus.run_case(case)[0])
@@ -0,0 +1,128 @@
+import os
+import random
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+import openpyxl
+
+from forestplots import Controller
+from forestplots import dedupe
+
+from tests.support import make_spss_image_directory
+
+
+def draw_plot(seed):
+    """Draw something with the layout of a forest plot: a table of studies and their confidence intervals."""
+    generator = random.Random(seed)
+    image = np.full((500, 900), 255, np.uint8)
+    rows = generator.randint(3, 12)
+    for row in range(rows):
+        y = 60 + row * 30
+        cv2.putText(image, f"Study {generator.randint(1900, 2020)} {generator.randint(1, 99)}", (10, y),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, 0, 1)
+        x = 600 + generator.randint(-80, 80)
+        cv2.line(image, (x - generator.randint(10, 60), y - 5), (x + generator.randint(10, 60), y - 5), 0, 1)
+        cv2.rectangle(image, (x - 3, y - 8), (x + 3, y - 2), 0, -1)
+    cv2.line(image, (650, 40), (650, 60 + rows * 30), 0, 1)
+    cv2.line(image, (500, 70 + rows * 30), (800, 70 + rows * 30), 0, 1)
+    return image
+
+
+def reproduce(image):
+    """Shrink and recompress an image, as another publisher might."""
+    height, width = image.shape
+    small = cv2.resize(image, (int(width * 0.7), int(height * 0.7)), interpolation=cv2.INTER_AREA)
+    _, encoded = cv2.imencode(".jpg", small, [cv2.IMWRITE_JPEG_QUALITY, 60])
+    return cv2.imdecode(encoded, cv2.IMREAD_GRAYSCALE)
+
+
+class DedupeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def hash_image(self, name, image):
+        path = os.path.join(self.tempdir.name, f"{name}.png")
+        cv2.imwrite(path, image)
+        return dedupe.image_hash(path)
+
+    def test_unreadable(self):
+        path = os.path.join(self.tempdir.name, "raw.png")
+        open(path, "wb").close()
+        self.assertIsNone(dedupe.image_hash(path))
+
+    def test_same_image(self):
+        plots = [draw_plot(seed) for seed in range(12)]
+        hashes = [self.hash_image(index, image) for index, image in enumerate(plots)]
+        for index, image in enumerate(plots):
+            self.assertIsNotNone(dedupe.same_image(hashes[index], self.hash_image("copy", reproduce(image))))
+            for other in range(index + 1, len(plots)):
+                self.assertIsNone(dedupe.same_image(hashes[index], hashes[other]))
+
+    def test_different_aspect(self):
+        image = draw_plot(0)
+        stretched = cv2.resize(image, (900, 400), interpolation=cv2.INTER_AREA)
+        self.assertIsNone(dedupe.same_image(self.hash_image("a", image), self.hash_image("b", stretched)))
+
+    def test_find_duplicates(self):
+        first, second = draw_plot(1), draw_plot(2)
+        hashed = [
+            ("a", "spss", self.hash_image("a", first)),
+            ("b", "spss", self.hash_image("b", second)),
+            ("c", "spss", self.hash_image("c", reproduce(second))),
+            ("d", "stata", self.hash_image("d", first)),
+            ("e", "spss", self.hash_image("e", first)),
+        ]
+        duplicates = dedupe.find_duplicates(hashed)
+        self.assertEqual([(x.image_directory, x.representative) for x in duplicates], [("c", "b"), ("e", "a")])
+        self.assertEqual(duplicates[1].distance, 0)
+
+    def test_save_and_load(self):
+        project = self.tempdir.name
+        duplicates = [
+            dedupe.Duplicate(os.path.join(project, "p2", "image.1"), os.path.join(project, "p1", "image.1"), 3),
+            dedupe.Duplicate(os.path.join(project, "p3", "image.2"), os.path.join(project, "p1", "image.1"), 0),
+        ]
+        dedupe.save(project, duplicates)
+        self.assertEqual(dedupe.load(project), duplicates)
+
+    def test_load_missing(self):
+        self.assertEqual(dedupe.load(self.tempdir.name), [])
+
+
+class ReplayDuplicatesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.project_directory = self.tempdir.name
+        self.image_directory = make_spss_image_directory(os.path.join(self.project_directory, "pmc5502154"))
+
+        # a copy of the plot in the review's update, which has never been OCRed
+        self.copy_directory = os.path.join(self.project_directory, "pmc6000001", "pdfimages", "image.2.1.90_0_800_400")
+        os.makedirs(self.copy_directory)
+        open(os.path.join(self.copy_directory, "spss.png"), "wb").close()
+        dedupe.save(self.project_directory, [dedupe.Duplicate(self.copy_directory, self.image_directory, 2)])
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_replay_copies_results(self):
+        Controller(self.project_directory).replay(1)
+
+        workbook = openpyxl.load_workbook(os.path.join(self.project_directory, "results.xlsx"))
+        worksheet = workbook["Summary"]
+        values = [worksheet.cell(row=row, column=6).value for row in range(4, worksheet.max_row + 1)]
+        self.assertEqual([x for x in values if x is not None], [1.45, 1.45])
+        self.assertTrue(os.path.isfile(os.path.join(self.copy_directory, "plot-results.xlsx")))
+
+        worksheet = workbook["Duplicates"]
+        self.assertEqual([x.value for x in worksheet[4][1:4]], [
+            os.path.relpath(self.copy_directory, self.project_directory),
+            os.path.relpath(self.image_directory, self.project_directory),
+            2,
+        ])
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from forestplots.filelock import FileLock
+
+
+class FileLockTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, "shared.json")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_taking_turns(self):
+        holding = []
+        overlaps = []
+
+        def hold():
+            for _ in range(20):
+                with FileLock(self.path, poll_interval=0.001):
+                    holding.append(threading.get_ident())
+                    if len(holding) > 1:
+                        overlaps.append(list(holding))
+                    time.sleep(0.001)
+                    holding.remove(threading.get_ident())
+
+        threads = [threading.Thread(target=hold) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(overlaps, [])
+        self.assertEqual(os.listdir(self.tempdir.name), [])
+
+    def test_stale_lock_removed(self):
+        # a lock left by a process that died
+        with open(f"{self.path}.lock", "w"):
+            pass
+        old = time.time() - 120
+        os.utime(f"{self.path}.lock", (old, old))
+        with FileLock(self.path, stale_time=60, poll_interval=0.001):
+            self.assertTrue(os.path.exists(f"{self.path}.lock"))
+        self.assertFalse(os.path.exists(f"{self.path}.lock"))
+
+    def test_waits_for_holder(self):
+        lock = FileLock(self.path, poll_interval=0.001)
+        lock.__enter__()
+        taken = threading.Event()
+
+        def take():
+            with FileLock(self.path, poll_interval=0.001):
+                taken.set()
+
+        thread = threading.Thread(target=take)
+        thread.start()
+        self.assertFalse(taken.wait(0.1))
+        lock.__exit__(None, None, None)
+        self.assertTrue(taken.wait(5))
+        thread.join()
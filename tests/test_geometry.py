@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+
+from forestplots import SPSSForestPlot
+from forestplots.geometry import cluster_columns, cluster_rows, table_cells
+from forestplots.ocr import OCRWord, parse_tsv
+
+from tests.support import COLUMN_LEFTS, TABLE_ROWS, TSV_HEADER, layout_words, make_tsv
+
+
+class ParseTSVTests(unittest.TestCase):
+
+    def test_parse_tsv(self):
+        words = layout_words(TABLE_ROWS[:1], COLUMN_LEFTS)
+        self.assertEqual(parse_tsv(make_tsv(words)), words)
+
+    def test_skips_empty_and_broken_rows(self):
+        tsv = TSV_HEADER + "5\t1\t1\t1\t1\t1\t10\t20\t30\t16\t95.5\t \n5\t1\t1\t1\t1\t2\tten\t20\t30\t16\t95\tx\n"
+        tsv += "5\t1\t1\t1\t1\t3\t50\t20\t30\t16\t91\tStudy\n"
+        self.assertEqual(parse_tsv(tsv), [OCRWord("Study", 91.0, 50, 20, 30, 16, 1, 1, 1)])
+
+
+class GeometryTests(unittest.TestCase):
+
+    def test_rows(self):
+        words = layout_words(TABLE_ROWS, COLUMN_LEFTS, column_order=True, jitter=4)
+        rows = cluster_rows(words)
+        self.assertEqual([" ".join(word.text for word in row) for row in rows], [" ".join(x) for x in TABLE_ROWS])
+
+    def test_columns(self):
+        rows = cluster_rows(layout_words(TABLE_ROWS, COLUMN_LEFTS))
+        columns = cluster_columns(rows)
+        self.assertEqual([left for left, _ in columns], COLUMN_LEFTS)
+
+    def test_columns_with_straggler(self):
+        rows = TABLE_ROWS + [["Heterogeneity: Not applicable and some more words running across", "", "", "", ""]]
+        self.assertEqual(table_cells(layout_words(rows * 2, COLUMN_LEFTS))[:4], TABLE_ROWS)
+
+    def test_cells(self):
+        table = table_cells(layout_words(TABLE_ROWS, COLUMN_LEFTS, column_order=True))
+        self.assertEqual(table, TABLE_ROWS)
+
+    def test_empty(self):
+        self.assertEqual(table_cells([]), [])
+
+    def test_scattered(self):
+        # no span is covered in enough rows to be a column, as in a noisy reading, so the rows are kept whole
+        words = [OCRWord(f"w{i}", 50.0, 70 * i, 20 + 30 * i, 40, 16, 1, 1, i) for i in range(10)]
+        self.assertEqual(cluster_columns(cluster_rows(words)), [(0, 670)])
+        self.assertEqual(table_cells(words), [[f"w{i}"] for i in range(10)])
+
+
+class DecodeSPSSTableWordsTests(unittest.TestCase):
+
+    def test_scattered(self):
+        words = [OCRWord(text, 50.0, 70 * i, 20 + 30 * i, 40, 16, 1, 1, i)
+                 for i, text in enumerate(["Study", "12", "1.50", "[0.50,", "2.50]", "noise", "7", "x", "y", "z"])]
+        self.assertEqual(SPSSForestPlot._decode_table_words_ocr(words), ([], [], []))
+
+    def test_column_order(self):
+        words = layout_words(TABLE_ROWS, COLUMN_LEFTS, column_order=True)
+        titles, values, confidences = SPSSForestPlot._decode_table_words_ocr(words)
+        self.assertEqual(titles, ["Ahmed 2006", "Bell 2008", "Chan et al 2010", "Total (95% CI)"])
+        self.assertEqual(values, [(-1.0, -6.17, 4.17), (-1.0, -3.79, 1.79), (2.5, -0.58, 5.58), (0.33, -0.88, 1.54)])
+        self.assertEqual(confidences, [90.0] * 4)
+
+    def test_early_stop(self):
+        with tempfile.TemporaryDirectory() as image_directory:
+            open(os.path.join(image_directory, "raw.body.table.png"), "wb").close()
+            words = layout_words(TABLE_ROWS, COLUMN_LEFTS, column_order=True)
+            for threshold in (50, 52, 54, 56, 58):
+                with open(os.path.join(image_directory, f"body.table.{threshold}.tsv"), "w") as tsv_file:
+                    tsv_file.write(make_tsv(words if threshold != 50 else words[:6]))
+
+            plot = SPSSForestPlot(image_directory, None, replay=True)
+            plot._process_table()
+
+        # the first threshold only read part of the table, and we stop once the next three confidently agree
+        self.assertEqual(len(plot.primary_table.table_data), 3)
+        self.assertEqual(plot.primary_table.passes, 4)
+        self.assertEqual(plot.primary_table.collapse_data()[0], ("Ahmed 2006", -1.0, -6.17, 4.17))
+
+    def test_no_early_stop_on_short_readings(self):
+        with tempfile.TemporaryDirectory() as image_directory:
+            open(os.path.join(image_directory, "raw.body.table.png"), "wb").close()
+            for threshold in (50, 52, 54, 56, 58, 60, 62):
+                # the lightest thresholds lose the last row of the table, but agree with each other on the rest
+                rows = TABLE_ROWS[:3] if threshold < 54 else TABLE_ROWS
+                with open(os.path.join(image_directory, f"body.table.{threshold}.tsv"), "w") as tsv_file:
+                    tsv_file.write(make_tsv(layout_words(rows, COLUMN_LEFTS)))
+
+            plot = SPSSForestPlot(image_directory, None, replay=True)
+            plot._process_table()
+
+        table = plot.primary_table
+        self.assertEqual([x[0] for x in table.collapse_data()],
+                         ["Ahmed 2006", "Bell 2008", "Chan et al 2010", "Total (95% CI)"])
+        # four full readings are needed to outvote the two short ones by the margin
+        self.assertEqual(table.passes, 6)
@@ -1,6 +1,6 @@
 import unittest
 
-from forestplots.helpers import forgiving_float
+from forestplots.helpers import forgiving_float, normalize_ocr, numeric_tokens, resolve_label, NumericToken
 
 class ForgivingFloatTests(unittest.TestCase):
 
@@ -22,3 +22,24 @@ class ForgivingFloatTests(unittest.TestCase):
     def test_forgiving_float_garbage(self):
         with self.assertRaises(ValueError):
             forgiving_float("hello")
+
+
+class NormalizeOCRTests(unittest.TestCase):
+
+    def test_normalize_ocr(self):
+        normalized = normalize_ocr("  Study £1.0 §.3$  \n\n  Total\n")
+        self.assertEqual(normalized.text, "  Study [-1.0 5.35  \n\n  Total\n")
+        self.assertEqual(normalized.lines, ("Study [-1.0 5.35", "Total"))
+
+    def test_numeric_tokens(self):
+        self.assertEqual(numeric_tokens("0,01 —0.1 1 10 Favours 100"), [
+            NumericToken("0,01", 0.01),
+            NumericToken("—0.1", -0.1),
+            NumericToken("1", 1.0),
+            NumericToken("10", 10.0),
+        ])
+        self.assertEqual(numeric_tokens("Favours 1 10"), [])
+
+    def test_resolve_label(self):
+        self.assertEqual(resolve_label("Chi?", ("Tau", "Chi", "df")), "Chi")
+        self.assertIsNone(resolve_label("Heterogeneity", ("Tau", "Chi", "df")))
@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import openpyxl
+
+from forestplots import Controller
+from forestplots import ingest
+
+PDF = b"%%PDF-1.4\n1 0 obj << /Title (%s) /CreationDate (D:%s) >> endobj\ntrailer << /ID [<%s> <%s>] >>\n%%%%EOF\n"
+
+
+def make_pdf(path, title, created="20190101", document_id="ab12"):
+    with open(path, "wb") as pdf_file:
+        pdf_file.write(PDF % (title.encode(), created.encode(), document_id.encode(), document_id.encode()))
+
+
+class IngestTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.project_directory = self.tempdir.name
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def path(self, *names):
+        return os.path.join(self.project_directory, *names)
+
+    def test_normalised_digest(self):
+        make_pdf(self.path("a.pdf"), "Review")
+        make_pdf(self.path("b.pdf"), "Review", created="20200505", document_id="cd34")
+        make_pdf(self.path("c.pdf"), "Update")
+        self.assertEqual(ingest.pdf_digest(self.path("a.pdf")), ingest.pdf_digest(self.path("b.pdf")))
+        self.assertNotEqual(ingest.pdf_digest(self.path("a.pdf")), ingest.pdf_digest(self.path("c.pdf")))
+
+    def test_set_aside(self):
+        make_pdf(self.path("review.pdf"), "Review")
+        shutil.copy(self.path("review.pdf"), self.path("review (1).pdf"))
+        make_pdf(self.path("update.pdf"), "Update")
+        make_pdf(self.path("update-download.PDF"), "Update", created="20200505")
+
+        self.assertEqual(ingest.set_aside_duplicates(self.project_directory), 2)
+        self.assertEqual(sorted(x for x in os.listdir(self.project_directory) if x.lower().endswith(".pdf")),
+                         ["review.pdf", "update.pdf"])
+        self.assertEqual(sorted(os.listdir(self.path(ingest.SET_ASIDE_DIRECTORY))),
+                         ["review (1).pdf", "update-download.PDF"])
+
+        # running again, as when the stage is rerun before normami has made the ctrees, changes nothing
+        self.assertEqual(ingest.set_aside_duplicates(self.project_directory), 0)
+        self.assertEqual(ingest.inputs(self.project_directory), [
+            ("review (1).pdf", "review.pdf", None),
+            ("review.pdf", "review.pdf", None),
+            ("update-download.PDF", "update.pdf", None),
+            ("update.pdf", "update.pdf", None),
+        ])
+
+    def test_later_copy(self):
+        make_pdf(self.path("review.pdf"), "Review")
+        ingest.set_aside_duplicates(self.project_directory)
+
+        # normami moves the PDF into its ctree
+        os.makedirs(self.path("review"))
+        os.replace(self.path("review.pdf"), self.path("review", "fulltext.pdf"))
+        ingest.link_ctrees(self.project_directory, [self.path("review")])
+
+        make_pdf(self.path("review-again.pdf"), "Review", document_id="ef56")
+        self.assertEqual(ingest.set_aside_duplicates(self.project_directory), 1)
+        self.assertEqual(ingest.inputs(self.project_directory), [
+            ("review-again.pdf", "review.pdf", "review"),
+            ("review.pdf", "review.pdf", "review"),
+        ])
+
+    def test_results_list_inputs(self):
+        make_pdf(self.path("review.pdf"), "Review")
+        shutil.copy(self.path("review.pdf"), self.path("review-copy.pdf"))
+        ingest.set_aside_duplicates(self.project_directory)
+        os.makedirs(self.path("review"))
+        os.replace(self.path("review.pdf"), self.path("review", "fulltext.pdf"))
+        ingest.link_ctrees(self.project_directory, [self.path("review")])
+
+        controller = Controller(self.project_directory)
+        self.assertEqual(controller.ctrees(), [self.path("review")])
+        controller.replay(1)
+
+        worksheet = openpyxl.load_workbook(self.path("results.xlsx"))["Inputs"]
+        self.assertEqual([[x.value for x in row[1:4]] for row in worksheet.iter_rows(min_row=4)], [
+            ["review-copy.pdf", "review.pdf", "review"],
+            ["review.pdf", "review.pdf", "review"],
+        ])
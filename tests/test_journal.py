@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+
+import openpyxl
+
+from forestplots import Controller
+from forestplots import replay
+from forestplots import triage
+from forestplots.journal import Journal, JOURNAL_FILENAME
+
+from tests.support import make_spss_image_directory
+
+
+class JournalTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, JOURNAL_FILENAME)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_round_trip(self):
+        journal = Journal(self.path)
+        journal.reset()
+        journal.append({"image_directory": "a", "plot": None})
+        journal.append({"image_directory": "b", "plot": {"type": "spss"}})
+
+        self.assertEqual(Journal(self.path).load(), {
+            "a": {"image_directory": "a", "plot": None},
+            "b": {"image_directory": "b", "plot": {"type": "spss"}},
+        })
+
+    def test_missing_journal(self):
+        self.assertEqual(Journal(self.path).load(), {})
+
+    def test_incomplete_last_record(self):
+        journal = Journal(self.path)
+        journal.reset()
+        journal.append({"image_directory": "a", "plot": None})
+        with open(self.path, "a") as journal_file:
+            journal_file.write('{"image_directory": "b", "plo')
+
+        journal = Journal(self.path)
+        self.assertEqual(list(journal.load()), ["a"])
+
+        journal.append({"image_directory": "c", "plot": None})
+        self.assertEqual(list(Journal(self.path).load()), ["a", "c"])
+
+
+class ResumeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.project_directory = self.tempdir.name
+        ctree = os.path.join(self.project_directory, "pmc5502154")
+        self.image_directory = make_spss_image_directory(ctree)
+
+        # triage has already extracted and classified the images
+        report = triage.summarise(self.project_directory, [(ctree, self.image_directory, "spss")])
+        triage.save(self.project_directory, report)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_resume(self):
+        # an earlier run that finished this plot before dying
+        journal = Journal(os.path.join(self.project_directory, JOURNAL_FILENAME))
+        journal.reset()
+        journal.append({
+            "image_directory": os.path.relpath(self.image_directory, self.project_directory),
+            "plot": replay.decode_image(self.image_directory),
+            "slow_plot": None,
+        })
+
+        # there's no raw.png, so this would fail if it tried to process the plot again
+        Controller(self.project_directory).main(resume=True)
+
+        workbook = openpyxl.load_workbook(os.path.join(self.project_directory, "results.xlsx"))
+        worksheet = workbook.active
+        self.assertEqual(worksheet.cell(row=5, column=2).value, "spss")
+        self.assertEqual(worksheet.cell(row=5, column=6).value, 1.45)
+
+    def test_no_resume_starts_again(self):
+        journal = Journal(os.path.join(self.project_directory, JOURNAL_FILENAME))
+        journal.reset()
+        journal.append({
+            "image_directory": os.path.relpath(self.image_directory, self.project_directory),
+            "plot": replay.decode_image(self.image_directory),
+            "slow_plot": None,
+        })
+
+        with self.assertRaises(FileNotFoundError):
+            Controller(self.project_directory).main()
+        self.assertEqual(Journal(os.path.join(self.project_directory, JOURNAL_FILENAME)).load(), {})
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import cv2
+import numpy as np
+
+from forestplots import montage
+from forestplots.ocr import OCRWord, black_threshold, parse_tsv
+
+from tests.support import FAKE_BLOB_TESSERACT, use_fake_tesseract
+
+
+class MontageLayoutTests(unittest.TestCase):
+
+    def test_black_threshold(self):
+        image = np.array([[0, 100, 127, 128, 200, 255]], np.uint8)
+        self.assertEqual(black_threshold(image, 50).tolist(), [[0, 0, 0, 128, 200, 255]])
+
+    def test_layout(self):
+        crops = [(montage.Crop("a", "header", threshold), 300, 40) for threshold in range(50, 60, 2)]
+        sheets = montage.layout(crops)
+        self.assertEqual(len(sheets), 1)
+        self.assertEqual([x.top for x in sheets[0]], [60, 160, 260, 360, 460])
+
+    def test_layout_splits_tall_sheets(self):
+        crops = [(montage.Crop("a", "header", 50), 300, 390)] * 60
+        sheets = montage.layout(crops)
+        self.assertEqual([len(x) for x in sheets], [44, 16])
+        for sheet in sheets:
+            self.assertLessEqual(sheet[-1].top + sheet[-1].height + montage.PADDING, montage.MAX_SHEET_HEIGHT)
+
+    def test_split_words(self):
+        placements = montage.layout([(montage.Crop("a", "header", 50), 300, 40),
+                                     (montage.Crop("a", "header", 52), 300, 40)])[0]
+        words = [
+            OCRWord("Odds", 95.0, 70, 70, 40, 20, 1, 1, 1),
+            OCRWord("Ratio", 95.0, 120, 170, 40, 20, 2, 1, 1),
+            OCRWord("noise", 10.0, 70, 120, 40, 10, 3, 1, 1),
+        ]
+        first, second = montage.split_words(words, placements)
+        self.assertEqual(first, [OCRWord("Odds", 95.0, 10, 10, 40, 20, 1, 1, 1)])
+        self.assertEqual(second, [OCRWord("Ratio", 95.0, 60, 10, 40, 20, 2, 1, 1)])
+
+
+class MontageOCRTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        use_fake_tesseract(self, self.tempdir.name, FAKE_BLOB_TESSERACT)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def make_plot(self, name, box_left, box_width):
+        image_directory = os.path.join(self.tempdir.name, name)
+        os.makedirs(image_directory)
+        for region in ("header", "scale"):
+            image = np.full((50, 400), 255, np.uint8)
+            # grey, so it's only black enough to be read above some thresholds
+            cv2.rectangle(image, (box_left, 10), (box_left + box_width - 1, 29), 150, -1)
+            cv2.imwrite(os.path.join(image_directory, f"raw.{region}.png"), image)
+        return image_directory
+
+    def test_ocr_crops(self):
+        first = self.make_plot("first", 20, 30)
+        second = self.make_plot("second", 100, 70)
+        big = os.path.join(self.tempdir.name, "big")
+        os.makedirs(big)
+        cv2.imwrite(os.path.join(big, "raw.header.png"), np.full((montage.MAX_CROP_HEIGHT + 1, 100), 255, np.uint8))
+
+        crops = []
+        for image_directory in (first, second):
+            crops.extend(montage.pending_crops(image_directory, ("header", "scale"), (50, 60, 70)))
+        crops.extend(montage.pending_crops(big, ("header",), (50,)))
+        self.assertEqual(montage.ocr_crops(crops), 12)
+
+        # 150 is 59% of white, so the box is only blackened at 60% and above
+        for image_directory, left, width in ((first, 20, 30), (second, 100, 70)):
+            for region in ("header", "scale"):
+                with open(os.path.join(image_directory, f"{region}.50.tsv")) as tsv_file:
+                    self.assertEqual(parse_tsv(tsv_file.read()), [])
+                for threshold in (60, 70):
+                    with open(os.path.join(image_directory, f"{region}.{threshold}.tsv")) as tsv_file:
+                        words = parse_tsv(tsv_file.read())
+                    self.assertEqual([(x.left, x.top, x.width, x.height) for x in words], [(left, 10, width, 20)])
+                    with open(os.path.join(image_directory, f"{region}.{threshold}.txt")) as ocr_file:
+                        self.assertEqual(ocr_file.read(), f"box{width}\n")
+
+        self.assertFalse(os.path.isfile(os.path.join(big, "header.50.txt")))
+        self.assertEqual(montage.pending_crops(first, ("header", "scale"), (50, 60, 70)), [])
+
+    def test_missing_tesseract(self):
+        image_directory = self.make_plot("plot", 20, 30)
+        with mock.patch.dict(os.environ, {"PATH": os.path.join(self.tempdir.name, "nowhere")}):
+            self.assertEqual(montage.ocr_crops(montage.pending_crops(image_directory, ("header",), (60,))), 0)
+        self.assertFalse(os.path.isfile(os.path.join(image_directory, "header.60.txt")))
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import cv2
+import numpy as np
+
+from forestplots import SPSSForestPlot
+from forestplots import plots
+from forestplots.ocr import black_threshold, parse_tsv, split_batch_output
+
+from tests.support import ocred_thresholds, use_fake_tesseract
+
+
+class SplitBatchOutputTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.batch_base = os.path.join(self.tempdir.name, "batch")
+        self.output_bases = [os.path.join(self.tempdir.name, f"footer.{x}") for x in (50, 52)]
+        header = "level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext\n"
+        with open(f"{self.batch_base}.tsv", "w") as tsv_file:
+            tsv_file.write(header + "1\t1\t0\t0\t0\t0\t0\t0\t9\t9\t-1\t\n5\t1\t1\t1\t1\t1\t1\t2\t3\t4\t96\tOdds\n"
+                           "1\t2\t0\t0\t0\t0\t0\t0\t9\t9\t-1\t\n5\t2\t1\t1\t1\t1\t5\t6\t7\t8\t91\tRatio\n")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_split(self):
+        with open(f"{self.batch_base}.txt", "w") as text_file:
+            text_file.write("Odds\n\fRatio\n\f")
+        self.assertTrue(split_batch_output(self.batch_base, self.output_bases))
+
+        for output_base, text in zip(self.output_bases, ("Odds", "Ratio")):
+            with open(f"{output_base}.txt") as text_file:
+                self.assertEqual(text_file.read(), f"{text}\n\f")
+            with open(f"{output_base}.tsv") as tsv_file:
+                self.assertEqual([x.text for x in parse_tsv(tsv_file.read())], [text])
+
+    def test_missing_page(self):
+        with open(f"{self.batch_base}.txt", "w") as text_file:
+            text_file.write("Odds\n\f")
+        self.assertFalse(split_batch_output(self.batch_base, self.output_bases))
+        self.assertFalse(os.path.isfile(f"{self.output_bases[0]}.txt"))
+
+
+class PlotOCRBatchTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.image_directory = os.path.join(self.tempdir.name, "image.4.1.96_0_800_400")
+        os.makedirs(self.image_directory)
+
+        # a gradient, so each threshold blackens a different number of pixels
+        self.image = np.tile(np.arange(256, dtype=np.uint8), (10, 1))
+        cv2.imwrite(os.path.join(self.image_directory, "raw.footer.summary.png"), self.image)
+        self.log_path = use_fake_tesseract(self, self.tempdir.name)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def calls(self):
+        with open(self.log_path) as log_file:
+            return log_file.read().split()
+
+    def expected_text(self, threshold):
+        return f"black {int((black_threshold(self.image, threshold) == 0).sum())}\n\f"
+
+    def test_whole_region(self):
+        plot = SPSSForestPlot(self.image_directory, None)
+        plot._ocr_batch("footer.summary", plots.THRESHOLDS)
+        self.assertEqual(len(self.calls()), 1)
+
+        for threshold in plots.THRESHOLDS:
+            self.assertEqual(plot._ocr("footer.summary", threshold), self.expected_text(threshold))
+            self.assertEqual(len(plot._ocr_words("footer.summary", threshold)), 1)
+        self.assertEqual(len(self.calls()), 1)
+
+    def test_next_few_thresholds(self):
+        plot = SPSSForestPlot(self.image_directory, None)
+        self.assertEqual(plot._ocr("footer.summary", 50), self.expected_text(50))
+        self.assertEqual(len(self.calls()), 1)
+
+        self.assertEqual(ocred_thresholds(self.image_directory), list(plots.THRESHOLDS)[:plots.OCR_BATCH_SIZE])
+
+    def test_falls_back_to_one_at_a_time(self):
+        plot = SPSSForestPlot(self.image_directory, None)
+        with mock.patch.dict(os.environ, {"FAKE_TESSERACT_DROP": "yes"}):
+            self.assertEqual(plot._ocr("footer.summary", 50), self.expected_text(50))
+
+        calls = self.calls()
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(calls[0].endswith(".txt"))
+        self.assertEqual(calls[1], os.path.join(self.image_directory, "footer.summary.50.png"))
@@ -0,0 +1,54 @@
+import os
+import tempfile
+import time
+import unittest
+
+from forestplots import SPSSForestPlot
+
+from tests.support import use_fake_command
+
+
+class OCRBudgetTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.image_directory = os.path.join(self.tempdir.name, "image.4.1.96_0_800_400")
+        os.makedirs(self.image_directory)
+        open(os.path.join(self.image_directory, "raw.footer.summary.png"), "wb").close()
+
+        # A convert that hangs, as it can on a malformed image
+        use_fake_command(self, self.tempdir.name, "convert", "#!/bin/sh\nsleep 30\n")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_ocr_timeout(self):
+        plot = SPSSForestPlot(self.image_directory, None)
+        plot.ocr_timeout = 0.2
+
+        start = time.monotonic()
+        self.assertIsNone(plot._ocr("footer.summary", 60))
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(plot.ocr_timeouts, 1)
+        self.assertFalse(plot.budget_exhausted)
+
+    def test_plot_budget(self):
+        plot = SPSSForestPlot(self.image_directory, None)
+        plot.deadline = time.monotonic() + 0.2
+
+        start = time.monotonic()
+        plot._process_footer()
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertTrue(plot.budget_exhausted)
+        self.assertEqual(plot.ocr_timeouts, 0)
+        self.assertEqual(plot.hetrogeneity, {})
+
+    def test_existing_ocr_is_used_after_budget(self):
+        with open(os.path.join(self.image_directory, "footer.summary.60.txt"), "w") as ocr_file:
+            ocr_file.write("Heterogeneity: Chi? = 2.11, df = 5 (P = 0.83); I= 0%\n")
+        plot = SPSSForestPlot(self.image_directory, None)
+        plot.deadline = time.monotonic()
+
+        plot._process_footer()
+        self.assertTrue(plot.budget_exhausted)
+        self.assertEqual(plot.hetrogeneity, {"Chi": 2.11, "df": 5.0, "P": 0.83, "I": 0.0})
@@ -0,0 +1,147 @@
+import os
+import tempfile
+import unittest
+
+import openpyxl
+
+from forestplots import Controller
+from forestplots import triage
+from forestplots.pipeline import Pipeline, Stage, PIPELINE_FILENAME
+
+from tests.support import make_spss_image_directory
+
+
+class PipelineTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.project_directory = self.tempdir.name
+        for name in ("x", "y"):
+            self.write(f"{name}.in", name)
+        self.ran = []
+        self.fail_on = None
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.project_directory, name)
+
+    def write(self, name, text):
+        with open(self.path(name), "w") as text_file:
+            text_file.write(text)
+
+    def read(self, name):
+        with open(self.path(name)) as text_file:
+            return text_file.read()
+
+    def upper(self, item):
+        self.ran.append(("upper", item))
+        if item == self.fail_on:
+            raise RuntimeError(f"failed on {item}")
+        self.write(f"{item}.upper", self.read(f"{item}.in").upper())
+
+    def join(self, _):
+        self.ran.append(("join", ""))
+        self.write("joined", "".join(self.read(f"{x}.upper") for x in ("x", "y")))
+
+    def pipeline(self):
+        return Pipeline(self.project_directory, [
+            Stage("join", ["upper"], self.join,
+                  inputs=lambda item: [self.path("x.upper"), self.path("y.upper")],
+                  outputs=lambda item: [self.path("joined")]),
+            Stage("upper", [], self.upper,
+                  inputs=lambda item: [self.path(f"{item}.in")],
+                  outputs=lambda item: [self.path(f"{item}.upper")],
+                  items=lambda: ["x", "y"]),
+        ])
+
+    def test_order(self):
+        pipeline = self.pipeline()
+        self.assertEqual([x.name for x in pipeline.order()], ["upper", "join"])
+        self.assertEqual([x.name for x in pipeline.order(["join"])], ["join"])
+        with self.assertRaises(ValueError):
+            pipeline.order(["spell"])
+
+    def test_cycle(self):
+        pipeline = Pipeline(self.project_directory, [
+            Stage("a", ["b"], self.join, inputs=lambda item: [], outputs=lambda item: []),
+            Stage("b", ["a"], self.join, inputs=lambda item: [], outputs=lambda item: []),
+        ])
+        with self.assertRaises(ValueError):
+            pipeline.order()
+
+    def test_up_to_date(self):
+        self.pipeline().run()
+        self.assertEqual(self.read("joined"), "XY")
+        self.assertEqual(self.ran, [("upper", "x"), ("upper", "y"), ("join", "")])
+        self.assertTrue(os.path.isfile(self.path(PIPELINE_FILENAME)))
+
+        self.ran = []
+        self.pipeline().run()
+        self.assertEqual(self.ran, [])
+
+    def test_changed_input(self):
+        self.pipeline().run()
+        self.ran = []
+        self.write("y.in", "why")
+        self.pipeline().run()
+        self.assertEqual(self.ran, [("upper", "y"), ("join", "")])
+        self.assertEqual(self.read("joined"), "XWHY")
+
+    def test_missing_output(self):
+        self.pipeline().run()
+        self.ran = []
+        os.remove(self.path("x.upper"))
+        self.pipeline().run()
+        self.assertEqual(self.ran, [("upper", "x"), ("join", "")])
+
+    def test_rerun_after_failure(self):
+        self.fail_on = "y"
+        with self.assertRaises(RuntimeError):
+            self.pipeline().run()
+        self.assertFalse(os.path.isfile(self.path("joined")))
+
+        self.fail_on = None
+        self.ran = []
+        self.pipeline().run()
+        self.assertEqual(self.ran, [("upper", "y"), ("join", "")])
+        self.assertEqual(self.read("joined"), "XY")
+
+    def test_single_stage(self):
+        self.pipeline().run(["upper"])
+        self.assertFalse(os.path.isfile(self.path("joined")))
+        self.ran = []
+        self.pipeline().run(["join"])
+        self.assertEqual(self.ran, [("join", "")])
+
+
+class ControllerStageTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.project_directory = self.tempdir.name
+        ctree = os.path.join(self.project_directory, "pmc5502154")
+        self.image_directory = make_spss_image_directory(ctree)
+        report = triage.summarise(self.project_directory, [(ctree, self.image_directory, "spss")])
+        triage.save(self.project_directory, report)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_results_stage(self):
+        results_path = os.path.join(self.project_directory, "results.xlsx")
+        Controller(self.project_directory).run_stages(["results"])
+
+        worksheet = openpyxl.load_workbook(results_path).active
+        self.assertEqual(worksheet.cell(row=5, column=2).value, "spss")
+        self.assertEqual(worksheet.cell(row=5, column=6).value, 1.45)
+
+        # nothing has changed, so the results aren't made again
+        modified = os.stat(results_path).st_mtime_ns
+        Controller(self.project_directory).run_stages(["results"])
+        self.assertEqual(os.stat(results_path).st_mtime_ns, modified)
+
+    def test_stage_names(self):
+        self.assertEqual([x.name for x in Controller(self.project_directory).stages()],
+                         ["makeproject", "pdf", "filter", "classify", "dedupe", "crop", "ocr", "results"])
@@ -0,0 +1,165 @@
+import json
+import os
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+from forestplots import Controller, InvalidForestPlot, SPSSForestPlot, StataForestPlot
+from forestplots import montage
+from forestplots import plots
+from forestplots import probe
+
+from tests.support import (TimedSPSSForestPlot, fill_every_threshold, make_gradient_image_directory,
+                           make_spss_image_directory, ocred_thresholds, use_fake_tesseract)
+
+CORPUS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+
+class ProbeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.image_directory = make_gradient_image_directory(self.tempdir.name)
+        use_fake_tesseract(self, self.tempdir.name)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_rejected(self):
+        plot = TimedSPSSForestPlot(self.image_directory, None)
+        # the fake text doesn't look anything like a footer
+        with self.assertRaises(InvalidForestPlot):
+            plot.process()
+        self.assertEqual(plot.probe_outcome, probe.REJECTED)
+        self.assertEqual(ocred_thresholds(self.image_directory), sorted(probe.THRESHOLDS))
+        self.assertEqual(len(plot.commands), 1)
+
+    def test_no_probe(self):
+        plot = TimedSPSSForestPlot(self.image_directory, None)
+        plot.use_probe = False
+        with self.assertRaises(InvalidForestPlot):
+            plot.process()
+        self.assertIsNone(plot.probe_outcome)
+        self.assertEqual(ocred_thresholds(self.image_directory), list(plots.THRESHOLDS))
+
+    def test_passed(self):
+        image_directory = make_spss_image_directory(os.path.join(self.tempdir.name, "pmc1"))
+        fill_every_threshold(image_directory)
+
+        plot = SPSSForestPlot(image_directory, None)
+        plot.process()
+        self.assertEqual(plot.probe_outcome, probe.PASSED)
+        self.assertIsNotNone(plot.sweep_seconds)
+
+    def test_replay_not_probed(self):
+        image_directory = make_spss_image_directory(os.path.join(self.tempdir.name, "pmc1"))
+        plot = SPSSForestPlot(image_directory, None, replay=True)
+        plot.process()
+        self.assertIsNone(plot.probe_outcome)
+
+    def test_corpus_passes(self):
+        # the probe must never reject text that the decoder of the decisive region can read
+        for plot_class, filename in ((SPSSForestPlot, "spss_footer_summary.json"),
+                                     (StataForestPlot, "stata_header.json")):
+            with open(os.path.join(CORPUS_DIRECTORY, filename)) as corpus_file:
+                cases = json.load(corpus_file)
+            for case in cases:
+                with self.subTest(case["name"]):
+                    self.assertTrue(plot_class.PROBE_RE.search(plots.normalize_ocr(case["ocr"]).text))
+
+
+class UncroppedSPSSForestPlot(SPSSForestPlot):
+    """A plot whose regions are taken to be already cropped."""
+
+    def break_up_image(self):
+        pass
+
+
+class MontageTests(unittest.TestCase):
+
+    def montage_crops(self, use_probe):
+        with tempfile.TemporaryDirectory() as project:
+            image_directory = os.path.join(project, "image.4.1.96_0_800_400")
+            plot = UncroppedSPSSForestPlot(image_directory, None)
+            plot.use_probe = use_probe
+            with mock.patch.object(Controller, "classify_image", return_value=plot), \
+                    mock.patch.object(montage, "ocr_crops", return_value=0) as ocr_crops:
+                Controller(project).montage_ocr([(None, image_directory)], None)
+        return [(x.region, x.threshold) for x in ocr_crops.call_args[0][0]]
+
+    def test_probe_region_left_for_probe(self):
+        # only the probe thresholds of the decisive region are read in the montage, so a plot the probe rejects
+        # isn't read at the rest
+        crops = self.montage_crops(True)
+        self.assertEqual([x for region, x in crops if region == "footer.summary"], list(probe.THRESHOLDS))
+        self.assertEqual([x for region, x in crops if region == "footer.scale"], list(plots.THRESHOLDS))
+
+    def test_no_probe(self):
+        crops = self.montage_crops(False)
+        self.assertEqual([x for region, x in crops if region == "footer.summary"], list(plots.THRESHOLDS))
+
+    def test_crops_passed_through(self):
+        # the images the montage crops aren't cropped again when they're processed
+        with tempfile.TemporaryDirectory() as project:
+            image_directory = os.path.join(project, "image.4.1.96_0_800_400")
+            os.makedirs(image_directory)
+            plot = SPSSForestPlot(image_directory, None)
+            with mock.patch.object(Controller, "classify_image", return_value=plot), \
+                    mock.patch.object(SPSSForestPlot, "break_up_image") as break_up_image, \
+                    mock.patch.object(SPSSForestPlot, "process", side_effect=InvalidForestPlot), \
+                    mock.patch.object(montage, "ocr_crops", return_value=0):
+                controller = Controller(project)
+                cropped = controller.montage_ocr([(None, image_directory)], None)
+                self.assertEqual(cropped, {image_directory})
+                controller.process_image(image_directory, None, image_directory in cropped)
+        self.assertEqual(break_up_image.call_count, 1)
+
+    def test_already_cropped(self):
+        # the pipeline's crop stage has already cropped the images, and those it couldn't are left out
+        with tempfile.TemporaryDirectory() as project:
+            image_directory = os.path.join(project, "image.4.1.96_0_800_400")
+            os.makedirs(image_directory)
+            plot = SPSSForestPlot(image_directory, None)
+            with mock.patch.object(Controller, "classify_image", return_value=plot), \
+                    mock.patch.object(SPSSForestPlot, "break_up_image") as break_up_image, \
+                    mock.patch.object(montage, "ocr_crops", return_value=0) as ocr_crops:
+                self.assertEqual(Controller(project).montage_ocr([(None, image_directory)], None, cropped=True), set())
+                self.assertEqual(ocr_crops.call_args[0][0], [])
+                for region in SPSSForestPlot.MONTAGE_REGIONS:
+                    with open(os.path.join(image_directory, f"raw.{region}.png"), "wb"):
+                        pass
+                self.assertEqual(Controller(project).montage_ocr([(None, image_directory)], None, cropped=True),
+                                 {image_directory})
+        break_up_image.assert_not_called()
+
+
+class ProbeStatsTests(unittest.TestCase):
+
+    def test_counts(self):
+        stats = probe.ProbeStats()
+        self.assertIsNone(stats.rejection_rate())
+        for outcome, probe_seconds, sweep_seconds in [(probe.REJECTED, 1.0, None), (probe.REJECTED, 1.0, None),
+                                                      (probe.REJECTED, 1.0, None), (probe.PASSED, 1.0, 6.0),
+                                                      (probe.PASSED, 1.0, 4.0), (None, 0.0, None)]:
+            stats.add(types.SimpleNamespace(probe_outcome=outcome, probe_seconds=probe_seconds,
+                                            sweep_seconds=sweep_seconds))
+        self.assertEqual(stats.plots, 6)
+        self.assertEqual(stats.probed, 5)
+        self.assertAlmostEqual(stats.rejection_rate(), 0.6)
+        self.assertAlmostEqual(stats.saved_seconds(), 15.0)
+        self.assertEqual(stats.line(), "Probe rejected 3 of 5 plots (60%) in 5s, saving about 15s of OCR")
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, probe.STATS_FILENAME)
+            stats.save(path)
+            with open(path) as stats_file:
+                summary = json.load(stats_file)
+        self.assertEqual(summary["rejected"], 3)
+        self.assertEqual(summary["mean_sweep_seconds"], 5.0)
+
+    def test_nothing_passed(self):
+        stats = probe.ProbeStats()
+        stats.add(types.SimpleNamespace(probe_outcome=probe.REJECTED, probe_seconds=1.0, sweep_seconds=None))
+        self.assertIsNone(stats.saved_seconds())
+        self.assertIn("no plot passed", stats.line())
@@ -0,0 +1,120 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from forestplots import Controller
+from forestplots import progress
+from forestplots.progress import Progress
+
+from tests.support import make_spss_image_directory
+
+
+class Clock():
+    """A clock that only moves when told to."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class ProgressTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.status_path = os.path.join(self.tempdir.name, progress.STATUS_FILENAME)
+        self.clock = Clock()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def read_status(self):
+        with open(self.status_path) as status_file:
+            return json.load(status_file)
+
+    def test_rates_and_eta(self):
+        counter = Progress("process", 100, papers=10, status_path=self.status_path, clock=self.clock)
+        self.assertIsNone(counter.eta())
+
+        for _ in range(10):
+            self.clock.now += 6
+            counter.advance()
+            counter.ocr_call(3)
+        counter.advance(images=0, plots=4, papers=2)
+
+        image_rate, ocr_rate = counter.rates()
+        self.assertAlmostEqual(image_rate, 10 / 60)
+        self.assertAlmostEqual(ocr_rate, 30 / 60)
+        self.assertAlmostEqual(counter.eta(), 90 * 6)
+        self.assertEqual(counter.line(), "process, 2/10 papers, 10/100 images, 4 plots, 10.0 images/min, "
+                                         "0.5 OCR calls/s, ETA 0:09:00")
+
+    def test_rolling_eta(self):
+        counter = Progress("process", 1000, clock=self.clock)
+        # quick to begin with, then slowing down once the easy images are done
+        for _ in range(500):
+            self.clock.now += 1
+            counter.advance()
+        for _ in range(100):
+            self.clock.now += 10
+            counter.advance()
+        self.assertLess(abs(counter.eta() - 400 * 10), 400)
+
+    def test_status_file(self):
+        counter = Progress("process", 4, papers=2, status_path=self.status_path, clock=self.clock)
+        counter.write_status()
+        self.assertEqual(self.read_status()["images"], {"done": 0, "total": 4})
+
+        self.clock.now += progress.STATUS_INTERVAL
+        counter.advance(plots=1)
+        status = self.read_status()
+        self.assertEqual(status["images"], {"done": 1, "total": 4})
+        self.assertEqual(status["plots_found"], 1)
+        self.assertFalse(status["finished"])
+
+        counter.finish()
+        status = self.read_status()
+        self.assertTrue(status["finished"])
+        self.assertFalse(os.path.exists(f"{self.status_path}.tmp"))
+
+    def test_concurrent_ocr_calls(self):
+        counter = Progress("process", 4, status_path=self.status_path, clock=self.clock)
+        errors = []
+
+        def count():
+            try:
+                for _ in range(50):
+                    counter.ocr_call()
+            except Exception as exc:  # pylint: disable=broad-except
+                errors.append(exc)
+
+        # every call writes the status file, as the threads reading a plot's regions would once it's due
+        with mock.patch.object(progress, "STATUS_INTERVAL", 0):
+            threads = [threading.Thread(target=count) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.read_status()["ocr_calls"], 8 * 50)
+        self.assertEqual(os.listdir(self.tempdir.name), [progress.STATUS_FILENAME])
+
+    def test_nothing_started(self):
+        self.assertIsNone(progress.current())
+        progress.advance()
+        progress.ocr_call()
+        progress.finish()
+
+    def test_replay_reports(self):
+        make_spss_image_directory(os.path.join(self.tempdir.name, "pmc5502154"))
+        Controller(self.tempdir.name).replay(1)
+        status = self.read_status()
+        self.assertEqual(status["stage"], "replay")
+        self.assertTrue(status["finished"])
+        self.assertEqual(status["images"], {"done": 1, "total": 1})
+        self.assertEqual(status["plots_found"], 1)
+        self.assertIsNone(progress.current())
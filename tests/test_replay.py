@@ -0,0 +1,68 @@
+import json
+import os
+import tempfile
+import unittest
+
+import openpyxl
+
+from forestplots import Controller
+from forestplots import replay
+
+from tests.support import make_spss_image_directory
+
+
+class ReplayTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.ctree = os.path.join(self.tempdir.name, "pmc5502154")
+        self.image_directory = make_spss_image_directory(self.ctree)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_decode_image(self):
+        state = replay.decode_image(self.image_directory)
+        self.assertEqual(state["type"], "spss")
+        self.assertEqual(state["summary"], {"Esimator type": "M-H", "Model type": "Fixed",
+                                            "Confidence interval": "95"})
+        self.assertEqual(state["hetrogeneity"], {"Chi": 2.11, "df": 5.0, "P": 0.83, "I": 0.0})
+        self.assertEqual(state["mid_point"], 1.0)
+        self.assertEqual(len(state["tables"][0]["table_data"][0]), 3)
+
+    def test_cached_decode_is_reused_until_decoders_change(self):
+        replay.decode_image(self.image_directory)
+
+        cache_path = os.path.join(self.image_directory, replay.DECODED_FILENAME)
+        with open(cache_path) as cache_file:
+            cached = json.load(cache_file)
+        cached["plot"]["summary"] = {"marker": True}
+        with open(cache_path, "w") as cache_file:
+            json.dump(cached, cache_file)
+
+        self.assertEqual(replay.decode_image(self.image_directory)["summary"], {"marker": True})
+
+        original_version = replay.decoder_version()
+        try:
+            replay._DECODER_VERSION = "changed"
+            self.assertNotIn("marker", replay.decode_image(self.image_directory)["summary"])
+        finally:
+            replay._DECODER_VERSION = original_version
+
+    def test_cached_decode_is_invalidated_by_new_ocr(self):
+        self.assertIsNotNone(replay.decode_image(self.image_directory))
+
+        # Overwrite the OCR so the footer no longer decodes, which makes it an invalid plot
+        with open(os.path.join(self.image_directory, "footer.summary.60.txt"), "w") as ocr_file:
+            ocr_file.write("nothing useful here")
+        self.assertIsNone(replay.decode_image(self.image_directory))
+
+    def test_controller_replay(self):
+        Controller(self.tempdir.name).replay(processes=2)
+
+        workbook = openpyxl.load_workbook(os.path.join(self.tempdir.name, "results.xlsx"))
+        worksheet = workbook.active
+        self.assertEqual(worksheet.cell(row=4, column=3).value, 5502154)
+        self.assertEqual(worksheet.cell(row=5, column=2).value, "spss")
+        self.assertEqual(worksheet.cell(row=5, column=4).value, "4.1.96")
+        self.assertEqual(worksheet.cell(row=5, column=6).value, 1.45)
@@ -0,0 +1,194 @@
+import http.client
+import json
+import os
+import socket
+import tempfile
+import threading
+import unittest
+
+import cv2
+
+from forestplots import api
+from forestplots import service
+
+from tests.support import FAKE_STDIN_TESSERACT, draw_spss_like_plot, use_fake_tesseract
+
+
+class SlowExtractor():
+    """Extracts nothing, blocking until released so jobs can be caught while running."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def __call__(self, image):
+        self.calls += 1
+        if image == b"not an image":
+            raise api.BadImage("Can't decode image")
+        if image == b"bad value":
+            raise ValueError("could not convert string to float")
+        if image == b"crash":
+            raise RuntimeError("decoder crashed")
+        self.release.wait(10)
+        return {"plot_type": "spss", "valid": True, "size": len(image)}
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+class ServiceTests(unittest.TestCase):
+
+    def setUp(self):
+        self.extractor = SlowExtractor()
+        self.service = service.Service(self.extractor, workers=1, max_queued=1)
+        self.server = service.HTTPServer(self.service, ("127.0.0.1", 0))
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.extractor.release.set()
+        self.server.shutdown()
+        self.server.server_close()
+        self.service.shutdown()
+
+    def request(self, method, path, body=None):
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.server_address[1], timeout=10)
+        connection.request(method, path, body=body)
+        response = connection.getresponse()
+        result = response.status, json.loads(response.read())
+        connection.close()
+        return result
+
+    def test_submit_and_fetch(self):
+        status, job = self.request("POST", "/jobs", b"image bytes")
+        self.assertEqual(status, 202)
+        self.assertIn(job["status"], (service.QUEUED, service.RUNNING))
+
+        status, result = self.request("GET", f"/jobs/{job['id']}/result")
+        self.assertEqual(status, 409)
+
+        self.extractor.release.set()
+        self.service.get(job["id"]).done.wait(10)
+        status, polled = self.request("GET", f"/jobs/{job['id']}")
+        self.assertEqual(status, 200)
+        self.assertEqual(polled["status"], service.DONE)
+        status, result = self.request("GET", f"/jobs/{job['id']}/result")
+        self.assertEqual(status, 200)
+        self.assertEqual(result, {"plot_type": "spss", "valid": True, "size": 11})
+
+    def test_unknown(self):
+        self.assertEqual(self.request("GET", "/jobs/0123abcd")[0], 404)
+        self.assertEqual(self.request("GET", "/jobs/0123abcd/result")[0], 404)
+        self.assertEqual(self.request("GET", "/nothing")[0], 404)
+        self.assertEqual(self.request("POST", "/nothing", b"image")[0], 404)
+
+    def test_queue_full(self):
+        self.assertEqual(self.request("POST", "/jobs", b"one")[0], 202)
+        self.assertEqual(self.request("POST", "/jobs", b"two")[0], 202)
+        status, _ = self.request("POST", "/jobs", b"three")
+        self.assertEqual(status, 503)
+        status, health = self.request("GET", "/health")
+        self.assertEqual(status, 200)
+        self.assertEqual(health["queued"] + health["running"], 2)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.request("POST", "/jobs", b"")[0], 400)
+        status, result = self.request("POST", "/extract", b"not an image")
+        self.assertEqual(status, 400)
+        self.assertEqual(result["status"], service.FAILED)
+        status, result = self.request("POST", "/extract", b"crash")
+        self.assertEqual(status, 500)
+        self.assertIn("decoder crashed", result["error"])
+        # a ValueError from the decoders is our fault, not the image's
+        status, result = self.request("POST", "/extract", b"bad value")
+        self.assertEqual(status, 500)
+
+    def test_extract_waits(self):
+        self.extractor.release.set()
+        status, result = self.request("POST", "/extract", b"image")
+        self.assertEqual(status, 200)
+        self.assertEqual(result["size"], 5)
+
+
+class UnixSocketTests(unittest.TestCase):
+
+    def test_unix_socket(self):
+        extractor = SlowExtractor()
+        extractor.release.set()
+        svc = service.Service(extractor, workers=2)
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "forestplots.sock")
+            # left behind by a service that died
+            open(path, "w").close()
+            server = service.UnixHTTPServer(svc, path)
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                connection = UnixHTTPConnection(path)
+                connection.request("POST", "/extract", body=b"image")
+                response = connection.getresponse()
+                self.assertEqual(response.status, 200)
+                self.assertEqual(json.loads(response.read())["size"], 5)
+                connection.close()
+            finally:
+                server.shutdown()
+                server.server_close()
+                svc.shutdown()
+
+
+class ExtractServiceTests(unittest.TestCase):
+    """Runs the service with the real extractor, using a stand in for tesseract."""
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.log_path = use_fake_tesseract(self, self.tempdir.name, FAKE_STDIN_TESSERACT)
+
+        self.service = service.Service(workers=2)
+        self.server = service.HTTPServer(self.service, ("127.0.0.1", 0))
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.service.shutdown()
+        self.tempdir.cleanup()
+
+    def request(self, body):
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.server_address[1], timeout=60)
+        connection.request("POST", "/extract", body=body)
+        response = connection.getresponse()
+        result = response.status, json.loads(response.read())
+        connection.close()
+        return result
+
+    def ocr_calls(self):
+        try:
+            with open(self.log_path) as log_file:
+                return len(log_file.read().split())
+        except FileNotFoundError:
+            return 0
+
+    def test_warm_up_runs_ocr(self):
+        self.service.warm_up()
+        self.assertGreater(self.ocr_calls(), 0)
+
+    def test_extract(self):
+        _, png = cv2.imencode(".png", draw_spss_like_plot())
+        status, result = self.request(png.tobytes())
+        self.assertEqual(status, 200)
+        # the stand in's text isn't a footer, so the plot is read but rejected
+        self.assertEqual(result, {"plot_type": "spss", "valid": False})
+        self.assertGreater(self.ocr_calls(), 0)
+
+        status, result = self.request(b"not an image")
+        self.assertEqual(status, 400)
+        self.assertEqual(result["error"], "Can't decode image")
@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from forestplots import skeleton
+from forestplots.skeleton import Skeleton, line_parameters
+
+
+def draw_large_spss_like_plot(path):
+    image = np.full((1500, 3000), 255, np.uint8)
+    for row in range(300, 1200, 60):
+        cv2.putText(image, "Study et al 2010  12  34  1.23 [0.45, 6.78]", (40, row), cv2.FONT_HERSHEY_SIMPLEX, 1.5, 0,
+                    3)
+    cv2.line(image, (1950, 150), (1950, 1350), 0, 4)
+    cv2.line(image, (0, 180), (2999, 180), 0, 4)
+    cv2.line(image, (1200, 1320), (2700, 1320), 0, 4)
+    cv2.imwrite(path, image)
+
+
+class SkeletonTests(unittest.TestCase):
+
+    def test_line_parameters(self):
+        self.assertEqual(line_parameters(800, 400), (150, 30, 20))
+        self.assertEqual(line_parameters(250, 100), (75, 15, 10))
+        self.assertEqual(line_parameters(4000, 3000), (300, 60, 40))
+
+    def test_pyramid_matches_full_resolution(self):
+        with tempfile.TemporaryDirectory() as image_directory:
+            draw_large_spss_like_plot(os.path.join(image_directory, "raw.png"))
+
+            pyramid = Skeleton(image_directory)
+            original_size = skeleton.PYRAMID_SIZE
+            skeleton.PYRAMID_SIZE = 10000
+            try:
+                full = Skeleton(image_directory)
+            finally:
+                skeleton.PYRAMID_SIZE = original_size
+
+        self.assertTrue(full.likely_spss())
+        self.assertTrue(pyramid.likely_spss())
+        self.assertEqual((pyramid.width, pyramid.height), (3000, 1500))
+        self.assertEqual(pyramid.vertical_lines[0], full.vertical_lines[0])
+        self.assertEqual(pyramid.horizontal_lines, full.horizontal_lines)
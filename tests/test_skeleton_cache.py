@@ -0,0 +1,116 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from forestplots.skeleton import Skeleton, png_size
+from forestplots.skeletoncache import SkeletonCache
+
+from tests.support import draw_spss_axes
+
+
+class SkeletonCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.image_directory = os.path.join(self.tempdir.name, "image.1.1.0_0_800_400")
+        os.mkdir(self.image_directory)
+        draw_spss_axes(os.path.join(self.image_directory, "raw.png"))
+        self.cache_path = os.path.join(self.tempdir.name, "skeletons.json")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_round_trip(self):
+        cache = SkeletonCache(self.cache_path)
+        original = Skeleton(self.image_directory, cache)
+        cache.save()
+        self.assertTrue(original.likely_spss())
+
+        os.remove(os.path.join(self.image_directory, "lines.png"))
+
+        cached = Skeleton(self.image_directory, SkeletonCache(self.cache_path))
+        self.assertEqual(cached.width, original.width)
+        self.assertEqual(cached.height, original.height)
+        self.assertEqual(cached.vertical_lines, original.vertical_lines)
+        self.assertEqual(cached.horizontal_lines, original.horizontal_lines)
+        self.assertTrue(cached.likely_spss())
+        self.assertFalse(cached.likely_stata())
+
+        # we didn't run the line detection again, so no new lines image
+        self.assertFalse(os.path.isfile(os.path.join(self.image_directory, "lines.png")))
+
+    def test_verdicts_come_from_cache(self):
+        cache = SkeletonCache(self.cache_path)
+        key = cache.key(os.path.join(self.image_directory, "raw.png"))
+        cache.entries[key] = [800, 400, [], [], False, True]
+
+        skeleton = Skeleton(self.image_directory, cache)
+        self.assertEqual(skeleton.vertical_lines, [])
+        self.assertFalse(skeleton.likely_spss())
+        self.assertTrue(skeleton.likely_stata())
+
+    def test_save_merges_concurrent_writers(self):
+        first = SkeletonCache(self.cache_path)
+        second = SkeletonCache(self.cache_path)
+        first.entries["a"] = [1, 1, [], [], False, False]
+        first.dirty = True
+        second.entries["b"] = [2, 2, [], [], True, False]
+        second.dirty = True
+        first.save()
+        second.save()
+
+        self.assertEqual(set(SkeletonCache(self.cache_path).entries), {"a", "b"})
+
+    def test_concurrent_saves(self):
+        # workers saving at the same time mustn't lose each other's entries
+        def work(worker):
+            cache = SkeletonCache(self.cache_path)
+            for index in range(20):
+                cache.entries[f"{worker}/{index}"] = [1, 1, [], [], False, False]
+                cache.dirty = True
+                cache.save()
+
+        threads = [threading.Thread(target=work, args=(x,)) for x in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(SkeletonCache(self.cache_path).entries), 8 * 20)
+
+    def test_reduction_has_its_own_entry(self):
+        cache = SkeletonCache(self.cache_path)
+        Skeleton(self.image_directory, cache)
+        Skeleton(self.image_directory, cache, reduction=2)
+        raw_path = os.path.join(self.image_directory, "raw.png")
+        self.assertNotEqual(cache.key(raw_path), cache.key(raw_path, 2))
+        self.assertEqual(len(cache.entries), 2)
+
+
+class ReducedSkeletonTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.image_directory = os.path.join(self.tempdir.name, "image.1.1.0_0_800_400")
+        os.mkdir(self.image_directory)
+        draw_spss_axes(os.path.join(self.image_directory, "raw.png"))
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_png_size(self):
+        self.assertEqual(png_size(os.path.join(self.image_directory, "raw.png")), (800, 400))
+
+    def test_reduced_lines_match_full_size(self):
+        full = Skeleton(self.image_directory)
+        for reduction in (2, 4):
+            with self.subTest(reduction=reduction):
+                reduced = Skeleton(self.image_directory, reduction=reduction)
+                self.assertEqual((reduced.width, reduced.height), (800, 400))
+                self.assertTrue(reduced.likely_spss())
+                self.assertEqual(len(reduced.vertical_lines), len(full.vertical_lines))
+                self.assertEqual(len(reduced.horizontal_lines), len(full.horizontal_lines))
+                for reduced_line, full_line in zip(reduced.vertical_lines + reduced.horizontal_lines,
+                                                   full.vertical_lines + full.horizontal_lines):
+                    for reduced_value, full_value in zip(reduced_line, full_line):
+                        self.assertLessEqual(abs(reduced_value - full_value), reduction * 2)
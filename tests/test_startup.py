@@ -0,0 +1,68 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import forestplots
+from forestplots import progress
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SCRIPT = os.path.join(ROOT, "forestplots.py")
+
+HEAVY_MODULES = ("cv2", "numpy", "openpyxl")
+
+
+def heavy_modules_loaded(code):
+    """Run some code in a new Python and get which of the heavy modules it loaded."""
+    check = f"{code}\nimport sys\nprint(','.join(x for x in {HEAVY_MODULES!r} if x in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", check], cwd=ROOT, capture_output=True, text=True, check=True)
+    return [x for x in result.stdout.strip().split(",") if x]
+
+
+class StartupTests(unittest.TestCase):
+
+    def test_import_is_light(self):
+        self.assertEqual(heavy_modules_loaded("import forestplots"), [])
+        self.assertEqual(heavy_modules_loaded("import forestplots.controller"), [])
+
+    def test_lazy_exports(self):
+        self.assertEqual(heavy_modules_loaded("from forestplots import Controller, SPSSForestPlot"), [])
+        self.assertIn("cv2", heavy_modules_loaded("from forestplots import extract"))
+        self.assertIs(forestplots.Controller, sys.modules["forestplots.controller"].Controller)
+        self.assertIn("Results", dir(forestplots))
+        with self.assertRaises(AttributeError):
+            forestplots.NoSuchThing # pylint: disable=pointless-statement
+
+    def run_script(self, *args):
+        return subprocess.run([sys.executable, SCRIPT] + list(args), cwd=ROOT, capture_output=True, text=True)
+
+    def test_status(self):
+        with tempfile.TemporaryDirectory() as project:
+            result = self.run_script("status", project)
+            self.assertEqual(result.returncode, 0)
+            self.assertIn("No run", result.stdout)
+
+            counter = progress.Progress("process", 10, papers=2, status_path=os.path.join(project, "status.json"))
+            counter.advance(plots=1)
+            counter.finish()
+            worker_status = os.path.join(project, "queue", "status")
+            os.makedirs(worker_status)
+            with open(os.path.join(worker_status, "host-1.json"), "w") as status_file:
+                json.dump(dict(counter.status(), stage="work", finished=False), status_file)
+
+            lines = self.run_script("status", project).stdout.splitlines()
+            self.assertEqual(len(lines), 2)
+            self.assertTrue(lines[0].startswith("run: process, 0/2 papers, 1/10 images, 1 plots"))
+            self.assertTrue(lines[0].endswith(", finished"))
+            self.assertTrue(lines[1].startswith("host-1: work, "))
+
+    def test_usage(self):
+        self.assertNotEqual(self.run_script().returncode, 0)
+        self.assertIn("COMMAND", self.run_script("--help").stdout)
+        with tempfile.TemporaryDirectory() as project:
+            for args in (["stages", project, "ocr,nonsense"], ["--stage", "nonsense", project]):
+                result = self.run_script(*args)
+                self.assertEqual(result.returncode, 2)
+                self.assertIn("unknown stage nonsense", result.stderr)
@@ -0,0 +1,85 @@
+import random
+import re
+import time
+import unittest
+
+from forestplots import tableparser
+
+# The regular expressions the parser replaced, kept here to check it gives the same answers
+OLD_VALUE_SPLIT_RE = re.compile(r'([-—~]{0,1}\d+[.,: ]\d*\s*[/\[\({][-—~]{0,1}\d+[.,: ]\d*\s*[.,]\s*[-—~]{0,1}\d+[.,: ]\d*[\]}\)]|\(Excluded\))')
+OLD_VALUE_GROK_RE = re.compile(r'([-—~]{0,1}\d+[.,: ]\d*)\s*[/\[\({]([-—~]{0,1}\d+[.,: ]\d*)\s*[.,]\s*([-—~]{0,1}\d+[.,: ]\d*)[\]}\)]')
+OLD_LINE_PARSE_RE = re.compile(r'^(.*?)\s+(\d+)\s+(\d+)\s+.*\s+([-—~]{0,1}\d+[.,:]\d*)\s*[/\[\({]([-—~]{0,1}\d+[.,:]\d*)\s*,\s*([-—~]{0,1}\d+[.,:]\d*)[\]}\)]\s*$')
+
+CHARACTERS = list("0123456789" * 3 + "  .,:-—~()[]{}/aC%\t\n") + ["(Excluded)"]
+FRAGMENTS = ["1.5", "-2,3", "0 34", " ", "  ", "[", "(", "]", ")", ",", ", ", "12", "3", "Study", "(Excluded)",
+             "—1:2", "\t", "4.", "/"]
+
+
+def old_find_table_values(text, excluded=True):
+    found = []
+    for match in (OLD_VALUE_SPLIT_RE if excluded else OLD_VALUE_GROK_RE).finditer(text):
+        if match.group(0) == "(Excluded)":
+            found.append((match.start(), match.end(), None))
+        else:
+            found.append((match.start(), match.end(), OLD_VALUE_GROK_RE.match(match.group(0)).groups()))
+    return found
+
+
+def old_parse_table_line(line):
+    match = OLD_LINE_PARSE_RE.match(line)
+    if not match:
+        return None
+    return (match.group(1),) + match.groups()[-3:]
+
+
+def random_texts(count, seed=0):
+    generator = random.Random(seed)
+    for i in range(count):
+        if i % 2:
+            yield "".join(generator.choice(CHARACTERS) for _ in range(generator.randint(0, 30)))
+        else:
+            yield "".join(generator.choice(FRAGMENTS) for _ in range(generator.randint(0, 14)))
+
+
+class TableParserTests(unittest.TestCase):
+
+    def test_find_table_values(self):
+        text = "9 5.5% -1.00[-6.17, 4.17] 2006\n(Excluded)\n328 100.0% 0 33 (—0.88. 1:54}"
+        self.assertEqual([x[2] for x in tableparser.find_table_values(text)], [
+            ("-1.00", "-6.17", "4.17"),
+            None,
+            ("0 33", "—0.88", "1:54"),
+        ])
+        self.assertEqual(len(list(tableparser.find_table_values(text, excluded=False))), 2)
+
+    def test_parse_table_line(self):
+        self.assertEqual(tableparser.parse_table_line("Chua D (2010) 15 47 9 48 8.9% 1.70 (0.83, 3.50)"),
+                         ("Chua D (2010)", "1.70", "0.83", "3.50"))
+        self.assertIsNone(tableparser.parse_table_line("Total events 24 11"))
+
+    def test_matches_old_regular_expressions(self):
+        for text in random_texts(20000):
+            self.assertEqual(list(tableparser.find_table_values(text)), old_find_table_values(text), repr(text))
+            self.assertEqual(list(tableparser.find_table_values(text, excluded=False)),
+                             old_find_table_values(text, excluded=False), repr(text))
+            line = text.replace("\n", " ")
+            self.assertEqual(tableparser.parse_table_line(line), old_parse_table_line(line), repr(line))
+
+    def test_long_lines_are_ignored(self):
+        line = "Study 1 2 " + "1 " * tableparser.MAX_LINE_LENGTH + "1.0 [0.5, 2.0]"
+        self.assertIsNone(tableparser.parse_table_line(line))
+        self.assertEqual(list(tableparser.find_table_values(line + "\n1.0 [0.5, 2.0]")),
+                         [(len(line) + 1, len(line) + 15, ("1.0", "0.5", "2.0"))])
+
+    def test_pathological_line_is_fast(self):
+        # The old line regular expression is quadratic in the length of this, taking over a minute
+        line = "a " + "1 " * 100000 + "1.0 [0.5, 2.0] x"
+        original_length = tableparser.MAX_LINE_LENGTH
+        tableparser.MAX_LINE_LENGTH = len(line)
+        try:
+            start = time.perf_counter()
+            self.assertIsNone(tableparser.parse_table_line(line))
+            self.assertEqual(len(list(tableparser.find_table_values(line))), 1)
+            self.assertLess(time.perf_counter() - start, 5.0)
+        finally:
+            tableparser.MAX_LINE_LENGTH = original_length
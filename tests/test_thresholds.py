@@ -0,0 +1,209 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from forestplots import Controller, ForestPlot, InvalidForestPlot, SPSSForestPlot, StataForestPlot
+from forestplots import plots
+from forestplots import thresholds
+
+from tests.support import (fill_every_threshold, make_gradient_image_directory, make_spss_image_directory,
+                           ocred_thresholds, use_fake_tesseract)
+
+
+def trained_profile(path, wins, plot_type="spss", region="footer.summary", top=0, explore_every=0):
+    """Make a profile that has seen enough plots of a region, each won by the given thresholds."""
+    profile = thresholds.ThresholdProfile(path, top=top, min_plots=2, explore_every=explore_every)
+    for _ in range(2):
+        profile.record(plot_type, region, wins)
+    return profile
+
+
+class ThresholdProfileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, thresholds.PROFILE_FILENAME)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_untrained(self):
+        profile = thresholds.ThresholdProfile(self.path, min_plots=2)
+        profile.record("spss", "footer.summary", [70])
+        self.assertFalse(profile.trained("spss", "footer.summary"))
+        self.assertEqual(profile.order("spss", "footer.summary", plots.THRESHOLDS), list(plots.THRESHOLDS))
+
+    def test_order(self):
+        profile = trained_profile(self.path, [70, 56])
+        profile.record("spss", "footer.summary", [56])
+        order = profile.order("spss", "footer.summary", plots.THRESHOLDS)
+        self.assertEqual(order[:3], [56, 70, 50])
+        self.assertEqual(sorted(order), list(plots.THRESHOLDS))
+        # other regions and plot types are left alone
+        self.assertEqual(profile.order("stata", "footer.summary", plots.THRESHOLDS), list(plots.THRESHOLDS))
+
+    def test_top(self):
+        profile = trained_profile(self.path, [70, 56], top=3)
+        self.assertEqual(profile.order("spss", "footer.summary", plots.THRESHOLDS), [56, 70, 50])
+
+    def test_shared(self):
+        profile = thresholds.ThresholdProfile(self.path, top=2, min_plots=1)
+        profile.record("stata", "titles", [50, 52])
+        profile.record("stata", "values", [70, 72])
+        profile.record("stata", "values", [52])
+        # ranked apart, the two regions would be read at thresholds that have nothing in common
+        self.assertEqual(profile.order("stata", "titles", plots.THRESHOLDS), [50, 52])
+        self.assertEqual(profile.order("stata", "values", plots.THRESHOLDS), [52, 70])
+        self.assertEqual(profile.order("stata", ("titles", "values"), plots.THRESHOLDS), [52, 50])
+        self.assertFalse(profile.trained("stata", ("titles", "header")))
+
+        plot = StataForestPlot(self.tempdir.name, None)
+        plot.threshold_profile = profile
+        self.assertEqual(plot.sweep_thresholds("titles"), plot.sweep_thresholds("values"))
+
+    def test_explore(self):
+        profile = trained_profile(self.path, [70], top=1, explore_every=3)
+        self.assertEqual([profile.explore("spss") for _ in range(6)], [False, False, True, False, False, True])
+        self.assertEqual(profile.order("spss", "footer.summary", plots.THRESHOLDS, prune=False)[:2], [70, 50])
+        self.assertFalse(thresholds.ThresholdProfile(self.path, explore_every=0).explore("spss"))
+
+    def test_save_merges(self):
+        first = thresholds.ThresholdProfile(self.path)
+        second = thresholds.ThresholdProfile(self.path)
+        first.record("spss", "header.graphheads", [60])
+        first.save()
+        second.record("spss", "header.graphheads", [60, 62])
+        second.save()
+        # saving again with nothing new recorded doesn't count anything twice
+        first.save()
+
+        profile = thresholds.ThresholdProfile(self.path)
+        self.assertEqual(profile.plots("spss", "header.graphheads"), 2)
+        self.assertEqual(profile.regions["spss/header.graphheads"]["wins"], {"60": 2, "62": 1})
+        self.assertEqual(second.plots("spss", "header.graphheads"), 2)
+
+    def test_concurrent_saves(self):
+        # workers saving at the same time mustn't lose each other's counts
+        def work():
+            profile = thresholds.ThresholdProfile(self.path)
+            for _ in range(20):
+                profile.record("spss", "footer.summary", [60])
+                profile.save()
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        profile = thresholds.ThresholdProfile(self.path)
+        self.assertEqual(profile.plots("spss", "footer.summary"), 8 * 20)
+        self.assertEqual(os.listdir(self.tempdir.name), [thresholds.PROFILE_FILENAME])
+
+    def test_reset(self):
+        profile = trained_profile(self.path, [70])
+        profile.save()
+        profile.reset()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(thresholds.ThresholdProfile(self.path).regions, {})
+
+    def test_old_version_ignored(self):
+        with open(self.path, "w") as profile_file:
+            json.dump({"version": 0, "regions": {"spss/footer.summary": {"plots": 100, "wins": {"70": 100}}}},
+                      profile_file)
+        self.assertEqual(thresholds.ThresholdProfile(self.path).plots("spss", "footer.summary"), 0)
+
+
+class WinningThresholdTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.ctree = os.path.join(self.tempdir.name, "pmc1")
+        self.image_directory = make_spss_image_directory(self.ctree)
+        fill_every_threshold(self.image_directory)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_winners(self):
+        plot = SPSSForestPlot(self.image_directory, None, replay=True)
+        plot.process()
+        # replays go on to find every threshold the header and scale read at
+        self.assertEqual(plot.winning_thresholds["header.graphheads"], list(plots.THRESHOLDS))
+        self.assertEqual(plot.winning_thresholds["footer.summary"], list(plots.THRESHOLDS))
+        self.assertEqual(plot.winning_thresholds["footer.scale"], list(plots.THRESHOLDS))
+        # every reading agrees, and the table's vote is settled after the first few
+        self.assertEqual(plot.winning_thresholds["body.table"], list(plots.THRESHOLDS)[:plot.primary_table.passes])
+
+        restored = ForestPlot.load(self.image_directory, json.loads(json.dumps(plot.dump())))
+        self.assertEqual(restored.winning_thresholds, plot.winning_thresholds)
+
+    def profile_plot(self, explore_every=0):
+        # all the OCR text is already there, so nothing is run even though this isn't a replay
+        plot = SPSSForestPlot(self.image_directory, None)
+        path = os.path.join(self.tempdir.name, thresholds.PROFILE_FILENAME)
+        plot.threshold_profile = trained_profile(path, [70], region="header.graphheads", explore_every=explore_every)
+        plot.process()
+        return plot
+
+    def test_profile_order(self):
+        plot = self.profile_plot()
+        self.assertEqual(plot.summary["Esimator type"], "M-H")
+        self.assertEqual(plot.winning_thresholds["header.graphheads"], [70])
+        # the profile hasn't learnt the scale yet, so every threshold is tried
+        self.assertEqual(plot.winning_thresholds["footer.scale"], list(plots.THRESHOLDS))
+
+    def test_explored(self):
+        plot = self.profile_plot(explore_every=1)
+        self.assertTrue(plot.exploring)
+        self.assertEqual(plot.winning_thresholds["header.graphheads"], list(plots.THRESHOLDS))
+
+    def test_closest_readings(self):
+        collapsed = [("a", 1, 2), ("b", 3, 4)]
+        readings = {50: [("a", 1, 2), ("b", 3, 5)], 52: [("a", 1, 2), ("b", 3, 4)], 54: [("a", 1, 2)],
+                    56: [("x", 1, 2), ("y", 3, 4)]}
+        self.assertEqual(ForestPlot._closest_readings(readings, collapsed), [52])
+        self.assertEqual(ForestPlot._closest_readings(readings, collapsed, slice(0, 1)), [50, 52])
+        self.assertEqual(ForestPlot._closest_readings(readings, collapsed, slice(1, None)), [52, 56])
+        self.assertEqual(ForestPlot._closest_readings({}, collapsed), [])
+
+    def test_retrain(self):
+        controller = Controller(self.tempdir.name)
+        controller.threshold_profile.record("spss", "footer.summary", [78])
+        controller.threshold_profile.save()
+
+        controller.train_thresholds(processes=1)
+        profile = thresholds.ThresholdProfile(thresholds.profile_path(self.tempdir.name))
+        self.assertEqual(sorted(profile.regions), sorted(f"spss/{x}" for x in SPSSForestPlot.REGIONS))
+        self.assertEqual(profile.regions["spss/header.graphheads"],
+                         {"plots": 1, "wins": {str(x): 1 for x in plots.THRESHOLDS}})
+        self.assertEqual(profile.plots("spss", "footer.summary"), 1)
+
+
+class PrunedSweepTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.image_directory = make_gradient_image_directory(self.tempdir.name)
+        use_fake_tesseract(self, self.tempdir.name)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_pruned(self):
+        plot = SPSSForestPlot(self.image_directory, None)
+        plot.use_probe = False
+        plot.threshold_profile = trained_profile(os.path.join(self.tempdir.name, "profile.json"), [70, 72, 56],
+                                                 top=3)
+        with self.assertRaises(InvalidForestPlot):
+            plot.process()
+        self.assertEqual(ocred_thresholds(self.image_directory), [56, 70, 72])
+
+    def test_probe_uses_profile(self):
+        plot = SPSSForestPlot(self.image_directory, None)
+        plot.threshold_profile = trained_profile(os.path.join(self.tempdir.name, "profile.json"), [70, 72])
+        # the fake text doesn't look anything like a footer, so the probe rejects it
+        with self.assertRaises(InvalidForestPlot):
+            plot.process()
+        self.assertEqual(ocred_thresholds(self.image_directory), [70, 72])
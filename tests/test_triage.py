@@ -0,0 +1,111 @@
+import csv
+import json
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from forestplots import Controller
+from forestplots import replay
+from forestplots import triage
+from forestplots.plots import THRESHOLDS
+from forestplots.controller import QUEUE_DIRECTORY
+from forestplots.skeletoncache import SkeletonCache, CACHE_FILENAME
+from forestplots.workqueue import WorkQueue
+
+from tests.support import draw_spss_axes
+
+
+class TriageTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.project_directory = self.tempdir.name
+
+        self.plot_directory = self.make_image_directory("pmc1000001", "image.1.1.0_0_800_400")
+        draw_spss_axes(os.path.join(self.plot_directory, "raw.png"))
+        self.blank_directory = self.make_image_directory("pmc1000002", "image.2.1.0_0_800_400")
+        cv2.imwrite(os.path.join(self.blank_directory, "raw.png"), np.full((400, 800, 3), 255, np.uint8))
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def make_image_directory(self, ctree, name):
+        image_directory = os.path.join(self.project_directory, ctree, "pdfimages", name)
+        os.makedirs(image_directory)
+        return image_directory
+
+    def triage_project(self):
+        cache = SkeletonCache(os.path.join(self.project_directory, CACHE_FILENAME))
+        work = [(os.path.join(self.project_directory, "pmc1000001"), self.plot_directory),
+                (os.path.join(self.project_directory, "pmc1000002"), self.blank_directory)]
+        skeletons = triage.classify([imagedir for _, imagedir in work], cache, processes=2)
+        cache.save()
+        classified = [(ctree, imagedir, triage.plot_type(skeleton))
+                      for (ctree, imagedir), skeleton in zip(work, skeletons)]
+        report = triage.summarise(self.project_directory, classified)
+        triage.save(self.project_directory, report)
+        return report
+
+    def test_report(self):
+        report = self.triage_project()
+        self.assertEqual(report["summary"], {"papers": 2, "papers_with_candidates": 1, "images": 2, "spss": 1,
+                                             "stata": 0})
+        self.assertEqual(report["papers"]["pmc1000001"], {"pmc1000001/pdfimages/image.1.1.0_0_800_400": "spss"})
+
+        with open(os.path.join(self.project_directory, triage.TRIAGE_CSV_FILENAME)) as csv_file:
+            rows = list(csv.reader(csv_file))
+        self.assertEqual(rows, [["paper", "image", "type"], ["pmc1000001", "image.1.1.0_0_800_400", "spss"]])
+
+        with open(os.path.join(self.project_directory, triage.TRIAGE_FILENAME)) as triage_file:
+            self.assertEqual(json.load(triage_file), report)
+
+        # the line detection is cached for the full run
+        cache = SkeletonCache(os.path.join(self.project_directory, CACHE_FILENAME))
+        self.assertIsNotNone(cache.get(cache.key(os.path.join(self.plot_directory, "raw.png"))))
+
+    def test_load(self):
+        self.assertIsNone(triage.load(self.project_directory))
+        self.triage_project()
+        self.assertEqual(triage.load(self.project_directory), {
+            os.path.abspath(self.plot_directory): "spss",
+            os.path.abspath(self.blank_directory): None,
+        })
+
+    def test_main_uses_triage(self):
+        self.triage_project()
+        os.remove(os.path.join(self.plot_directory, "lines.png"))
+        # the full run mustn't look at this again, so it doesn't matter that it's gone
+        os.remove(os.path.join(self.blank_directory, "raw.png"))
+        # OCR text from an earlier run, which doesn't make a valid plot
+        for threshold in THRESHOLDS:
+            with open(os.path.join(self.plot_directory, f"footer.summary.{threshold}.txt"), "w") as ocr_file:
+                ocr_file.write("nothing useful here")
+
+        Controller(self.project_directory).main()
+
+        # the candidate was processed, though it isn't valid, and its lines came from the cache rather than being
+        # detected again
+        self.assertEqual(replay.load_decoded(self.plot_directory), (True, None))
+        self.assertFalse(os.path.isfile(os.path.join(self.plot_directory, "lines.png")))
+
+    def test_distributed_run(self):
+        self.triage_project()
+        for threshold in THRESHOLDS:
+            with open(os.path.join(self.plot_directory, f"footer.summary.{threshold}.txt"), "w") as ocr_file:
+                ocr_file.write("nothing useful here")
+
+        controller = Controller(self.project_directory)
+        controller.coordinate()
+        controller.work()
+        controller.merge()
+
+        queue = WorkQueue(os.path.join(self.project_directory, QUEUE_DIRECTORY))
+        self.assertEqual(queue.results(), [
+            ({"ctree": "pmc1000001", "image_directory": "pmc1000001/pdfimages/image.1.1.0_0_800_400"},
+             {"valid": False, "slow_plot": None}),
+        ])
+        self.assertEqual(replay.load_decoded(self.plot_directory), (True, None))
+        self.assertTrue(os.path.isfile(os.path.join(self.project_directory, "results.xlsx")))
@@ -0,0 +1,131 @@
+import os
+import tempfile
+import unittest
+
+import openpyxl
+
+from forestplots import StataForestPlot
+from forestplots.helpers import weighted_vote
+from forestplots.plots import Table
+
+
+class WeightedVoteTests(unittest.TestCase):
+
+    def test_weights(self):
+        vote = weighted_vote([(1.5, 0.2), (1.6, 0.9), (1.5, 0.3)])
+        self.assertEqual(vote.winner, 1.6)
+        self.assertAlmostEqual(vote.agreement, 0.9 / 1.4)
+        self.assertAlmostEqual(vote.margin, 0.4)
+
+    def test_ties_go_to_first_seen(self):
+        self.assertEqual(weighted_vote([("b", 1.0), ("a", 1.0)]).winner, "b")
+        self.assertEqual(weighted_vote([("a", 1.0), ("b", 1.0)]).winner, "a")
+        self.assertEqual(weighted_vote([(("x", 1), 1.0), (("y", 2), 1.0)]).winner, ("x", 1))
+
+    def test_no_votes(self):
+        with self.assertRaises(ValueError):
+            weighted_vote([])
+
+
+class TableVotingTests(unittest.TestCase):
+
+    def test_confident_reading_wins(self):
+        table = Table()
+        table.add_data([("Ahmed", 1.0, 0.5, 1.5)], [0.3])
+        table.add_data([("Ahmed", 1.0, 0.5, 1.5)], [0.3])
+        table.add_data([("Ahmad", 7.0, 0.5, 1.5)], [0.9])
+        self.assertEqual(table.collapse_data(), [("Ahmad", 7.0, 0.5, 1.5)])
+        self.assertEqual([round(x, 2) for x in table.agreement()[0]], [0.6, 0.6, 1.0, 1.0])
+
+    def test_unweighted_is_mode(self):
+        table = Table()
+        for effect in (1.0, 2.0, 2.0):
+            table.add_data([("Ahmed", effect, 0.5, 3.5)])
+        self.assertEqual(table.collapse_data(), [("Ahmed", 2.0, 0.5, 3.5)])
+
+    def test_settled(self):
+        table = Table()
+        self.assertFalse(table.settled(1.5))
+        table.add_data([("Ahmed", 1.0, 0.5, 1.5)], [0.9])
+        self.assertFalse(table.settled(1.5))
+        table.add_data([("Ahmed", 1.0, 0.5, 1.5)], [0.5])
+        self.assertFalse(table.settled(1.5))
+        table.add_data([("Ahmed", 1.0, 0.5, 1.5)], [0.9])
+        self.assertTrue(table.settled(1.5))
+
+    def test_title_voting(self):
+        table = Table()
+        table.add_title("Subgroup A", 0.4)
+        table.add_title("Subgroup 4", 0.3)
+        table.add_title("Subgroup 4", 0.3)
+        table.add_title("Subgroup A", 0.9)
+        self.assertEqual(table.collapse_titles(), "Subgroup A")
+
+    def test_round_trip(self):
+        table = Table()
+        table.add_data([("Ahmed", 1.0, 0.5, 1.5)], [0.8])
+        table.add_title("Overall", 0.7)
+        table.passes = 3
+        loaded = Table.load(table.dump())
+        self.assertEqual(loaded.confidences, [[0.8]])
+        self.assertEqual(loaded.title_confidences, [0.7])
+        self.assertEqual(loaded.passes, 3)
+
+    def test_load_without_confidences(self):
+        table = Table.load({"table_data": [[["Ahmed", 1.0, 0.5, 1.5]]], "title_list": ["Overall"], "metadata": {}})
+        self.assertEqual(table.confidences, [[1.0]])
+        self.assertEqual(table.title_confidences, [1.0])
+        self.assertEqual(table.passes, 0)
+
+
+class StataVotingTests(unittest.TestCase):
+
+    def test_confidence_weights_titles(self):
+        with tempfile.TemporaryDirectory() as image_directory:
+            for region in ("values", "titles"):
+                open(os.path.join(image_directory, f"raw.{region}.png"), "wb").close()
+
+            # most readings get the title wrong, but are much less confident of it
+            readings = {
+                50: ("Study B", 40),
+                52: ("Study B", 40),
+                54: ("Study A", 95),
+            }
+            for threshold, (title, confidence) in readings.items():
+                with open(os.path.join(image_directory, f"values.{threshold}.txt"), "w") as ocr_file:
+                    ocr_file.write("1.50 [0.50, 2.50] 100.00\n1.50 [0.50, 2.50] 100.00\n")
+                with open(os.path.join(image_directory, f"titles.{threshold}.txt"), "w") as ocr_file:
+                    ocr_file.write(f"{title}\nOverall (I-squared = 0.0%, p = 0.50)\n")
+                with open(os.path.join(image_directory, f"titles.{threshold}.tsv"), "w") as tsv_file:
+                    tsv_file.write("level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight"
+                                   f"\tconf\ttext\n5\t1\t1\t1\t1\t1\t10\t10\t50\t16\t{confidence}\t{title}\n")
+
+            plot = StataForestPlot(image_directory, None, replay=True)
+            plot._process_body()
+
+            self.assertEqual(plot.primary_table.collapse_data()[0][0], "Study A")
+            self.assertEqual(plot.primary_table.passes, 3)
+
+            worksheet = openpyxl.Workbook().active
+            plot._write_data_to_worksheet(worksheet)
+            labels = [worksheet.cell(row=row, column=1).value for row in range(1, 20)]
+            self.assertIn("Agreement:", labels)
+            self.assertIn("Threshold passes:", labels)
+
+    def test_passes_count_thresholds_read(self):
+        with tempfile.TemporaryDirectory() as image_directory:
+            for region in ("values", "titles"):
+                open(os.path.join(image_directory, f"raw.{region}.png"), "wb").close()
+            for threshold, values in ((50, "1.50 [0.50, 2.50] 100.00\n"), (52, "1.50 [0.50, 2.50] 100.00\n"), (54, "")):
+                with open(os.path.join(image_directory, f"values.{threshold}.txt"), "w") as ocr_file:
+                    ocr_file.write(values * 2)
+            # neither region decodes at the last threshold, and the titles only decode at the first, but every
+            # threshold was read, which is what passes count, as for SPSS
+            for threshold, overall in ((50, "Overall (I-squared = 0.0%, p = 0.50)"), (52, "Overal"), (54, "")):
+                with open(os.path.join(image_directory, f"titles.{threshold}.txt"), "w") as ocr_file:
+                    ocr_file.write(f"Study A\n{overall}\n")
+
+            plot = StataForestPlot(image_directory, None, replay=True)
+            plot._process_body()
+            self.assertEqual(plot.primary_table.collapse_data()[0][0], "Study A")
+            self.assertEqual(plot.primary_table.passes, 3)
@@ -0,0 +1,102 @@
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+
+from forestplots.workqueue import LeaseLost, WorkQueue, run_worker, PENDING, LEASED, DONE, FAILED
+
+LEASE_TIME = 1.0
+
+
+def record_item(item):
+    with open(os.path.join(item["output"], f"{item['number']}.{os.getpid()}"), "w"):
+        pass
+    if item["number"] == 13:
+        raise ValueError("unlucky")
+    time.sleep(0.01)
+    return {"pid": os.getpid()}
+
+
+def worker_process(queue_path):
+    run_worker(WorkQueue(queue_path, lease_time=LEASE_TIME), record_item, poll_interval=0.1)
+
+
+class WorkQueueTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.queue_path = os.path.join(self.tempdir.name, "queue")
+        self.queue = WorkQueue(self.queue_path, lease_time=LEASE_TIME)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def expire(self, lease):
+        past = time.time() - LEASE_TIME * 2
+        os.utime(lease.path, (past, past))
+
+    def test_lease_cycle(self):
+        self.assertTrue(self.queue.enqueue("a", {"number": 1}))
+        self.assertFalse(self.queue.enqueue("a", {"number": 1}))
+
+        lease = self.queue.claim()
+        self.assertEqual(lease.item, {"number": 1})
+        self.assertIsNone(self.queue.claim())
+
+        # a live lease isn't reclaimed, an expired one is
+        self.assertEqual(self.queue.reclaim(), 0)
+        self.expire(lease)
+        self.assertEqual(self.queue.reclaim(), 1)
+        self.assertEqual(self.queue.counts(), {PENDING: 1, LEASED: 0, DONE: 0, FAILED: 0})
+
+        second_lease = self.queue.claim()
+        self.queue.complete(second_lease, {"answer": 42})
+        self.assertEqual(self.queue.counts(), {PENDING: 0, LEASED: 0, DONE: 1, FAILED: 0})
+        self.assertEqual(self.queue.results(), [({"number": 1}, {"answer": 42})])
+        self.assertFalse(self.queue.enqueue("a", {"number": 1}))
+
+    def test_expired_lease_leaves_new_lease(self):
+        self.queue.enqueue("a", {"number": 1})
+        slow_lease = self.queue.claim()
+        self.expire(slow_lease)
+        self.queue.reclaim()
+        new_lease = self.queue.claim()
+
+        # the slow worker's result is kept, but it mustn't release the lease the item was given to since
+        with self.assertRaises(LeaseLost):
+            self.queue.heartbeat(slow_lease)
+        with self.assertRaises(LeaseLost):
+            self.queue.complete(slow_lease, {"answer": 41})
+        self.assertEqual(self.queue.counts(), {PENDING: 0, LEASED: 1, DONE: 1, FAILED: 0})
+        self.queue.heartbeat(new_lease)
+
+        self.queue.complete(new_lease, {"answer": 42})
+        self.assertEqual(self.queue.counts(), {PENDING: 0, LEASED: 0, DONE: 1, FAILED: 0})
+        self.assertEqual(self.queue.results(), [({"number": 1}, {"answer": 42})])
+
+    def test_many_workers(self):
+        output = os.path.join(self.tempdir.name, "output")
+        os.mkdir(output)
+        for number in range(40):
+            self.queue.enqueue(f"item{number:02}", {"number": number, "output": output})
+
+        # a worker that claimed an item and then died
+        dead_lease = self.queue.claim()
+        self.expire(dead_lease)
+
+        workers = [multiprocessing.Process(target=worker_process, args=(self.queue_path,)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(60)
+            self.assertEqual(worker.exitcode, 0)
+
+        self.assertEqual(self.queue.counts(), {PENDING: 0, LEASED: 0, DONE: 39, FAILED: 1})
+        processed = [int(name.split(".")[0]) for name in os.listdir(output)]
+        self.assertEqual(sorted(processed), list(range(40)))
+        self.assertGreater(len({result["pid"] for _, result in self.queue.results()}), 1)
+
+        failures = self.queue.results(FAILED)
+        self.assertEqual(failures[0][0]["number"], 13)
+        self.assertIn("unlucky", failures[0][1]["error"])